@@ -1,5 +1,8 @@
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -18,7 +21,20 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 DB_FILE = os.path.join(os.path.dirname(__file__), "users.json")
 
+# Verified tokens are trusted for a short while without re-decoding (and never past their own expiry)
+TOKEN_CACHE_TTL_SECONDS = 60
+TOKEN_CACHE_MAX_ENTRIES = 1024
+
+_users_cache = None
+_users_signature = None
+_token_cache: "OrderedDict[str, tuple]" = OrderedDict() # token -> (User, expires_at)
+_cache_lock = threading.Lock()
+
 def load_users():
+    """
+    Returns the user store, re-reading users.json only when its mtime or size changed.
+    """
+    global _users_cache, _users_signature
     if not os.path.exists(DB_FILE):
         # Initial user
         initial = {
@@ -39,8 +55,17 @@ def load_users():
         }
         with open(DB_FILE, "w") as f:
             json.dump(initial, f)
+    st = os.stat(DB_FILE)
+    signature = (st.st_mtime_ns, st.st_size)
+    if _users_cache is not None and signature == _users_signature:
+        return _users_cache
     with open(DB_FILE, "r") as f:
-        return json.load(f)
+        users = json.load(f)
+    with _cache_lock:
+        _users_cache, _users_signature = users, signature
+        # Edited credentials (removed or disabled users) must not survive in verified tokens
+        _token_cache.clear()
+    return users
 
 def get_user(username: str):
     users = load_users()
@@ -61,7 +86,35 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _cached_token_user(token: str):
+    with _cache_lock:
+        entry = _token_cache.get(token)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if time.time() >= expires_at:
+            del _token_cache[token]
+            return None
+        _token_cache.move_to_end(token)
+        return user
+
+def _cache_token_user(token: str, user: UserInDB, token_exp: Optional[float]):
+    expires_at = time.time() + TOKEN_CACHE_TTL_SECONDS
+    if token_exp is not None:
+        expires_at = min(expires_at, token_exp)
+    with _cache_lock:
+        _token_cache[token] = (user, expires_at)
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > TOKEN_CACHE_MAX_ENTRIES:
+            _token_cache.popitem(last=False)
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    # Pick up edits to users.json (which also flushes the token cache) before trusting it
+    load_users()
+    cached = _cached_token_user(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -78,4 +131,5 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     user = get_user(username=token_data.username)
     if user is None:
         raise credentials_exception
+    _cache_token_user(token, user, payload.get("exp"))
     return user
@@ -0,0 +1,96 @@
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+from .payloads import EncodedPayload
+
+# Packed typed-array body for the map's marker layer, decoded by frontend/src/trackColumns.js:
+#
+#   b"MPC1" | uint32 LE header length | JSON header | column data
+#
+# The header lists every column as {name, type, offset, length[, dictionary]}. Offsets count
+# from the start of the column data; the header is space-padded so that data starts 8-byte
+# aligned and each column can be viewed as a typed array without copying. Little-endian.
+COLUMNS_MAGIC = b"MPC1"
+COLUMNS_VERSION = 1
+COLUMNS_MEDIA_TYPE = "application/vnd.mp.columns"
+ALIGNMENT = 8
+
+# Bits of the 'flags' column
+FLAG_BITS = {'is_indoor': 1, 'is_outdoor': 2, 'is_sim': 4}
+FLOAT_COLUMNS = ['Latitude', 'Longitude', 'disposable_income_pps', 'consolidated_track_length',
+                 'catchment_area_size', 'data_quality_score']
+DICTIONARY_COLUMNS = ['Country', 'NUTS_ID']
+
+def _pad(size: int) -> int:
+    return -size % ALIGNMENT
+
+def dictionary_encode(values: np.ndarray):
+    """
+    (codes, dictionary) with the narrowest unsigned code type that fits the dictionary.
+    """
+    codes, uniques = pd.factorize(values, sort=True)
+    dtype = next(t for t in (np.uint8, np.uint16, np.uint32) if len(uniques) <= np.iinfo(t).max + 1)
+    return codes.astype(dtype), [str(v) for v in uniques]
+
+def build_columns(frame: pd.DataFrame) -> list:
+    """
+    (name, array, dictionary) for each column of the marker layer, in snapshot row order.
+    """
+    flags = np.zeros(len(frame), dtype=np.uint8)
+    for key, bit in FLAG_BITS.items():
+        flags |= np.where(frame[key].to_numpy(dtype=bool), bit, 0).astype(np.uint8)
+    columns = [
+        ('track_id', frame['track_id'].fillna(-1).to_numpy().astype(np.int32), None),
+        ('flags', flags, None),
+    ]
+    for key in FLOAT_COLUMNS:
+        # float32 keeps coordinates to ~1 m, plenty for a marker
+        columns.append((key, frame[key].to_numpy(dtype=np.float32), None))
+    for key in DICTIONARY_COLUMNS:
+        codes, dictionary = dictionary_encode(frame[key].to_numpy())
+        columns.append((key, codes, dictionary))
+    return columns
+
+def build_columns_body(frame: pd.DataFrame) -> bytes:
+    directory, chunks, offset = [], [], 0
+    for name, array, dictionary in build_columns(frame):
+        entry = {'name': name, 'type': array.dtype.name, 'offset': offset, 'length': len(array)}
+        if dictionary is not None:
+            entry['dictionary'] = dictionary
+        directory.append(entry)
+        data = array.astype(array.dtype.newbyteorder('<'), copy=False).tobytes()
+        chunks.append(data + b'\0' * _pad(len(data)))
+        offset += len(chunks[-1])
+
+    header = json.dumps({'version': COLUMNS_VERSION, 'count': len(frame), 'flags': FLAG_BITS, 'columns': directory},
+                        separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    # Trailing spaces are JSON whitespace; they align the start of the column data
+    header += b' ' * _pad(len(COLUMNS_MAGIC) + 4 + len(header))
+    return b''.join([COLUMNS_MAGIC, struct.pack('<I', len(header)), header] + chunks)
+
+def build_columns_payload(frame: pd.DataFrame, br: bool = True) -> EncodedPayload:
+    """
+    /api/tracks/columns body, encoded once per snapshot.
+    """
+    return EncodedPayload(build_columns_body(frame), media_type=COLUMNS_MEDIA_TYPE, br=br)
+
+def read_columns_body(body: bytes) -> dict:
+    """
+    Inverse of build_columns_body: {name: array}, with dictionary columns decoded to strings.
+    """
+    if body[:4] != COLUMNS_MAGIC:
+        raise ValueError("Not a track columns body")
+    (header_length,) = struct.unpack_from('<I', body, 4)
+    header = json.loads(body[8:8 + header_length])
+    base = 8 + header_length
+    columns = {}
+    for entry in header['columns']:
+        array = np.frombuffer(body, dtype=np.dtype(entry['type']).newbyteorder('<'),
+                              count=entry['length'], offset=base + entry['offset'])
+        if 'dictionary' in entry:
+            array = np.asarray(entry['dictionary'], dtype=object)[array]
+        columns[entry['name']] = array
+    return columns
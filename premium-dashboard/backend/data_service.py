@@ -1,176 +1,570 @@
+import numpy as np
 import pandas as pd
+import base64
 import json
+import math
 import os
+import re
+import threading
+import time
+import typing
+from collections import deque
+from functools import cached_property
 from typing import List, Optional
 
+from .payloads import ChunkedPayload, dumps_json
+from .schemas import TrackRecord
+from .spatial import TrackSpatialIndex
+from .search_index import SearchIndex, StringTable, fold_text
+from .stats import build_stats_payloads
+from .hexgrid import build_hex_layers
+from .columnar import build_columns_payload
+from .snapshot_cache import SnapshotCache
+from .shared_snapshot import (
+    SHARED_SNAPSHOT_DIR, LazyRecords, TrackPositions, follow_changes, load_change_chain, load_or_publish, save_change,
+)
+
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # Inside Docker, data is at /app/data. In local dev, it's at ../data
 DATA_DIR = "/app/data" if os.path.exists("/app/data") else os.path.join(ROOT_DIR, "..", "data")
 CSV_PATH = os.path.join(DATA_DIR, "karting_enriched.csv")
 GEOJSON_PATH = os.path.join(DATA_DIR, "karting_shapes.geojson")
+# Legacy wishlist store, imported once into SQLite by wishlist_store
 WISHLIST_PATH = os.path.join(DATA_DIR, "wishlist.json")
 
-def get_tracks_data():
+# Mapping CSV names to what Frontend expects
+TRACK_KEY_MAP = {
+    'Review Velocity (12m)': 'Review Velocity',
+    'Owner Activity': 'Owner Responds'
+}
+BOOL_FLAG_KEYS = ['is_indoor', 'is_outdoor', 'is_sim']
+NUMERIC_QUERY_KEYS = ['disposable_income_pps', 'consolidated_track_length', 'catchment_area_size', 'data_quality_score']
+COORDINATE_KEYS = ['Latitude', 'Longitude']
+GROUP_KEYS = ['Country', 'NUTS_ID', 'NUTS_NAME']
+QUERY_COLUMNS = ['track_id', 'Name', 'City'] + COORDINATE_KEYS + BOOL_FLAG_KEYS + NUMERIC_QUERY_KEYS + GROUP_KEYS
+# Public sort keys for /api/tracks/query -> filter frame column
+QUERY_SORT_KEYS = {
+    'track_id': 'track_id',
+    'name': 'Name_rank',
+    'pps': 'disposable_income_pps',
+    'length': 'consolidated_track_length',
+    'reach': 'catchment_area_size',
+    'quality': 'data_quality_score',
+}
+
+PAYLOAD_CHUNK_ROWS = 16 # Mean rows per separately compressed piece of the /api/tracks body
+# Brotli can't reuse unchanged pieces like gzip does, so it waits until the CSV stops changing
+BROTLI_SETTLE_SECONDS = float(os.environ.get("MP_BROTLI_SETTLE_SECONDS", 30))
+
+# Strings the CSV uses for the type flags
+TRUE_STRINGS = ['true', '1', '1.0', 'yes']
+FALSE_STRINGS = ['false', '0', '0.0', 'no', 'nan', 'none']
+
+def track_field_types() -> dict:
     """
-    Safely reads the enriched CSV and robustly sanitizes for JSON.
-    Calculates Data Quality Index (DQI) if not present.
+    Served key -> Python type (bool, int, float or str), from the TrackRecord schema.
     """
-    import math
+    types = {}
+    for name, field in TrackRecord.model_fields.items():
+        annotation = field.annotation
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        types[field.alias or name] = args[0] if args else annotation
+    return types
+
+TRACK_FIELD_TYPES = track_field_types()
+
+def calculate_dq_score(row):
+    """
+    Calculates a Data Quality Index (0-100) based on field completeness.
+    """
+    essential_fields = ['Name', 'Latitude', 'Longitude', 'Country', 'Category']
+    bonus_fields = ['Review Velocity (12m)', 'Hero Image URL', 'Top Reviews Snippet']
     
-    def sanitize(v, key=None):
-        if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
-            return None
-        # Explicitly ensure boolean flags for frontend filtering
-        if key in ['is_indoor', 'is_outdoor', 'is_sim']:
-            if str(v).lower() in ['true', '1', '1.0', 'yes']: return True
-            if str(v).lower() in ['false', '0', '0.0', 'no', 'nan', 'none']: return False
-            return bool(v)
-        return v
-
-    def calculate_dq_score(row):
+    score = 0
+    max_score = len(essential_fields) * 15 + len(bonus_fields) * 8
+    
+    for field in essential_fields:
+        val = row.get(field)
+        if val and str(val).strip() and not (isinstance(val, float) and math.isnan(val)):
+            # Penalty for unrecovered names
+            if field == 'Name' and str(val).startswith('track_'):
+                score += 5
+            else:
+                score += 15
+    
+    for field in bonus_fields:
+        val = row.get(field)
+        if val and str(val).strip() and not (isinstance(val, float) and math.isnan(val)):
+            score += 8
+            
+    return min(100, round((score / max_score) * 100, 1))
+
+def json_column(values: pd.Series, kind=None) -> np.ndarray:
+    """
+    One CSV column as an object array of JSON-ready Python values, coerced to `kind`
+    as a whole column. NaN/inf and unparseable cells become None in the same pass.
+    """
+    out = np.full(len(values), None, dtype=object)
+    if kind is bool:
+        # Through numpy so NaN reads as "nan", like str(v) did per cell
+        text = pd.Series(values.to_numpy(dtype=object).astype(str)).str.lower()
+        truthy, falsy = text.isin(TRUE_STRINGS).to_numpy(), text.isin(FALSE_STRINGS).to_numpy()
+        if values.name in BOOL_FLAG_KEYS:
+            # Filter flags are never null: anything unrecognised counts by truthiness
+            out[:] = np.where(truthy, True, np.where(falsy, False, values.astype(bool).to_numpy())).tolist()
+        else:
+            out[truthy] = True
+            out[falsy & values.notna().to_numpy()] = False
+        return out
+    if kind in (int, float) or (kind is None and pd.api.types.is_numeric_dtype(values)):
+        numbers = pd.to_numeric(values, errors='coerce')
+        finite = np.isfinite(numbers.to_numpy(dtype=float))
+        if kind is int:
+            numbers = numbers.fillna(0).astype(np.int64)
+        out[finite] = numbers.to_numpy()[finite].tolist()
+        return out
+    present = values.notna().to_numpy()
+    if kind is str and pd.api.types.is_float_dtype(values):
+        # A numeric-looking text column parsed as floats: 10.0 -> "10"
+        text = values.map(lambda v: str(int(v)) if float(v).is_integer() else str(v))
+    elif kind is str:
+        text = values.astype(str)
+    else:
+        text = values
+    out[present] = text.to_numpy(dtype=object)[present]
+    return out
+
+def build_track_records(df: pd.DataFrame) -> List[dict]:
+    """
+    Turns raw CSV rows into the sanitized records served to the frontend,
+    one column at a time instead of one cell at a time.
+    """
+    df = df.rename(columns=TRACK_KEY_MAP)
+    # Consolidated Track Length: prioritize Website scraping, then OSM; -1 marks a failed scrape
+    web_len, osm_len = (
+        pd.to_numeric(df[key], errors='coerce') if key in df.columns else pd.Series(0, index=df.index)
+        for key in ('website_track_length_m', 'track_length_m')
+    )
+    df['consolidated_track_length'] = web_len.where(web_len > 0, osm_len.where(osm_len > 0, 0))
+
+    keys = list(df.columns)
+    columns = [json_column(df[key], TRACK_FIELD_TYPES.get(key)) for key in keys]
+    return [dict(zip(keys, row)) for row in zip(*columns)]
+
+def file_signature(path: str):
+    """
+    Cheap change detector for data files: (mtime_ns, size).
+    """
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def serialize_record(record: dict) -> bytes:
+    return dumps_json(record)
+
+def join_json_array(rows) -> bytes:
+    return b'[' + b','.join(rows) + b']'
+
+def build_rows_payload(row_json, row_hashes: np.ndarray, previous=None) -> ChunkedPayload:
+    """
+    The /api/tracks body as a ChunkedPayload over runs of rows. A run ends after each row whose
+    hash is 0 mod PAYLOAD_CHUNK_ROWS, so boundaries follow content rather than position and an
+    inserted or deleted row only changes the run it falls in.
+    """
+    count = len(row_json)
+    ends = np.flatnonzero(np.asarray(row_hashes) % PAYLOAD_CHUNK_ROWS == 0) + 1
+    bounds = [0] + ends[ends < count].tolist() + [count]
+    last = len(bounds) - 2
+
+    def pieces():
+        for i, (start, end) in enumerate(zip(bounds, bounds[1:])):
+            yield (b',' if i else b'[') + b','.join(row_json[start:end]) + (b']' if i == last else b'')
+
+    return ChunkedPayload(pieces, previous)
+
+def build_filter_frame(records: List[dict]) -> pd.DataFrame:
+    """
+    Columnar copy of the fields the dashboard filters and sorts on.
+    Missing metrics count as 0, matching the frontend's `null >= 0` semantics.
+    """
+    df = pd.DataFrame.from_records(records, columns=list(QUERY_COLUMNS))
+    frame = pd.DataFrame(index=df.index)
+    frame['track_id'] = pd.to_numeric(df['track_id'], errors='coerce')
+    for key in COORDINATE_KEYS:
+        frame[key] = pd.to_numeric(df[key], errors='coerce')
+    for key in BOOL_FLAG_KEYS:
+        frame[key] = df[key].fillna(False).astype(bool)
+    for key in NUMERIC_QUERY_KEYS:
+        frame[key] = pd.to_numeric(df[key], errors='coerce').fillna(0).astype(float)
+    # Grouping keys for /api/stats; categorical, so every column is a plain array that can be mapped
+    for key in GROUP_KEYS:
+        frame[key] = df[key].where(df[key].notna(), '').astype(str).astype('category')
+    return frame
+
+def fold_column(records: List[dict], key: str) -> List[str]:
+    # Accent- and case-folded, so "zurich" finds "Zürich"
+    return [fold_text(record.get(key)) for record in records]
+
+class TrackSnapshot:
+    """
+    Preprocessed, read-only view of the enriched CSV for one file signature.
+    Built once and shared by every request until the file changes.
+    """
+    def __init__(self, signature, records: List[dict], row_hashes: np.ndarray, row_json: Optional[list] = None,
+                 columns: Optional[list] = None, previous: Optional['TrackSnapshot'] = None,
+                 reuse: Optional[np.ndarray] = None):
         """
-        Calculates a Data Quality Index (0-100) based on field completeness.
+        With `previous`, row i is previous row reuse[i] (or new where reuse[i] < 0): the filter
+        frame, search postings and compressed payload are patched instead of rebuilt.
         """
-        essential_fields = ['Name', 'Latitude', 'Longitude', 'Country', 'Category']
-        bonus_fields = ['Review Velocity (12m)', 'Hero Image URL', 'Top Reviews Snippet']
-        
-        score = 0
-        max_score = len(essential_fields) * 15 + len(bonus_fields) * 8
-        
-        for field in essential_fields:
-            val = row.get(field)
-            if val and str(val).strip() and not (isinstance(val, float) and math.isnan(val)):
-                # Penalty for unrecovered names
-                if field == 'Name' and str(val).startswith('track_'):
-                    score += 5
-                else:
-                    score += 15
-        
-        for field in bonus_fields:
-            val = row.get(field)
-            if val and str(val).strip() and not (isinstance(val, float) and math.isnan(val)):
-                score += 8
-                
-        return min(100, round((score / max_score) * 100, 1))
+        self.signature = signature
+        self.records = records
+        self.row_hashes = row_hashes # 64-bit hash of each raw CSV row, for incremental reloads
+        self.columns = columns # CSV header the hashes were taken under
+        self.built_at = time.time()
+        # Each row is encoded once; responses are byte joins over these blobs
+        if row_json is None:
+            row_json = [None] * len(records)
+        self.row_json = [blob if blob is not None else serialize_record(record) for record, blob in zip(records, row_json)]
+        if previous is not None and not isinstance(previous.records, list):
+            # Reused rows of an attached snapshot were never decoded; keep decoding on access
+            self.records = LazyRecords(self.row_json)
+        if previous is None:
+            names, cities = fold_column(records, 'Name'), fold_column(records, 'City')
+            frame = build_filter_frame(records)
+            self.search = SearchIndex.build(records, names)
+        else:
+            changed = np.flatnonzero(reuse < 0)
+            fresh = [records[i] for i in changed.tolist()]
+            names, cities = [], []
+            for previous_text, text, key in ((previous.folded_names, names, 'Name'), (previous.folded_cities, cities, 'City')):
+                previous_text, fresh_text = previous_text.tolist(), iter(fold_column(fresh, key))
+                text.extend(previous_text[pos] if pos >= 0 else next(fresh_text) for pos in reuse.tolist())
+            source = reuse.copy()
+            combined = previous.frame.drop(columns='Name_rank')
+            if len(changed):
+                source[changed] = len(combined) + np.arange(len(changed))
+                combined = pd.concat([combined, build_filter_frame(fresh)], ignore_index=True)
+            frame = combined.take(source).reset_index(drop=True)
+            for key in GROUP_KEYS:
+                frame[key] = frame[key].astype('category') # concat of differing categories gives objects
+            self.search = previous.search.patched(reuse, list(zip(changed.tolist(), fresh)), names)
+        frame['Name_rank'] = self.search.name_ranks()
+        self.frame = frame
+        self.folded_names = StringTable.from_strings(names)
+        self.folded_cities = StringTable.from_strings(cities)
+        self.positions_by_id = TrackPositions.from_frame(self.frame)
+        self.spatial = TrackSpatialIndex(self.frame['Latitude'].to_numpy(), self.frame['Longitude'].to_numpy())
+        # Compressed once per data generation for /api/tracks, reusing the previous one's unchanged runs
+        self.payload = build_rows_payload(self.row_json, row_hashes, previous.payload if previous is not None else None)
+        self.stats_payloads = build_stats_payloads(self.frame)
+        self.columns_payload = build_columns_payload(self.frame, br=False)
 
-    try:
-        if not os.path.exists(CSV_PATH):
-            print(f"CRITICAL: CSV not found at {os.path.abspath(CSV_PATH)}")
-            return []
-            
-        df = pd.read_csv(CSV_PATH)
-        print(f"SUCCESS: Loaded {len(df)} tracks from {CSV_PATH}")
-        
-        # Ensure data_quality_score exists
-        if 'data_quality_score' not in df.columns:
-            df['data_quality_score'] = df.apply(calculate_dq_score, axis=1)
-        
-        # Consolidation and Key Cleanup
-        clean_data = []
-        for _, row in df.iterrows():
-            record = row.to_dict()
-            
-            # 1. Consolidated Track Length
-            # Prioritize Website scraping, then OSM
-            web_len = sanitize(record.get('website_track_length_m'))
-            osm_len = sanitize(record.get('track_length_m'))
-            
-            # Filter out -1 (placeholder for failed scrape)
-            best_len = 0
-            if isinstance(web_len, (int, float)) and web_len > 0:
-                best_len = web_len
-            elif isinstance(osm_len, (int, float)) and osm_len > 0:
-                best_len = osm_len
-            
-            record['consolidated_track_length'] = best_len
-            
-            # 2. Key Cleanup for Frontend
-            # Mapping CSV names to what Frontend expects
-            key_map = {
-                'Review Velocity (12m)': 'Review Velocity',
-                'Owner Activity': 'Owner Responds'
-            }
-            
-            sanitized_record = {}
-            for k, v in record.items():
-                target_k = key_map.get(k, k)
-                sanitized_record[target_k] = sanitize(v, target_k)
-            
-            clean_data.append(sanitized_record)
-            
-        return clean_data
-    except Exception as e:
-        import traceback
-        print(f"ERROR: Failed to load tracks CSV: {e}")
-        traceback.print_exc()
-        return []
+    @cached_property
+    def hex_layers(self) -> list:
+        # Built on first use: workers that never serve /api/tracks/density never hold them
+        return build_hex_layers(self.frame)
 
-_cached_geojson = None
-_cached_geojson_str = None
-_geojson_mtime = 0
+    def compress_br(self):
+        self.payload.compress_br()
+        self.columns_payload.compress_br()
 
-def get_geojson_data(as_string: bool = False):
+    @classmethod
+    def assemble(cls, signature, records, row_hashes, row_json, frame, folded_names, folded_cities, positions_by_id,
+                 payload, stats_payloads, columns_payload, spatial, search, built_at, columns=None):
+        """
+        Wraps parts that were built elsewhere, e.g. attached from a shared-memory snapshot.
+        """
+        snapshot = cls.__new__(cls)
+        snapshot.signature = signature
+        snapshot.records = records
+        snapshot.row_hashes = row_hashes
+        snapshot.columns = columns
+        snapshot.built_at = built_at
+        snapshot.row_json = row_json
+        snapshot.frame = frame
+        snapshot.folded_names = folded_names
+        snapshot.folded_cities = folded_cities
+        snapshot.positions_by_id = positions_by_id
+        snapshot.spatial = spatial
+        snapshot.search = search
+        snapshot.payload = payload
+        snapshot.stats_payloads = stats_payloads
+        snapshot.columns_payload = columns_payload
+        return snapshot
+
+def build_tracks_snapshot(signature, previous: Optional[TrackSnapshot] = None) -> TrackSnapshot:
     """
-    Reads the shapes file and caches it both as dict and string.
+    Parses the enriched CSV, scores data quality and sanitizes every row.
+    Rows whose track_id and raw-row hash match `previous` reuse its record, encoded JSON,
+    filter-frame row, search postings and compressed payload runs, so the enrichment scripts'
+    frequent rewrites only pay for the rows they touched.
     """
-    global _cached_geojson, _cached_geojson_str, _geojson_mtime
+    df = pd.read_csv(CSV_PATH)
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    columns = list(df.columns)
+
+    reuse = np.full(len(df), -1)
+    # Row hashes don't cover the header, so a renamed or added column means a full rebuild
+    if previous is not None and previous.columns != columns:
+        previous = None
+    if previous is not None and 'track_id' in df.columns:
+        track_ids = pd.to_numeric(df['track_id'], errors='coerce').to_numpy(dtype=float)
+        valid = np.flatnonzero(~np.isnan(track_ids))
+        pos = previous.positions_by_id.lookup(track_ids[valid].astype(np.int64))
+        match = pos >= 0
+        match[match] = np.asarray(previous.row_hashes)[pos[match]] == row_hashes[valid[match]]
+        reuse[valid[match]] = pos[match]
+    changed = df.iloc[np.flatnonzero(reuse < 0)]
+    print(f"SUCCESS: Loaded {len(df)} tracks from {CSV_PATH} ({len(changed)} new or changed)")
     
-    try:
-        if not os.path.exists(GEOJSON_PATH):
-            print(f"WARNING: GeoJSON not found at {GEOJSON_PATH}")
-            return "" if as_string else {"type": "FeatureCollection", "features": []}
-            
-        current_mtime = os.path.getmtime(GEOJSON_PATH)
-        
-        # Return cache only if file hasn't changed
-        if _cached_geojson is not None and current_mtime <= _geojson_mtime:
-            return _cached_geojson_str if as_string else _cached_geojson
-            
-        print(f"LOADING GEOJSON: Loading {os.path.getsize(GEOJSON_PATH)/1024/1024:.2f} MB shapes file...")
-        with open(GEOJSON_PATH, 'r') as f:
-            _cached_geojson = json.load(f)
-            _cached_geojson_str = json.dumps(_cached_geojson) # Cache as string too
-            _geojson_mtime = current_mtime
-            print(f"SUCCESS: GeoJSON loaded cached ({len(_cached_geojson.get('features', []))} features)")
-            return _cached_geojson_str if as_string else _cached_geojson
-            
-    except MemoryError:
-        print("CRITICAL: Out of memory while loading GeoJSON!")
-        return "" if as_string else {"type": "FeatureCollection", "features": []}
-    except Exception as e:
-        print(f"Error reading GeoJSON: {e}")
-        import traceback
-        traceback.print_exc()
-        return "" if as_string else {"type": "FeatureCollection", "features": []}
-
-def load_wishlist(username: str):
-    if not os.path.exists(WISHLIST_PATH):
-        return []
-    try:
-        with open(WISHLIST_PATH, 'r') as f:
-            data = json.load(f)
-            return data.get(username, [])
-    except:
-        return []
-
-def update_wishlist(username: str, track_id: int, action: str):
-    data = {}
-    if os.path.exists(WISHLIST_PATH):
+    # Ensure data_quality_score exists
+    if 'data_quality_score' not in df.columns and len(changed):
+        changed = changed.assign(data_quality_score=changed.apply(calculate_dq_score, axis=1))
+    
+    fresh = iter(build_track_records(changed))
+    # Records of an attached snapshot are decoded on access; TrackSnapshot only needs the changed ones
+    decoded = previous is not None and isinstance(previous.records, list)
+    records, row_json = [], []
+    for pos in reuse.tolist():
+        if pos >= 0:
+            records.append(previous.records[pos] if decoded else None)
+            row_json.append(previous.row_json[pos])
+        else:
+            records.append(next(fresh))
+            row_json.append(None)
+    return TrackSnapshot(signature, records, row_hashes, row_json, columns, previous, reuse)
+
+def diff_snapshots(old: TrackSnapshot, new: TrackSnapshot):
+    """
+    (upserted track_ids, removed track_ids) between two snapshots, by row hash.
+    """
+    old_ids, new_ids = old.positions_by_id, new.positions_by_id
+    found = old_ids.lookup(new_ids.ids)
+    known = found >= 0
+    changed = ~known
+    changed[known] = np.asarray(old.row_hashes)[found[known]] != np.asarray(new.row_hashes)[new_ids.positions[known]]
+    removed = old_ids.ids[new_ids.lookup(old_ids.ids) < 0]
+    return new_ids.ids[changed].tolist(), removed.tolist()
+
+class SnapshotDelta:
+    """
+    What changed between two data generations, identified by their payload ETags.
+    """
+    def __init__(self, base: str, etag: str, upserts: List[int], removed: List[int]):
+        self.base = base
+        self.etag = etag
+        self.upserts = upserts
+        self.removed = removed
+        self.at = time.time()
+
+CHANGE_LOG_SIZE = 256 # Generations a reconnecting client can catch up on before it must refetch
+
+_change_log = deque(maxlen=CHANGE_LOG_SIZE)
+_change_log_lock = threading.Lock()
+
+def record_change(old: TrackSnapshot, new: TrackSnapshot):
+    upserts, removed = diff_snapshots(old, new)
+    with _change_log_lock:
+        _change_log.append(SnapshotDelta(old.payload.etag, new.payload.etag, upserts, removed))
+    print(f"SNAPSHOT DELTA: {len(upserts)} upserted, {len(removed)} removed")
+    if SHARED_SNAPSHOT_DIR:
+        # A client reconnecting with Last-Event-ID may land on another worker
         try:
-            with open(WISHLIST_PATH, 'r') as f:
-                data = json.load(f)
-        except:
-            pass
-            
-    user_list = data.get(username, [])
-    if action == "add":
-        if track_id not in user_list:
-            user_list.append(track_id)
-    elif action == "remove":
-        if track_id in user_list:
-            user_list.remove(track_id)
-            
-    data[username] = user_list
-    with open(WISHLIST_PATH, 'w') as f:
-        json.dump(data, f)
-    return user_list
+            save_change(SHARED_SNAPSHOT_DIR, old.payload.etag, new.payload.etag, upserts, removed, keep=CHANGE_LOG_SIZE)
+        except OSError as e:
+            print(f"WARNING: Could not share the snapshot delta: {e}")
+
+def changes_since(snapshot: TrackSnapshot, etag: str):
+    """
+    Net (upserts, removed) from generation `etag` to `snapshot`, or None if that
+    generation is no longer in the change log and the client has to refetch.
+    This worker's log is tried first, then the log shared by all workers.
+    """
+    if etag == snapshot.payload.etag:
+        return set(), set()
+    with _change_log_lock:
+        log = list(_change_log)
+    chain = follow_changes([(delta.base, delta.etag) for delta in log], etag, snapshot.payload.etag)
+    if chain is not None:
+        steps = [(log[i].upserts, log[i].removed) for i in chain]
+    elif SHARED_SNAPSHOT_DIR:
+        steps = load_change_chain(SHARED_SNAPSHOT_DIR, etag, snapshot.payload.etag)
+        if steps is None:
+            return None
+    else:
+        return None
+    upserts, removed = set(), set()
+    for step_upserts, step_removed in steps:
+        upserts.difference_update(step_removed)
+        removed.update(step_removed)
+        removed.difference_update(step_upserts)
+        upserts.update(step_upserts)
+    return upserts, removed
+
+def build_change_event(snapshot: TrackSnapshot, since: str) -> bytes:
+    """
+    One server-sent event bringing a client from generation `since` to `snapshot`:
+    a `delta` carrying full records for upserted tracks, or a `reset` asking for a refetch.
+    """
+    etag = snapshot.payload.etag
+    changes = changes_since(snapshot, since)
+    if changes is None:
+        data = json.dumps({'etag': etag}).encode('utf-8')
+        return b'event: reset\nid: ' + etag.encode('ascii') + b'\ndata: ' + data + b'\n\n'
+    upserts, removed = changes
+    header = json.dumps({'base': since, 'etag': etag, 'total': len(snapshot.row_json), 'removed': sorted(removed)})
+    rows = join_json_array(snapshot.row_json[snapshot.positions_by_id[track_id]] for track_id in sorted(upserts))
+    data = header[:-1].encode('utf-8') + b',"upserts":' + rows + b'}'
+    return b'event: delta\nid: ' + etag.encode('ascii') + b'\ndata: ' + data + b'\n\n'
+
+_latest_build: Optional[TrackSnapshot] = None
+
+def _compress_br_when_settled(snapshot: TrackSnapshot, delay: float):
+    """
+    Adds the brotli variants once no newer generation has been built for `delay` seconds;
+    gzip is served until then.
+    """
+    def run():
+        if _latest_build is snapshot:
+            start = time.perf_counter()
+            snapshot.compress_br()
+            print(f"SUCCESS: Brotli-compressed track payloads in {time.perf_counter() - start:.2f}s")
+
+    timer = threading.Timer(delay, run)
+    timer.daemon = True
+    timer.start()
+
+def _build_tracks(signature, previous: Optional[TrackSnapshot]) -> TrackSnapshot:
+    global _latest_build
+    if SHARED_SNAPSHOT_DIR:
+        # Multi-worker: one worker builds, every worker maps the same columnar files
+        snapshot = load_or_publish(signature, lambda: build_tracks_snapshot(signature, previous), TrackSnapshot.assemble)
+    else:
+        snapshot = build_tracks_snapshot(signature, previous)
+    _latest_build = snapshot
+    _compress_br_when_settled(snapshot, BROTLI_SETTLE_SECONDS)
+    return snapshot
+
+# Required: every data route needs the snapshot, so a cold start blocks callers until it is built.
+# /api/ready keeps Cloud Run traffic away until then.
+_tracks_cache = SnapshotCache('tracks', 'tracks_snapshot', _build_tracks, on_swap=record_change)
+
+def get_tracks_snapshot(wait: bool = False) -> Optional[TrackSnapshot]:
+    """
+    Returns the cached snapshot. When the CSV's mtime or size changed, one background rebuild
+    starts and the previous snapshot keeps serving until it is swapped in; see SnapshotCache.
+    If a rebuild fails (e.g. a half-written file), the previous snapshot keeps serving.
+    """
+    if not os.path.exists(CSV_PATH):
+        print(f"CRITICAL: CSV not found at {os.path.abspath(CSV_PATH)}")
+        return _tracks_cache.current
+    try:
+        signature = file_signature(CSV_PATH)
+    except OSError as e: # Replaced between the check and the stat
+        print(f"WARNING: Could not stat {CSV_PATH}: {e}")
+        return _tracks_cache.current
+    return _tracks_cache.get(signature, wait=wait)
+
+def get_tracks_data():
+    """
+    Safely reads the enriched CSV and robustly sanitizes for JSON.
+    Calculates Data Quality Index (DQI) if not present.
+    Served from the in-memory snapshot; the CSV is only re-read when it changes.
+    """
+    snapshot = get_tracks_snapshot()
+    return list(snapshot.records) if snapshot is not None else []
+
+def query_tracks(snapshot: TrackSnapshot, indoor: bool = True, outdoor: bool = True, sim: bool = True,
+                 search: str = '', min_pps: float = 0, min_length: float = 0, min_reach: float = 0,
+                 sort: Optional[str] = None, offset: int = 0, limit: int = 500):
+    """
+    Evaluates the dashboard filters as column masks over the snapshot.
+    Returns (total matches, row positions for this page).
+    `sort` is a QUERY_SORT_KEYS key, prefixed with '-' for descending.
+    """
+    frame = snapshot.frame
+    
+    # Same semantics as the frontend: a track matches if any enabled type flag is set
+    mask = np.zeros(len(frame), dtype=bool)
+    for enabled, key in ((indoor, 'is_indoor'), (outdoor, 'is_outdoor'), (sim, 'is_sim')):
+        if enabled:
+            mask |= frame[key].to_numpy()
+    
+    mask &= frame['disposable_income_pps'].to_numpy() >= min_pps
+    mask &= frame['consolidated_track_length'].to_numpy() >= min_length
+    mask &= frame['catchment_area_size'].to_numpy() >= min_reach
+    
+    if search:
+        needle = fold_text(search)
+        mask &= snapshot.folded_names.contains(needle) | snapshot.folded_cities.contains(needle)
+    
+    positions = np.flatnonzero(mask)
+    if sort:
+        descending = sort.startswith('-')
+        column = frame[QUERY_SORT_KEYS[sort.lstrip('-')]].iloc[positions]
+        # Stable sort keeps CSV order for ties, so pages never overlap
+        order = column.reset_index(drop=True).sort_values(ascending=not descending, kind='stable').index.to_numpy()
+        positions = positions[order]
+    
+    return len(positions), positions[offset:offset + limit]
+
+_CURSOR = re.compile(r'([0-9a-f]{1,40}):([0-9]{1,12})') # "<payload etag>:<offset>"
+
+def encode_cursor(snapshot: TrackSnapshot, offset: int) -> str:
+    """
+    Opaque pagination cursor, pinned to the data generation it was issued for.
+    """
+    raw = f"{snapshot.payload.etag}:{offset}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(snapshot: TrackSnapshot, cursor: str) -> int:
+    """
+    Raises ValueError for malformed cursors and LookupError if the data changed since.
+    """
+    padded = cursor + '=' * (-len(cursor) % 4)
+    # b64decode drops characters outside the alphabet, so check the decoded shape too
+    match = _CURSOR.fullmatch(base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii'))
+    if match is None:
+        raise ValueError("Malformed cursor")
+    etag, offset = match.groups()
+    if etag != snapshot.payload.etag:
+        raise LookupError("Track data changed since this cursor was issued")
+    return int(offset)
+
+def build_query_body(snapshot: TrackSnapshot, total: int, positions, next_cursor: Optional[str]) -> bytes:
+    header = json.dumps({'total': total, 'count': len(positions), 'next_cursor': next_cursor})
+    items = join_json_array(snapshot.row_json[i] for i in positions)
+    return header[:-1].encode('utf-8') + b',"items":' + items + b'}'
+
+def build_query_ids_body(snapshot: TrackSnapshot, total: int, positions, next_cursor: Optional[str]) -> bytes:
+    # For clients that hold the columnar layer and only need to know which markers to show
+    ids = snapshot.frame['track_id'].to_numpy()[positions]
+    return json.dumps({'total': total, 'count': len(positions), 'next_cursor': next_cursor,
+                       'ids': [int(i) for i in ids if not np.isnan(i)]}).encode('utf-8')
+
+def build_near_body(snapshot: TrackSnapshot, positions, distances) -> bytes:
+    # Splice the distance into each pre-encoded row instead of re-serializing it
+    items = (b'{"distance_km":' + f'{d:.3f}'.encode('ascii') + b',' + snapshot.row_json[i][1:]
+             for i, d in zip(positions, distances))
+    return b'{"count":' + str(len(positions)).encode('ascii') + b',"items":' + join_json_array(items) + b'}'
+
+def build_records_body(snapshot: TrackSnapshot, track_ids: List[int]) -> bytes:
+    """
+    Pre-encoded records for the given ids, in the given order; unknown ids are skipped.
+    """
+    positions = (snapshot.positions_by_id.get(track_id) for track_id in track_ids)
+    return join_json_array(snapshot.row_json[pos] for pos in positions if pos is not None)
+
+SEARCH_SUMMARY_KEYS = ['track_id', 'Name', 'City', 'Country', 'NUTS_NAME', 'Latitude', 'Longitude']
+
+def search_tracks(snapshot: TrackSnapshot, q: str, limit: int = 10) -> List[dict]:
+    """
+    Ranked autocomplete hits as small summary records.
+    """
+    hits = []
+    for pos, score in snapshot.search.search(q, limit):
+        record = snapshot.records[pos]
+        hit = {key: record.get(key) for key in SEARCH_SUMMARY_KEYS}
+        hit['score'] = round(score, 3)
+        hits.append(hit)
+    return hits
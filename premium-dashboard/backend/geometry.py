@@ -0,0 +1,320 @@
+import numpy as np
+from typing import List, Optional
+
+# Level-of-detail bands for isochrone polygons: (highest map zoom served, tolerance in degrees).
+# Above the last band the original ORS geometry is served untouched.
+LOD_LEVELS = [
+    (5, 0.02),    # Continent / country (~2 km)
+    (8, 0.005),   # Region (~500 m)
+    (11, 0.001),  # City (~100 m)
+]
+
+def lod_level_for(zoom: Optional[int] = None, tolerance: Optional[float] = None) -> Optional[int]:
+    """
+    Index into LOD_LEVELS for a map zoom or a maximum tolerance; None means full resolution.
+    """
+    if tolerance is not None:
+        # Coarsest level that is still at least as precise as requested
+        for level, (_, level_tolerance) in enumerate(LOD_LEVELS):
+            if level_tolerance <= tolerance:
+                return level
+        return None
+    if zoom is not None:
+        for level, (max_zoom, _) in enumerate(LOD_LEVELS):
+            if zoom <= max_zoom:
+                return level
+    return None
+
+def _decimals_for(tolerance: float) -> int:
+    # One decimal finer than the tolerance keeps rounding error well below it
+    return max(0, int(np.ceil(-np.log10(tolerance))) + 1)
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Concatenation of arange(start, start + count) for each (start, count).
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(np.asarray(starts, dtype=np.int64) - offsets, counts) + np.arange(int(counts.sum()))
+
+def _first_per_group(positions: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    # positions sorted by group: the first one of each group, like np.argmax picks the first maximum
+    return positions[np.r_[True, groups[positions][1:] != groups[positions][:-1]]]
+
+def douglas_peucker(points: np.ndarray, starts: np.ndarray, ends: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Boolean keep-mask for many open polylines at once, points[starts[i]:ends[i] + 1] each (sorted,
+    non-overlapping). The recursion runs breadth-first: one numpy pass per depth splits every
+    unresolved segment of every polyline at its farthest vertex.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[starts] = keep[ends] = True
+    xs, ys = points[:, 0], points[:, 1]
+    counts = np.maximum(np.asarray(ends) - starts - 1, 0)
+    pending = _ranges(np.asarray(starts) + 1, counts) # Interior vertices of unresolved segments
+    a, b = np.repeat(starts, counts), np.repeat(ends, counts) # Their segment's end points
+    while len(pending):
+        ax, ay, px, py = xs[a], ys[a], xs[pending], ys[pending]
+        dx, dy = xs[b] - ax, ys[b] - ay
+        norm = np.sqrt(dx * dx + dy * dy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dist = np.abs(dx * (ay - py) - dy * (ax - px)) / norm
+        degenerate = norm == 0
+        if degenerate.any():
+            dist[degenerate] = np.hypot(px - ax, py - ay)[degenerate]
+        # Pending vertices are sorted, so each segment's vertices form one run
+        run_starts = np.r_[True, a[1:] != a[:-1]]
+        segment = np.cumsum(run_starts) - 1
+        farthest = np.maximum.reduceat(dist, np.flatnonzero(run_starts))
+        split = farthest > tolerance
+        at_max = _first_per_group(np.flatnonzero(dist == farthest[segment]), segment)
+        at_max = at_max[split[segment[at_max]]]
+        keep[pending[at_max]] = True
+        cuts = np.full(len(farthest), -1)
+        cuts[segment[at_max]] = pending[at_max]
+        cut = cuts[segment]
+        live = split[segment] & (pending != cut)
+        a = np.where(pending > cut, cut, a)[live]
+        b = np.where(pending < cut, cut, b)[live]
+        pending = pending[live]
+    return keep
+
+def simplify_rings(rings: List[np.ndarray], tolerance: float) -> List[Optional[np.ndarray]]:
+    """
+    Simplifies closed linear rings ((n, 2) float arrays) in one vectorized pass. Rings of up to
+    4 vertices are returned as they are; None marks a ring that collapsed below a triangle.
+    """
+    simplified = list(rings)
+    big = [i for i, ring in enumerate(rings) if len(ring) > 4]
+    if not big:
+        return simplified
+    lengths = np.array([len(rings[i]) for i in big], dtype=np.int64)
+    points = np.concatenate([rings[i] for i in big])
+    starts = np.cumsum(lengths) - lengths
+    sizes = lengths - (points[starts] == points[starts + lengths - 1]).all(axis=1) # Without the closing vertex
+    ring_of = np.repeat(np.arange(len(big)), lengths)
+    offsets = np.arange(len(points)) - starts[ring_of]
+
+    # Split each ring at the vertex farthest from its first one so both halves are open polylines
+    origin = points[starts][ring_of]
+    reach = np.hypot(points[:, 0] - origin[:, 0], points[:, 1] - origin[:, 1])
+    reach[offsets >= sizes[ring_of]] = -1
+    farthest = np.maximum.reduceat(reach, starts)
+    splits = offsets[_first_per_group(np.flatnonzero(reach == farthest[ring_of]), ring_of)]
+
+    # Per ring: first half (vertices 0..split), second half (split..size-1, then vertex 0 again)
+    order = _ranges(np.stack([starts, starts + splits, starts], axis=1).ravel(),
+                    np.stack([splits + 1, sizes - splits, np.ones_like(sizes)], axis=1).ravel())
+    halves = points[order]
+    ring_starts = np.cumsum(sizes + 2) - (sizes + 2)
+    second = ring_starts + splits + 1
+    keep = douglas_peucker(halves, np.stack([ring_starts, second], axis=1).ravel(),
+                           np.stack([second - 1, ring_starts + sizes + 1], axis=1).ravel(), tolerance)
+    keep[second] = False # Same vertex as the end of the first half
+    counts = np.add.reduceat(keep.astype(np.int64), ring_starts)
+    kept = np.round(halves[keep], _decimals_for(tolerance))
+    for i, ring, count, split in zip(big, np.split(kept, np.cumsum(counts)[:-1]), counts, splits):
+        simplified[i] = ring if split > 0 and count >= 4 else None
+    return simplified
+
+def _polygons(geometry) -> Optional[list]:
+    if not geometry:
+        return None
+    if geometry.get('type') == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry.get('type') == 'MultiPolygon':
+        return geometry['coordinates']
+    return None
+
+def _ring_array(ring) -> np.ndarray:
+    array = np.asarray(ring, dtype=float)
+    return array[:, :2] if array.ndim == 2 else array.reshape(0, 2)
+
+def simplify_geometries(geometries: list, tolerance: float) -> list:
+    """
+    Simplified copies of Polygon/MultiPolygon geometries, with every ring of the batch simplified
+    in one pass; holes that collapse are dropped, and a geometry whose every polygon collapsed
+    becomes None. Other geometries are returned as they are. Rings come back as float arrays.
+    """
+    rings = [_ring_array(ring) for geometry in geometries for polygon in (_polygons(geometry) or []) for ring in polygon]
+    simplified = iter(simplify_rings(rings, tolerance))
+    results = []
+    for geometry in geometries:
+        polygons = _polygons(geometry)
+        if polygons is None:
+            results.append(geometry)
+            continue
+        kept = []
+        for polygon in polygons:
+            outer, *holes = [next(simplified) for _ in polygon] or [None]
+            if outer is not None:
+                kept.append([outer] + [hole for hole in holes if hole is not None])
+        if not kept:
+            results.append(None)
+        elif geometry['type'] == 'Polygon':
+            results.append({'type': 'Polygon', 'coordinates': kept[0]})
+        else:
+            results.append({'type': 'MultiPolygon', 'coordinates': kept})
+    return results
+
+def array_rings(geometry):
+    """
+    Copy of a Polygon/MultiPolygon with each ring as an (n, 2) float array, so a batch of parsed
+    features holds a few arrays each instead of a list object per vertex.
+    """
+    polygons = _polygons(geometry)
+    if polygons is None:
+        return geometry
+    arrays = [[_ring_array(ring) for ring in polygon] for polygon in polygons]
+    return {**geometry, 'coordinates': arrays[0] if geometry['type'] == 'Polygon' else arrays}
+
+def coordinate_lists(geometry):
+    """
+    Copy of a geometry with array rings turned back into nested lists, for JSON encoding.
+    """
+    polygons = _polygons(geometry)
+    if polygons is None:
+        return geometry
+    lists = [[ring.tolist() if isinstance(ring, np.ndarray) else ring for ring in polygon] for polygon in polygons]
+    return {**geometry, 'coordinates': lists[0] if geometry['type'] == 'Polygon' else lists}
+
+def simplify_geometry(geometry: dict, tolerance: float) -> Optional[dict]:
+    """
+    Simplified copy of a Polygon/MultiPolygon; holes that collapse are dropped.
+    """
+    return coordinate_lists(simplify_geometries([geometry], tolerance)[0])
+
+# Tiles follow the XYZ / Web Mercator scheme Leaflet and Mapbox use
+TILE_EXTENT = 4096 # Quantization grid per tile edge, as in Mapbox Vector Tiles
+TILE_BUFFER = 64   # Overdraw beyond the tile edge (in grid units) so strokes don't seam
+
+def tile_bounds(z: int, x: int, y: int):
+    """
+    (west, south, east, north) in degrees for an XYZ tile.
+    """
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n)))))
+    south = float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 1) / n)))))
+    return west, south, east, north
+
+def geometry_bbox(geometry: dict):
+    """
+    (west, south, east, north) of a Polygon/MultiPolygon, or None if it has no coordinates.
+    """
+    if not geometry or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+        return None
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+    rings = [np.asarray(ring, dtype=float)[:, :2] for rings in polygons for ring in rings[:1] if len(ring)]
+    if not rings:
+        return None
+    points = np.vstack(rings)
+    return float(points[:, 0].min()), float(points[:, 1].min()), float(points[:, 0].max()), float(points[:, 1].max())
+
+def _clip_edge(points, inside, intersect):
+    clipped = []
+    if not points:
+        return clipped
+    prev = points[-1]
+    prev_in = inside(prev)
+    for point in points:
+        cur_in = inside(point)
+        if cur_in:
+            if not prev_in:
+                clipped.append(intersect(prev, point))
+            clipped.append(point)
+        elif prev_in:
+            clipped.append(intersect(prev, point))
+        prev, prev_in = point, cur_in
+    return clipped
+
+def clip_ring(ring: List[list], bbox) -> Optional[List[list]]:
+    """
+    Sutherland-Hodgman clip of a closed ring to an axis-aligned box; None if nothing remains.
+    """
+    west, south, east, north = bbox
+    points = [(p[0], p[1]) for p in ring]
+    if len(points) > 1 and points[0] == points[-1]:
+        points = points[:-1]
+
+    def at_x(x):
+        return lambda a, b: (x, a[1] + (b[1] - a[1]) * (x - a[0]) / (b[0] - a[0]))
+
+    def at_y(y):
+        return lambda a, b: (a[0] + (b[0] - a[0]) * (y - a[1]) / (b[1] - a[1]), y)
+
+    points = _clip_edge(points, lambda p: p[0] >= west, at_x(west))
+    points = _clip_edge(points, lambda p: p[0] <= east, at_x(east))
+    points = _clip_edge(points, lambda p: p[1] >= south, at_y(south))
+    points = _clip_edge(points, lambda p: p[1] <= north, at_y(north))
+    if len(points) < 3:
+        return None
+    return [list(p) for p in points] + [list(points[0])]
+
+MAX_MERCATOR_LAT = 85.0511287798 # Web-Mercator's square world; tiles stop here
+
+def mercator_y(lat):
+    """
+    Web-Mercator y (in radians of the unit sphere) for latitudes in degrees.
+    """
+    lat = np.radians(np.clip(lat, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    return np.log(np.tan(np.pi / 4 + lat / 2))
+
+def mercator_lat(y):
+    """
+    Inverse of mercator_y.
+    """
+    return np.degrees(2 * np.arctan(np.exp(y)) - np.pi / 2)
+
+def clip_and_quantize(geometry: dict, bounds, extent: int = TILE_EXTENT, buffer: int = TILE_BUFFER) -> Optional[dict]:
+    """
+    Clips a Polygon/MultiPolygon to a (buffered) tile and snaps vertices to the tile's grid.
+    Both happen in Web-Mercator, the projection the map draws in, so grid cells are square on
+    screen; output is converted back to lon/lat so it can be handed straight to L.geoJSON.
+    """
+    if not geometry or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+        return None
+    west, south, east, north = bounds
+    top, bottom = float(mercator_y(north)), float(mercator_y(south))
+    step = np.array([(east - west) / extent, (top - bottom) / extent])
+    origin = np.array([west, bottom])
+    clip_box = (west - buffer * step[0], bottom - buffer * step[1], east + buffer * step[0], top + buffer * step[1])
+    # Cells are shortest (in degrees of latitude) at the tile's poleward edge
+    cell_lat = min(north - float(mercator_lat(top - step[1])), float(mercator_lat(bottom + step[1])) - south)
+    decimals = _decimals_for(min(step[0], cell_lat))
+
+    def quantize(ring):
+        points = np.asarray(ring, dtype=float)
+        grid = np.rint((points - origin) / step)
+        # Vertices closer than one grid cell collapse into one
+        keep = np.ones(len(grid), dtype=bool)
+        keep[1:] = (grid[1:] != grid[:-1]).any(axis=1)
+        grid = grid[keep]
+        if len(grid) < 4:
+            return None
+        snapped = origin + grid * step
+        snapped[:, 1] = mercator_lat(snapped[:, 1])
+        return np.round(snapped, decimals).tolist()
+
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+    clipped = []
+    for rings in polygons:
+        kept = []
+        for i, ring in enumerate(rings):
+            ring = _ring_array(ring)
+            ring = clip_ring(np.column_stack([ring[:, 0], mercator_y(ring[:, 1])]).tolist(), clip_box) if len(ring) else None
+            ring = quantize(ring) if ring is not None else None
+            if ring is None:
+                if i == 0:
+                    break # Outer ring gone: holes are meaningless
+                continue
+            kept.append(ring)
+        if kept:
+            clipped.append(kept)
+
+    if not clipped:
+        return None
+    if len(clipped) == 1:
+        return {'type': 'Polygon', 'coordinates': clipped[0]}
+    return {'type': 'MultiPolygon', 'coordinates': clipped}
@@ -0,0 +1,162 @@
+import math
+import threading
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .payloads import EncodedPayload, dumps_json
+
+EARTH_RADIUS_M = 6378137.0 # Web Mercator sphere
+MAX_MERCATOR_LAT = 85.05112878
+SQRT3 = math.sqrt(3)
+
+# Hex circumradius per resolution, in Web Mercator km: cells look the same size on the map
+# at every latitude (their true ground size shrinks by cos(latitude)).
+HEX_RESOLUTIONS = [320.0, 160.0, 80.0, 40.0, 20.0, 10.0, 5.0]
+_RING_ANGLES = np.radians(30 + 60 * np.arange(7)) # Pointy-top, closed ring
+
+def hex_resolution_for(zoom: int) -> int:
+    # Roughly 30 px wide cells on a 256 px tile pyramid
+    return max(0, min(len(HEX_RESOLUTIONS) - 1, zoom - 3))
+
+def to_mercator(lons: np.ndarray, lats: np.ndarray):
+    lats = np.clip(lats, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    x = EARTH_RADIUS_M * np.radians(lons)
+    y = EARTH_RADIUS_M * np.log(np.tan(np.pi / 4 + np.radians(lats) / 2))
+    return x, y
+
+def from_mercator(x: np.ndarray, y: np.ndarray):
+    lons = np.degrees(x / EARTH_RADIUS_M)
+    lats = np.degrees(2 * np.arctan(np.exp(y / EARTH_RADIUS_M)) - np.pi / 2)
+    return lons, lats
+
+def hex_cells(x: np.ndarray, y: np.ndarray, size: float):
+    """
+    Axial (q, r) of the pointy-top hexagon containing each point, via cube rounding.
+    """
+    qf = (SQRT3 / 3 * x - y / 3) / size
+    rf = (2 / 3 * y) / size
+    sf = -qf - rf
+    q, r, s = np.round(qf), np.round(rf), np.round(sf)
+    dq, dr, ds = np.abs(q - qf), np.abs(r - rf), np.abs(s - sf)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    q = np.where(fix_q, -r - s, q)
+    r = np.where(fix_r, -q - s, r)
+    return q.astype(np.int64), r.astype(np.int64)
+
+def hex_center(q: np.ndarray, r: np.ndarray, size: float):
+    return size * SQRT3 * (q + r / 2), size * 1.5 * r
+
+class HexLayer:
+    """
+    Aggregates for every non-empty hex cell at one resolution, as parallel arrays.
+    """
+    def __init__(self, resolution: int, frame: pd.DataFrame, x: np.ndarray, y: np.ndarray, valid: np.ndarray):
+        self.resolution = resolution
+        self.size_km = HEX_RESOLUTIONS[resolution]
+        size = self.size_km * 1000
+        q, r = hex_cells(x[valid], y[valid], size)
+
+        # One group per (q, r): a 64-bit key keeps this a single factorize
+        codes, keys = pd.factorize((q << 32) + (r & 0xFFFFFFFF), sort=True)
+        cells = len(keys)
+        self.q = (keys >> 32).astype(np.int64)
+        self.r = ((keys & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000 # Sign-extend the low word
+        cx, cy = hex_center(self.q, self.r, size)
+        self.lon, self.lat = from_mercator(cx, cy)
+
+        def total(values):
+            return np.bincount(codes, weights=values, minlength=cells)
+
+        pps = frame['disposable_income_pps'].to_numpy()[valid]
+        catchment = frame['catchment_area_size'].to_numpy()[valid]
+        self.count = np.bincount(codes, minlength=cells)
+        # 0 means "not enriched yet"; it must not drag the mean down
+        pps_known = np.bincount(codes, weights=(pps > 0).astype(float), minlength=cells)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.pps_mean = np.where(pps_known > 0, total(np.where(pps > 0, pps, 0)) / pps_known, np.nan)
+        self.catchment_total = total(np.where(catchment > 0, catchment, 0))
+        self.indoor = np.bincount(codes, weights=frame['is_indoor'].to_numpy(dtype=float)[valid], minlength=cells).astype(np.int64)
+        self.outdoor = np.bincount(codes, weights=frame['is_outdoor'].to_numpy(dtype=float)[valid], minlength=cells).astype(np.int64)
+        self.sim = np.bincount(codes, weights=frame['is_sim'].to_numpy(dtype=float)[valid], minlength=cells).astype(np.int64)
+        self._payloads = {} # geojson flag -> EncodedPayload of every cell, encoded on first request
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.q)
+
+    def select(self, west: float, south: float, east: float, north: float) -> np.ndarray:
+        """
+        Cells whose centre lies in the box, padded by one cell so edge hexes are not cut off.
+        """
+        pad = np.degrees(self.size_km * 1000 * 2 / EARTH_RADIUS_M)
+        lat_pad = pad * np.cos(np.radians(self.lat)) # Mercator cells shrink in latitude degrees poleward
+        mask = (self.lat >= south - lat_pad) & (self.lat <= north + lat_pad)
+        if west <= east:
+            mask &= (self.lon >= west - pad) & (self.lon <= east + pad)
+        else:
+            # Box crosses the antimeridian
+            mask &= (self.lon >= west - pad) | (self.lon <= east + pad)
+        return np.flatnonzero(mask)
+
+    def rings(self, positions: np.ndarray) -> list:
+        """
+        Closed hexagon outline of each cell as [[lon, lat] x 7], all cells in one pass.
+        """
+        size = self.size_km * 1000
+        cx, cy = hex_center(self.q[positions], self.r[positions], size)
+        lons, lats = from_mercator(cx[:, None] + size * np.cos(_RING_ANGLES), cy[:, None] + size * np.sin(_RING_ANGLES))
+        return np.stack([np.round(lons, 5), np.round(lats, 5)], axis=-1).tolist()
+
+    def cells(self, positions: np.ndarray) -> list:
+        def rounded(values, digits):
+            # Python's round, not np.round: they disagree on halves
+            return [None if v != v else round(v, digits) for v in values[positions].tolist()]
+
+        columns = {
+            'q': self.q[positions].tolist(),
+            'r': self.r[positions].tolist(),
+            'lon': rounded(self.lon, 5),
+            'lat': rounded(self.lat, 5),
+            'count': self.count[positions].tolist(),
+            'pps_mean': rounded(self.pps_mean, 1),
+            'catchment_total': rounded(self.catchment_total, 2),
+            'indoor': self.indoor[positions].tolist(),
+            'outdoor': self.outdoor[positions].tolist(),
+            'sim': self.sim[positions].tolist(),
+        }
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def build_body(self, positions: Optional[np.ndarray] = None, geojson: bool = False) -> bytes:
+        if positions is None:
+            positions = np.arange(len(self))
+        header = {'resolution': self.resolution, 'size_km': self.size_km}
+        if geojson:
+            features = [{
+                'type': 'Feature',
+                'properties': {**header, **cell},
+                'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            } for cell, ring in zip(self.cells(positions), self.rings(positions))]
+            return dumps_json({'type': 'FeatureCollection', 'features': features})
+        return dumps_json({**header, 'count': len(positions), 'cells': self.cells(positions)})
+
+    def payload(self, geojson: bool = False) -> EncodedPayload:
+        """
+        The unfiltered body, encoded and compressed once per snapshot on first use.
+        """
+        with self._lock:
+            if geojson not in self._payloads:
+                self._payloads[geojson] = EncodedPayload(self.build_body(geojson=geojson))
+            return self._payloads[geojson]
+
+def build_hex_layers(frame: pd.DataFrame) -> list:
+    """
+    Hex-bin aggregates of the snapshot at every resolution in HEX_RESOLUTIONS.
+    """
+    lons = frame['Longitude'].to_numpy(dtype=float)
+    lats = frame['Latitude'].to_numpy(dtype=float)
+    valid = np.isfinite(lons) & np.isfinite(lats) & (np.abs(lats) <= 90) & (np.abs(lons) <= 180)
+    x, y = to_mercator(np.where(valid, lons, 0), np.where(valid, lats, 0))
+    return [HexLayer(resolution, frame, x, y, valid) for resolution in range(len(HEX_RESOLUTIONS))]
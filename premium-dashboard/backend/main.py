@@ -1,8 +1,17 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import json
+import os
+import secrets
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
-from typing import List
+from typing import List, Optional
 
 from .auth import (
     create_access_token, 
@@ -12,10 +21,39 @@ from .auth import (
     get_user,
     pwd_context
 )
-from .schemas import Token, User, WishlistUpdate
-from .data_service import get_tracks_data, get_geojson_data, load_wishlist, update_wishlist
+from .schemas import Token, User, TrackRecord, WishlistUpdate, WishlistBulkUpdate
+from .data_service import (
+    get_tracks_snapshot,
+    query_tracks,
+    encode_cursor,
+    decode_cursor,
+    build_query_body,
+    build_query_ids_body,
+    build_near_body,
+    build_records_body,
+    search_tracks,
+    build_change_event,
+    QUERY_SORT_KEYS
+)
+from .wishlist_store import load_wishlist, update_wishlist, bulk_update_wishlist
+from .shapes_service import get_shape_index, shape_index_building, read_feature, get_tile_payload, resolve_shapes_file
+from .geometry import lod_level_for
+from .hexgrid import HEX_RESOLUTIONS, hex_resolution_for
+from .payloads import payload_response, json_bytes_response, etag_matches
+from .monitoring import loop_lag, registry as metrics_registry, MetricsMiddleware
+from .pipeline_status import get_pipeline_status
+from .warmup import warmup
 
-app = FastAPI(title="MP Intelligence API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_lag.start()
+    # Builds the serving caches in the background; /api/ready gates traffic until it is done
+    warmup.start()
+    yield
+    await warmup.stop()
+    await loop_lag.stop()
+
+app = FastAPI(title="MP Intelligence API", lifespan=lifespan)
 
 # Enable CORS for React Frontend
 app.add_middleware(
@@ -24,13 +62,51 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After", "X-Tracks-ETag"],
 )
+# Outermost, so latency includes CORS handling and every response is counted
+app.add_middleware(MetricsMiddleware)
+
+# Optional bearer token for /metrics; unset leaves it open like /api/health
+METRICS_TOKEN = os.environ.get("MP_METRICS_TOKEN")
+
+# Everything that parses files, hashes passwords or does disk I/O runs in the threadpool,
+# so one slow CSV reload or login never stalls other users on the event loop.
+async def require_snapshot():
+    snapshot = await run_in_threadpool(get_tracks_snapshot)
+    if snapshot is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Track data not available")
+    return snapshot
+
+# Suggested wait before retrying a shape or tile request while the isochrone index is first built
+SHAPES_RETRY_AFTER_SECONDS = 10
+
+async def require_shape_index():
+    """
+    The isochrone index, or None without shapes data. While the first index is still being built
+    (minutes for a large file) this answers 503 at once instead of holding a thread until it is done.
+    """
+    index = await run_in_threadpool(get_shape_index)
+    if index is None and shape_index_building():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Isochrone index is being built",
+            headers={"Retry-After": str(SHAPES_RETRY_AFTER_SECONDS)}
+        )
+    return index
+
+def authenticate_user(username: str, password: str):
+    user = get_user(username)
+    if not user or not verify_password(password, user.hashed_password):
+        return None
+    return user
 
 # API Routes with /api prefix
 @app.post("/api/auth/login", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = get_user(form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    # bcrypt is deliberately slow (~100s of ms): keep it off the loop
+    user = await run_in_threadpool(authenticate_user, form_data.username, form_data.password)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -46,31 +122,377 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
-@app.get("/api/tracks")
-async def read_tracks(current_user: User = Depends(get_current_user)):
-    return get_tracks_data()
+@app.get("/api/tracks", responses={200: {"model": List[TrackRecord]}})
+async def read_tracks(request: Request, current_user: User = Depends(get_current_user)):
+    snapshot = await run_in_threadpool(get_tracks_snapshot)
+    if snapshot is None:
+        return []
+    # Pre-serialized gzip/brotli bodies; revalidation answers 304 without a body
+    return payload_response(request, snapshot.payload)
+
+@app.get("/api/tracks/columns")
+async def read_track_columns(request: Request, current_user: User = Depends(get_current_user)):
+    """
+    The marker layer (id, coordinates, type flags, headline metrics, dictionary-encoded
+    country and NUTS region) as packed little-endian typed arrays; see backend/columnar.py.
+    """
+    snapshot = await require_snapshot()
+    response = payload_response(request, snapshot.columns_payload)
+    # The change stream is keyed by the /api/tracks ETag; clients that only hold the columns resume from this
+    response.headers["X-Tracks-ETag"] = snapshot.payload.etag
+    return response
+
+@app.get("/api/tracks/records", responses={200: {"model": List[TrackRecord]}})
+async def read_track_records(
+    request: Request,
+    ids: List[int] = Query(...),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Full records for the given track ids, in request order; unknown ids are skipped.
+    """
+    if len(ids) > 1000:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="At most 1000 track ids per request")
+    snapshot = await require_snapshot()
+    return json_bytes_response(request, build_records_body(snapshot, ids))
+
+CHANGE_POLL_SECONDS = 2.0
+CHANGE_HEARTBEAT_SECONDS = 15.0
+
+@app.get("/api/stats")
+async def read_stats(
+    request: Request,
+    group: Optional[str] = Query(None, pattern="^(country|nuts|type)$"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Aggregates precomputed with the snapshot: counts, PPS mean/median, facility mix and
+    length/catchment distributions, overall and per country, NUTS region or facility type.
+    """
+    snapshot = await require_snapshot()
+    return payload_response(request, snapshot.stats_payloads[group or "all"])
+
+@app.get("/api/tracks/changes")
+async def stream_track_changes(
+    request: Request,
+    since: Optional[str] = Query(None, max_length=64),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Server-sent events with per-track deltas while the CSV is being rewritten.
+    `since` (or Last-Event-ID on reconnect) is the ETag of the client's copy of /api/tracks.
+    """
+    snapshot = await require_snapshot()
+    since = request.headers.get("last-event-id") or since or snapshot.payload.etag
+
+    async def events():
+        nonlocal since
+        last_sent = time.monotonic()
+        while not await request.is_disconnected():
+            current = await run_in_threadpool(get_tracks_snapshot)
+            if current is not None and current.payload.etag != since:
+                yield build_change_event(current, since)
+                since = current.payload.etag
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= CHANGE_HEARTBEAT_SECONDS:
+                # Keeps proxies from closing an idle stream
+                yield b": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(CHANGE_POLL_SECONDS)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/tracks/query")
+async def read_tracks_query(
+    request: Request,
+    indoor: bool = True,
+    outdoor: bool = True,
+    sim: bool = True,
+    search: str = "",
+    min_pps: float = 0,
+    min_length: float = 0,
+    min_reach: float = 0,
+    sort: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    ids_only: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    snapshot = await require_snapshot()
+    if sort and sort.lstrip("-") not in QUERY_SORT_KEYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown sort key. Use one of: {', '.join(sorted(QUERY_SORT_KEYS))} (prefix '-' for descending)"
+        )
+    offset = 0
+    if cursor:
+        try:
+            offset = decode_cursor(snapshot, cursor)
+        except LookupError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    
+    def respond():
+        total, positions = query_tracks(
+            snapshot, indoor=indoor, outdoor=outdoor, sim=sim, search=search.strip(),
+            min_pps=min_pps, min_length=min_length, min_reach=min_reach,
+            sort=sort, offset=offset, limit=limit
+        )
+        next_offset = offset + len(positions)
+        next_cursor = encode_cursor(snapshot, next_offset) if next_offset < total else None
+        build_body = build_query_ids_body if ids_only else build_query_body
+        return json_bytes_response(request, build_body(snapshot, total, positions, next_cursor))
+
+    # Masks, substring search, the row join and gzip grow with the dataset: off the event loop
+    return await run_in_threadpool(respond)
+
+@app.get("/api/tracks/near")
+async def read_tracks_near(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(50, gt=0, le=20000),
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: User = Depends(get_current_user)
+):
+    snapshot = await require_snapshot()
+    positions, distances = snapshot.spatial.near(lat, lon, radius_km, limit)
+    return json_bytes_response(request, build_near_body(snapshot, positions, distances))
+
+@app.get("/api/tracks/bbox")
+async def read_tracks_bbox(
+    request: Request,
+    west: float = Query(..., ge=-180, le=180),
+    south: float = Query(..., ge=-90, le=90),
+    east: float = Query(..., ge=-180, le=180),
+    north: float = Query(..., ge=-90, le=90),
+    limit: int = Query(5000, ge=1, le=5000),
+    current_user: User = Depends(get_current_user)
+):
+    if south > north:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="south must not exceed north")
+    snapshot = await require_snapshot()
+    positions = snapshot.spatial.bbox(west, south, east, north)
+    return json_bytes_response(request, build_query_body(snapshot, len(positions), positions[:limit], None))
+
+@app.get("/api/tracks/density")
+async def read_track_density(
+    request: Request,
+    resolution: Optional[int] = Query(None, ge=0, le=len(HEX_RESOLUTIONS) - 1),
+    zoom: Optional[int] = Query(None, ge=0, le=22),
+    west: Optional[float] = Query(None, ge=-180, le=180),
+    south: Optional[float] = Query(None, ge=-90, le=90),
+    east: Optional[float] = Query(None, ge=-180, le=180),
+    north: Optional[float] = Query(None, ge=-90, le=90),
+    format: str = Query("json", pattern="^(json|geojson)$"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Precomputed hex-bin aggregates (track count, mean PPS, total catchment, type mix)
+    at `resolution`, or the resolution suited to `zoom`, optionally limited to a bbox.
+    """
+    if resolution is None:
+        if zoom is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pass resolution or zoom")
+        resolution = hex_resolution_for(zoom)
+    bbox = (west, south, east, north)
+    if any(v is not None for v in bbox) and any(v is None for v in bbox):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="bbox needs west, south, east and north")
+    if south is not None and south > north:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="south must not exceed north")
+
+    snapshot = await require_snapshot()
+    layer = snapshot.hex_layers[resolution]
+    geojson = format == "geojson"
+    if west is None:
+        # Encoded and compressed once per snapshot; the first request pays for it off the event loop
+        payload = await run_in_threadpool(layer.payload, geojson)
+        return payload_response(request, payload)
+
+    def respond():
+        body = layer.build_body(layer.select(west, south, east, north), geojson=geojson)
+        return json_bytes_response(request, body)
+
+    return await run_in_threadpool(respond)
 
 @app.get("/api/tracks/shapes")
-async def read_shapes(current_user: User = Depends(get_current_user)):
-    from fastapi.responses import Response
-    content = get_geojson_data(as_string=True)
-    return Response(content=content, media_type="application/json")
+async def read_shapes(
+    request: Request,
+    zoom: Optional[int] = Query(None, ge=0, le=22),
+    tolerance: Optional[float] = Query(None, gt=0),
+    current_user: User = Depends(get_current_user)
+):
+    level = lod_level_for(zoom=zoom, tolerance=tolerance)
+    if level is not None:
+        # LOD collections are written by the index build; the original file needs no index
+        await require_shape_index()
+    # The original file or an LOD level's collection, streamed straight from disk (Range-capable),
+    # never parsed or buffered
+    resolved = await run_in_threadpool(resolve_shapes_file, request.headers.get("accept-encoding"), level)
+    if resolved is None:
+        return Response(content=b'{"type":"FeatureCollection","features":[]}', media_type="application/json")
+    path, encoding, etag = resolved
+    headers = {
+        "ETag": f'"{etag}-{encoding}"' if encoding else f'"{etag}"',
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(path, media_type="application/json", headers=headers)
+
+@app.get("/api/tracks/shapes/index")
+async def read_shapes_index(current_user: User = Depends(get_current_user)):
+    index = await require_shape_index()
+    track_ids = index.track_ids if index is not None else []
+    return {"count": len(track_ids), "track_ids": track_ids}
+
+@app.get("/api/tracks/{track_id}/shape")
+async def read_track_shape(
+    track_id: str,
+    request: Request,
+    zoom: Optional[int] = Query(None, ge=0, le=22),
+    tolerance: Optional[float] = Query(None, gt=0),
+    current_user: User = Depends(get_current_user)
+):
+    index = await require_shape_index()
+    if index is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No isochrone data")
+    # May be the previous generation while the shapes file is being re-indexed
+    feature = await run_in_threadpool(read_feature, index, track_id, lod_level_for(zoom=zoom, tolerance=tolerance))
+    if feature is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No isochrone for this track")
+    return json_bytes_response(request, feature, etag=index.etag, cache_control="private, no-cache")
+
+@app.get("/api/tiles/isochrones/{z}/{x}/{y}")
+async def read_isochrone_tile(z: int, x: int, y: int, request: Request, current_user: User = Depends(get_current_user)):
+    if not 0 <= z <= 22 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tile out of range")
+    index = await require_shape_index()
+    if index is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No isochrone data")
+    payload = await run_in_threadpool(get_tile_payload, index, z, x, y)
+    return payload_response(request, payload)
+
+@app.get("/api/search")
+async def read_search(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: User = Depends(get_current_user)
+):
+    snapshot = await require_snapshot()
+    # Bounded per query (see SearchIndex), but still numpy work per keystroke: off the event loop
+    return {"query": q, "items": await run_in_threadpool(search_tracks, snapshot, q, limit)}
 
 @app.get("/api/wishlist")
-async def get_wishlist(current_user: User = Depends(get_current_user)):
-    return load_wishlist(current_user.username)
+async def get_wishlist(request: Request, expand: bool = False, current_user: User = Depends(get_current_user)):
+    track_ids = await run_in_threadpool(load_wishlist, current_user.username)
+    if not expand:
+        return track_ids
+    # Full track records for the pinned ids, straight from the snapshot's id index
+    snapshot = await require_snapshot()
+    return json_bytes_response(request, build_records_body(snapshot, track_ids))
 
 @app.post("/api/wishlist")
 async def post_wishlist(update: WishlistUpdate, current_user: User = Depends(get_current_user)):
-    return update_wishlist(current_user.username, update.track_id, update.action)
+    return await run_in_threadpool(update_wishlist, current_user.username, update.track_id, update.action)
+
+@app.post("/api/wishlist/bulk")
+async def post_wishlist_bulk(update: WishlistBulkUpdate, current_user: User = Depends(get_current_user)):
+    if len(update.add) + len(update.remove) > 1000:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="At most 1000 track ids per request")
+    return await run_in_threadpool(bulk_update_wishlist, current_user.username, update.add, update.remove)
+
+PIPELINE_POLL_SECONDS = 2.0
+
+@app.get("/api/pipeline/status")
+async def read_pipeline_status(
+    limit: int = Query(20, ge=1, le=200),
+    current_user: User = Depends(get_current_user)
+):
+    return await run_in_threadpool(get_pipeline_status, limit)
+
+@app.get("/api/pipeline/status/stream")
+async def stream_pipeline_status(
+    request: Request,
+    limit: int = Query(20, ge=1, le=200),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Server-sent `status` events whenever the ledger changes, plus a keep-alive otherwise.
+    """
+    async def events():
+        last_state = None
+        last_sent = time.monotonic()
+        while not await request.is_disconnected():
+            status_data = await run_in_threadpool(get_pipeline_status, limit)
+            # Compare without the derived, time-dependent fields
+            state = [(run["run_id"], run["status"], run["updated_at"]) for run in status_data["runs"]]
+            if state != last_state:
+                yield b"event: status\ndata: " + json.dumps(status_data).encode("utf-8") + b"\n\n"
+                last_state = state
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= CHANGE_HEARTBEAT_SECONDS:
+                yield b": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(PIPELINE_POLL_SECONDS)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics(request: Request):
+    """
+    Prometheus text format: per-route latency and response sizes, snapshot rebuilds,
+    cache hits and misses, RSS and event-loop lag for this worker.
+    """
+    if METRICS_TOKEN:
+        supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not secrets.compare_digest(supplied, METRICS_TOKEN):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/api/health")
 async def root():
-    return {"message": "MP Intelligence API is LIVE", "status": "Ready"}
+    # Liveness: always 200 while the process is serving; readiness is /api/ready
+    return {
+        "message": "MP Intelligence API is LIVE",
+        "status": "Ready" if warmup.ready else "Warming up",
+        "event_loop_lag": loop_lag.stats()
+    }
+
+@app.get("/api/ready")
+async def read_readiness():
+    """
+    Startup/readiness probe: 200 once the track snapshot, user store and wishlist database
+    are loaded, 503 before. The body lists each warm-up stage with its status and timing.
+    """
+    warmup.retry_failed()
+    state = warmup.describe()
+    snapshot = await run_in_threadpool(get_tracks_snapshot) if warmup.ready else None
+    if snapshot is not None:
+        state["snapshot"] = {
+            "etag": snapshot.payload.etag,
+            "rows": len(snapshot.row_json),
+            "built_at": snapshot.built_at,
+            "age_seconds": round(time.time() - snapshot.built_at, 1),
+        }
+    code = status.HTTP_200_OK if warmup.ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    return Response(content=json.dumps(state), status_code=code, media_type="application/json",
+                    headers={"Cache-Control": "no-store"})
 
 # Serve Frontend Static Files
 from fastapi.staticfiles import StaticFiles
-import os
 
 # Important: Mount static files AFTER API routes to avoid conflicts
 if os.path.exists("static"):
@@ -0,0 +1,277 @@
+import asyncio
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+class LoopLagMonitor:
+    """
+    Measures event-loop lag: how late a timer wakes up compared to when it was due.
+    Anything blocking the loop (a CSV parse, bcrypt, file I/O) shows up here directly.
+    """
+    def __init__(self, interval: float = 0.5, window: int = 120, stall_threshold: float = 0.1):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.samples = deque(maxlen=window) # Most recent lags in seconds
+        self.current = 0.0
+        self.max = 0.0
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled - self.interval)
+            self.current = lag
+            self.max = max(self.max, lag)
+            self.samples.append(lag)
+            if lag >= self.stall_threshold:
+                self.stalls += 1
+                print(f"WARNING: Event loop stalled for {lag * 1000:.0f} ms")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        recent = sorted(self.samples)
+        p99 = recent[min(len(recent) - 1, int(len(recent) * 0.99))] if recent else 0.0
+        return {
+            "current_ms": round(self.current * 1000, 2),
+            "recent_max_ms": round((recent[-1] if recent else 0.0) * 1000, 2),
+            "recent_p99_ms": round(p99 * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+            "stalls": self.stalls,
+        }
+
+loop_lag = LoopLagMonitor()
+
+# Prometheus text exposition (format 0.0.4), kept dependency-free like the loop monitor above.
+# Metrics are per process: with WEB_CONCURRENCY > 1 each scrape sees one worker's counts.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+REBUILD_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, '', value) for key, value in sorted(self._values.items())]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{_labels(self.label_names, key, extra)} {_number(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """
+    Either set explicitly or read from `source()` at scrape time.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), source: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labels)
+        self.source = source
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        if self.source is not None:
+            value = self.source()
+            return [] if value is None else [(self.name, (), '', value)]
+        return super().samples()
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in sorted(self._values.items())]
+        samples = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                samples.append((f"{self.name}_bucket", key, f'le="{_number(bound)}"', cumulative))
+            samples.append((f"{self.name}_sum", key, '', total))
+            samples.append((f"{self.name}_count", key, '', count))
+        return samples
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def process_rss_bytes() -> Optional[int]:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # No procfs (e.g. macOS dev machines): peak RSS is the closest stand-in
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+        except ImportError:
+            return None
+
+PROCESS_START_TIME = time.time()
+
+registry = MetricsRegistry()
+http_request_duration = registry.register(Histogram(
+    'mp_http_request_duration_seconds', 'Time from request start to the last body byte, per route template.',
+    ('method', 'route', 'status')))
+http_response_size = registry.register(Histogram(
+    'mp_http_response_size_bytes', 'Response body size on the wire (after compression), per route template.',
+    ('method', 'route'), buckets=SIZE_BUCKETS))
+http_requests_in_flight = registry.register(Gauge(
+    'mp_http_requests_in_flight', 'Requests currently being served, including open event streams.'))
+http_requests_in_flight.set(0)
+snapshot_rebuilds = registry.register(Counter(
+    'mp_snapshot_rebuilds_total', 'Rebuilds of in-memory snapshots after their source file changed.',
+    ('snapshot', 'result')))
+snapshot_rebuild_duration = registry.register(Histogram(
+    'mp_snapshot_rebuild_duration_seconds', 'Wall time of snapshot rebuilds.',
+    ('snapshot',), buckets=REBUILD_BUCKETS))
+cache_lookups = registry.register(Counter(
+    'mp_cache_lookups_total', 'Cache lookups by outcome; hit ratio = hit / (hit + miss).',
+    ('cache', 'result')))
+registry.register(Gauge('mp_process_resident_memory_bytes', 'Resident set size of this worker.', source=process_rss_bytes))
+registry.register(Gauge('mp_process_start_time_seconds', 'Start time of this worker since the Unix epoch.',
+                        source=lambda: PROCESS_START_TIME))
+registry.register(Gauge('mp_event_loop_lag_seconds', 'Latest event-loop lag sample.', source=lambda: loop_lag.current))
+registry.register(Gauge('mp_event_loop_stalls', 'Event-loop lags above the stall threshold since start.',
+                        source=lambda: loop_lag.stalls))
+
+def record_cache(cache: str, hit: bool, stale: bool = False):
+    # 'stale': a miss answered from the previous generation while it is rebuilt
+    cache_lookups.inc(cache=cache, result='stale' if stale else 'hit' if hit else 'miss')
+
+def record_rebuild(snapshot: str, seconds: float, ok: bool = True):
+    snapshot_rebuilds.inc(snapshot=snapshot, result='success' if ok else 'error')
+    snapshot_rebuild_duration.observe(seconds, snapshot=snapshot)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request and measuring its body size, labelled by the
+    matched route template (e.g. /api/tracks/{track_id}/shape) to keep label cardinality bounded.
+    Pure ASGI rather than BaseHTTPMiddleware so streamed and file responses pass through untouched.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        declared_size = None
+        sent_size = 0
+
+        async def send_with_metrics(message):
+            nonlocal status_code, declared_size, sent_size
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                for name, value in message.get('headers', []):
+                    if name.lower() == b'content-length':
+                        declared_size = int(value)
+            elif message['type'] == 'http.response.body':
+                sent_size += len(message.get('body', b''))
+            await send(message)
+
+        http_requests_in_flight.inc(1)
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            http_requests_in_flight.inc(-1)
+            route = scope.get('route')
+            if route is not None and getattr(route, 'path', None):
+                template = route.path
+            elif not scope['path'].startswith('/api/'):
+                template = 'static'
+            else:
+                template = 'unmatched'
+            method = scope['method']
+            http_request_duration.observe(time.perf_counter() - start, method=method, route=template, status=str(status_code))
+            # Files sent via pathsend never pass through as body messages
+            http_response_size.observe(max(sent_size, declared_size or 0), method=method, route=template)
@@ -0,0 +1,232 @@
+import gzip
+import hashlib
+import json
+import struct
+import threading
+import zlib
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip is always available
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib encoder produces the same JSON, slower
+    orjson = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 9 # 11 is ~40x slower for a few % smaller bodies
+
+def dumps_json(obj) -> bytes:
+    """
+    Compact UTF-8 JSON. Callers map NaN/inf to None first; orjson would emit null anyway.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+
+class EncodedPayload:
+    """
+    A response body serialized once, kept alongside its gzip/brotli variants and ETag.
+    """
+    def __init__(self, body: bytes, media_type: str = "application/json", br: bool = True):
+        self.media_type = media_type
+        self.identity = body
+        self.gzip = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        # br=False defers brotli to compress_br(); gzip is served until then
+        self.br = brotli.compress(body, quality=BROTLI_QUALITY) if brotli is not None and br else None
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+
+    def compress_br(self):
+        if brotli is not None and self.br is None:
+            self.br = brotli.compress(self.identity, quality=BROTLI_QUALITY)
+
+    @classmethod
+    def from_encoded(cls, identity, gzip_body, br_body, etag: str, media_type: str = "application/json"):
+        """
+        Wraps bodies that were encoded elsewhere (e.g. memory-mapped from a shared snapshot).
+        """
+        payload = cls.__new__(cls)
+        payload.media_type = media_type
+        payload.identity = identity
+        payload.gzip = gzip_body
+        payload.br = br_body
+        payload.etag = etag
+        return payload
+
+    def variant(self, accept_encoding: str):
+        """
+        Picks the smallest body the client accepts: (body, content-encoding or None).
+        """
+        accepted = parse_accept_encoding(accept_encoding)
+        if self.br is not None and "br" in accepted:
+            return self.br, "br"
+        if "gzip" in accepted:
+            return self.gzip, "gzip"
+        return self.identity, None
+
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff' # No name, mtime 0, unknown OS
+_DEFLATE_END = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS).flush() # Empty final block
+
+class ChunkedPayload(EncodedPayload):
+    """
+    A large body produced as a sequence of pieces, e.g. runs of pre-encoded rows.
+    The gzip body is built pigz-style: every piece is deflated on its own and sync-flushed, and
+    the results are spliced into one gzip member. Pieces are keyed by their SHA-1, and ones that
+    also occur in `previous` reuse its deflated bytes, so a new generation only recompresses
+    what changed. The identity body is joined only when a client asks for it; brotli cannot be
+    spliced and waits for compress_br(). The ETag is the SHA-1 over the piece digests.
+    """
+    def __init__(self, pieces: Callable[[], Iterable[bytes]], previous: Optional[EncodedPayload] = None,
+                 media_type: str = "application/json"):
+        self.media_type = media_type
+        self.pieces = pieces
+        self.br = None
+        self._identity = None
+        self._lock = threading.Lock()
+
+        reusable = previous.piece_index() if isinstance(previous, ChunkedPayload) else {}
+        crc, size, digests = 0, 0, []
+        out, offsets = [_GZIP_HEADER], [len(_GZIP_HEADER)]
+        for piece in pieces():
+            digest = hashlib.sha1(piece).digest()
+            crc = zlib.crc32(piece, crc)
+            size += len(piece)
+            i = reusable.get(digest)
+            if i is not None:
+                deflated = previous.gzip[int(previous.gzip_offsets[i]):int(previous.gzip_offsets[i + 1])]
+            else:
+                compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+                deflated = compressor.compress(piece) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            digests.append(digest)
+            out.append(deflated)
+            offsets.append(offsets[-1] + len(deflated))
+        out.append(_DEFLATE_END + struct.pack('<II', crc, size & 0xFFFFFFFF))
+        self.gzip = b''.join(out)
+        self.digests = b''.join(digests) # 20 bytes per piece
+        self.gzip_offsets = np.array(offsets, dtype=np.int64) # Piece i is gzip[offsets[i]:offsets[i + 1]]
+        self.etag = hashlib.sha1(self.digests).hexdigest()[:20]
+        self._index = None
+
+    @classmethod
+    def from_parts(cls, pieces, identity, gzip_body, br_body, digests, gzip_offsets, etag: str,
+                   media_type: str = "application/json"):
+        """
+        Wraps a payload that was encoded elsewhere (e.g. memory-mapped from a shared snapshot).
+        """
+        payload = cls.__new__(cls)
+        payload.media_type = media_type
+        payload.pieces = pieces
+        payload._identity = identity
+        payload._lock = threading.Lock()
+        payload.gzip = gzip_body
+        payload.br = br_body
+        payload.digests = digests
+        payload.gzip_offsets = gzip_offsets
+        payload.etag = etag
+        payload._index = None
+        return payload
+
+    def piece_index(self) -> dict:
+        """
+        Piece digest -> piece number, for reuse by the next generation.
+        """
+        if self._index is None:
+            digests = bytes(self.digests)
+            self._index = {digests[i:i + 20]: i // 20 for i in range(0, len(digests), 20)}
+        return self._index
+
+    @property
+    def identity(self) -> bytes:
+        if self._identity is None:
+            with self._lock:
+                if self._identity is None:
+                    self._identity = b''.join(self.pieces())
+        return self._identity
+
+    def compress_br(self):
+        if brotli is None or self.br is not None:
+            return
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        out = [compressor.process(piece) for piece in self.pieces()]
+        out.append(compressor.finish())
+        self.br = b''.join(out)
+
+def parse_accept_encoding(header: Optional[str]) -> set:
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        # Honour explicit refusals such as "gzip;q=0"
+        q = params.strip().replace(" ", "")
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding)
+    if "*" in accepted:
+        accepted.update({"br", "gzip"})
+    return accepted
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison as required for If-None-Match; ignores the per-encoding suffix.
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate.split("-", 1)[0] == etag:
+            return True
+    return False
+
+def payload_response(request: Request, payload: EncodedPayload, cache_control: str = "private, no-cache") -> Response:
+    """
+    Serves a pre-encoded payload, answering conditional requests with 304.
+    """
+    body, encoding = payload.variant(request.headers.get("accept-encoding"))
+    etag = f'"{payload.etag}-{encoding}"' if encoding else f'"{payload.etag}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), payload.etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=payload.media_type, headers=headers)
+
+def json_bytes_response(request: Request, body: bytes, min_size: int = 1024,
+                        etag: Optional[str] = None, cache_control: Optional[str] = None) -> Response:
+    """
+    For per-request JSON built from pre-encoded fragments: gzip on the fly when worthwhile.
+    """
+    headers = {"Vary": "Accept-Encoding"}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    if etag:
+        headers["ETag"] = f'"{etag}"'
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+    if len(body) >= min_size and "gzip" in parse_accept_encoding(request.headers.get("accept-encoding")):
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+        if etag:
+            headers["ETag"] = f'"{etag}-gzip"'
+    return Response(content=body, media_type="application/json", headers=headers)
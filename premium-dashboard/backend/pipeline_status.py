@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import time
+from typing import Optional
+
+from .data_service import DATA_DIR
+
+# Written by scripts/run_ledger.py (schema lives there)
+LEDGER_PATH = os.environ.get("MP_LEDGER_PATH", os.path.join(DATA_DIR, "pipeline_runs.db"))
+
+RATE_WINDOW_SECONDS = 10 * 60 # Recent throughput is measured over this window
+STALE_AFTER_SECONDS = 5 * 60 # A running job with no update for this long is flagged
+MAX_RUNS = 20
+
+def _connect() -> Optional[sqlite3.Connection]:
+    if not os.path.exists(LEDGER_PATH):
+        return None
+    # Read-only: the dashboard never writes to the scripts' ledger
+    conn = sqlite3.connect(f"file:{LEDGER_PATH}?mode=ro", uri=True, timeout=5.0)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _per_minute(processed_delta: float, seconds: float) -> Optional[float]:
+    if seconds <= 0:
+        return None
+    return round(processed_delta * 60 / seconds, 2)
+
+def describe_run(conn: sqlite3.Connection, run: sqlite3.Row, now: float) -> dict:
+    """
+    One ledger run with derived throughput: overall and recent rate per minute, ETA, staleness.
+    """
+    processed, total = run['processed'], run['total']
+    end = run['finished_at'] or now
+    rate = _per_minute(processed, end - run['started_at'])
+
+    recent_rate = None
+    eta_seconds = None
+    if run['status'] == 'running':
+        # Oldest sample inside the window vs. the latest state
+        first = conn.execute(
+            "SELECT at, processed FROM progress WHERE run_id = ? AND at >= ? ORDER BY at LIMIT 1",
+            (run['run_id'], now - RATE_WINDOW_SECONDS)
+        ).fetchone()
+        if first is not None and run['updated_at'] > first['at']:
+            recent_rate = _per_minute(processed - first['processed'], now - first['at'])
+        pace = recent_rate if recent_rate else rate
+        if total is not None and pace:
+            eta_seconds = round(max(0, total - processed) * 60 / pace)
+
+    stale = run['status'] == 'running' and now - run['updated_at'] > STALE_AFTER_SECONDS
+    return {
+        "run_id": run['run_id'],
+        "script": run['script'],
+        "host": run['host'],
+        "stage": run['stage'],
+        "status": "stale" if stale else run['status'],
+        "processed": processed,
+        "total": total,
+        "percent": round(100 * processed / total, 1) if total else None,
+        "errors": run['errors'],
+        "quota_state": run['quota_state'],
+        "message": run['message'],
+        "rate_per_min": rate,
+        "recent_rate_per_min": recent_rate,
+        "eta_seconds": eta_seconds,
+        "started_at": run['started_at'],
+        "updated_at": run['updated_at'],
+        "finished_at": run['finished_at'],
+        "seconds_since_update": round(now - run['updated_at'], 1),
+    }
+
+def get_pipeline_status(limit: int = MAX_RUNS) -> dict:
+    """
+    Active runs first, then the most recently updated finished ones.
+    """
+    now = time.time()
+    conn = None
+    try:
+        conn = _connect()
+        if conn is None:
+            return {"available": False, "generated_at": now, "active": 0, "runs": []}
+        rows = conn.execute(
+            "SELECT * FROM runs ORDER BY (status = 'running') DESC, updated_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        runs = [describe_run(conn, row, now) for row in rows]
+        return {
+            "available": True,
+            "generated_at": now,
+            "active": sum(1 for run in runs if run["status"] == "running"),
+            "runs": runs,
+        }
+    except sqlite3.Error as e:
+        print(f"WARNING: Could not read pipeline ledger {LEDGER_PATH}: {e}")
+        return {"available": False, "generated_at": now, "active": 0, "runs": [], "error": str(e)}
+    finally:
+        if conn is not None:
+            conn.close()
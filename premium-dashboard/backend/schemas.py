@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 
 class User(BaseModel):
@@ -17,22 +17,49 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
 
-class TrackDetail(BaseModel):
+class TrackRecord(BaseModel):
+    """
+    One track as served by /api/tracks and friends, keyed like the enriched CSV.
+    Also drives the column types the snapshot coerces to before encoding.
+    Enrichment columns not listed here are passed through untyped.
+    """
+    model_config = ConfigDict(extra='allow', populate_by_name=True)
+
     track_id: int
-    name: str
-    latitude: float
-    longitude: float
-    city: Optional[str] = None
-    country: Optional[str] = None
-    website: Optional[str] = None
-    is_indoor: bool
-    is_outdoor: bool
-    is_sim: bool
-    building_sqm: float
-    disposable_income_pps: float
+    Name: Optional[str] = None
+    Latitude: Optional[float] = None
+    Longitude: Optional[float] = None
+    City: Optional[str] = None
+    Country: Optional[str] = None
+    Website: Optional[str] = None
+    Category: Optional[str] = None
+    review_velocity: Optional[str] = Field(None, alias='Review Velocity') # A count, or "FAILED"
+    hero_image_url: Optional[str] = Field(None, alias='Hero Image URL')
+    management_issues: Optional[bool] = Field(None, alias='Management Issues')
+    structural_issues: Optional[bool] = Field(None, alias='Structural Issues')
+    owner_responds: Optional[bool] = Field(None, alias='Owner Responds')
+    top_reviews_snippet: Optional[str] = Field(None, alias='Top Reviews Snippet')
+    maps_url: Optional[str] = Field(None, alias='Maps URL')
+    official_website: Optional[str] = Field(None, alias='Official Website')
+    building_sqm: Optional[float] = None
+    b2b_density: Optional[float] = None
     catchment_area_size: Optional[float] = None
-    sentiment_summary: Optional[str] = None
+    is_indoor: bool = False
+    is_outdoor: bool = False
+    is_sim: bool = False
+    NUTS_ID: Optional[str] = None
+    NUTS_NAME: Optional[str] = None
+    disposable_income_pps: Optional[float] = None
+    wealth_data_year: Optional[str] = None
+    data_quality_score: Optional[float] = None
+    track_length_m: Optional[float] = None
+    website_track_length_m: Optional[float] = None
+    consolidated_track_length: float = 0
 
 class WishlistUpdate(BaseModel):
     track_id: int
     action: str # "add" or "remove"
+
+class WishlistBulkUpdate(BaseModel):
+    add: List[int] = []
+    remove: List[int] = []
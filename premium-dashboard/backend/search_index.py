@@ -0,0 +1,316 @@
+import bisect
+import re
+import unicodedata
+from collections import defaultdict
+from collections.abc import Sequence
+from typing import List, Optional
+
+import numpy as np
+
+# Field -> ranking weight. Matches in the name matter far more than a word in a review.
+SEARCH_FIELDS = {
+    'Name': 3.0,
+    'City': 2.0,
+    'NUTS_NAME': 1.5,
+    'Top Reviews Snippet': 0.5,
+}
+
+# Letters NFKD does not decompose into base letter + accent
+_FOLD_TABLE = str.maketrans({'ß': 'ss', 'ø': 'o', 'Ø': 'o', 'æ': 'ae', 'Æ': 'ae', 'œ': 'oe', 'Œ': 'oe',
+                             'ł': 'l', 'Ł': 'l', 'đ': 'd', 'Đ': 'd', 'ı': 'i'})
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+EXACT, PREFIX, INFIX = 1.0, 0.7, 0.4 # Match quality multipliers
+MAX_EXPANSIONS = 64 # Vocabulary terms a single query token may expand to
+MAX_CANDIDATES = 2000 # Postings a query scores, however many tracks match
+# Field bands, heaviest first: a term's postings are grouped by the best field it occurs in
+FIELD_BANDS = sorted(SEARCH_FIELDS, key=SEARCH_FIELDS.get, reverse=True)
+BAND_WEIGHTS = [SEARCH_FIELDS[field] for field in FIELD_BANDS]
+
+def fold_text(text) -> str:
+    """
+    Case- and accent-insensitive form: "Zürich", "ZURICH" and "zurich" all fold to "zurich".
+    """
+    if not isinstance(text, str):
+        return ''
+    if text.isascii():
+        return text.casefold() # Nothing to decompose; most rows take this path
+    decomposed = unicodedata.normalize('NFKD', text.translate(_FOLD_TABLE))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def tokenize(text) -> List[str]:
+    return _TOKEN.findall(fold_text(text))
+
+def _trigrams(term: str):
+    padded = f' {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class StringTable(Sequence):
+    """
+    Strings stored back to back as UTF-8 plus offsets. Sorted tables work with bisect directly
+    (UTF-8 byte order is code point order), and both arrays can be saved and memory-mapped.
+    """
+    def __init__(self, blob, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: List[str]):
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(b''.join(encoded), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[int(self.offsets[i]):int(self.offsets[i + 1])]).decode('utf-8')
+
+    def tolist(self) -> List[str]:
+        blob, offsets = bytes(self.blob), self.offsets.tolist()
+        return [blob[a:b].decode('utf-8') for a, b in zip(offsets, offsets[1:])]
+
+    def contains(self, needle: str) -> np.ndarray:
+        """
+        Mask of the strings containing `needle`, from one scan over the blob.
+        """
+        if not needle:
+            return np.ones(len(self), dtype=bool)
+        mask = np.zeros(len(self), dtype=bool)
+        pattern = re.compile(re.escape(needle.encode('utf-8')))
+        offsets = self.offsets
+        match = pattern.search(self.blob)
+        while match is not None:
+            row = int(np.searchsorted(offsets, match.start(), side='right')) - 1
+            end = int(offsets[row + 1])
+            if match.end() <= end:
+                mask[row] = True
+                match = pattern.search(self.blob, end) # One hit per string is enough
+            else:
+                match = pattern.search(self.blob, match.start() + 1) # Ran into the next string
+        return mask
+
+def index_rows(rows):
+    """
+    (terms, positions, bands) for every distinct (term, row) pair in `rows`, an iterable of
+    (position, record), with the band of the heaviest field the term occurs in.
+    The Python-level tokenizing here is the expensive part of a build.
+    """
+    terms, positions, bands = [], [], []
+    for pos, record in rows:
+        seen = set()
+        for band, field in enumerate(FIELD_BANDS):
+            for term in tokenize(record.get(field)):
+                if term not in seen:
+                    seen.add(term)
+                    terms.append(term)
+                    positions.append(pos)
+                    bands.append(band)
+    return terms, positions, bands
+
+class SearchIndex:
+    """
+    Inverted index over the text fields of a track snapshot, held in flat arrays:
+    a sorted vocabulary, postings grouped by (term, field band) with row positions ascending
+    inside each group, term trigrams for infix matches and the folded names in sorted order.
+
+    A query token expands to at most MAX_EXPANSIONS vocabulary terms (exact, prefix via binary
+    search, then infix via trigrams). Candidates are the best-scoring MAX_CANDIDATES postings of
+    the rarest token plus names starting with the query; every token is then scored on just those
+    by binary search. Per-keystroke work is bounded by these caps, not by the number of tracks,
+    and ranking is exact whenever the top groups fit in the candidate budget.
+    """
+    def __init__(self, vocabulary: StringTable, band_starts: np.ndarray, postings: np.ndarray,
+                 grams: StringTable, gram_starts: np.ndarray, gram_terms: np.ndarray,
+                 names: StringTable, name_order: np.ndarray, name_rank: np.ndarray):
+        self.vocabulary = vocabulary
+        self.band_starts = band_starts # (term * bands + band) -> start of that group in postings
+        self.postings = postings
+        self.grams = grams
+        self.gram_starts = gram_starts
+        self.gram_terms = gram_terms
+        self.names = names # Folded names, sorted
+        self.name_order = name_order # sorted name index -> row position
+        self.name_rank = name_rank # row position -> sorted name index
+
+    @classmethod
+    def build(cls, records: List[dict], names: Optional[List[str]] = None) -> 'SearchIndex':
+        """
+        `names` are the folded names of `records`, when the caller already has them.
+        """
+        terms, positions, bands = index_rows(enumerate(records))
+        vocabulary = sorted(set(terms))
+        ids = {term: i for i, term in enumerate(vocabulary)}
+        return cls.from_arrays(vocabulary, np.array([ids[term] for term in terms], dtype=np.int64),
+                               np.array(positions, dtype=np.int64), np.array(bands, dtype=np.int64),
+                               names if names is not None else [fold_text(r.get('Name')) for r in records])
+
+    def patched(self, reuse: np.ndarray, changed, names: List[str]) -> 'SearchIndex':
+        """
+        The index of a new generation in which row i is old row reuse[i], or, where reuse[i] < 0,
+        one of the `changed` (position, record) pairs. Postings of reused rows are renumbered
+        instead of re-tokenized, so a reload only tokenizes the rows that changed.
+        """
+        bands = len(BAND_WEIGHTS)
+        kept_rows = np.flatnonzero(reuse >= 0)
+        old_to_new = np.full(len(self.name_rank), -1, dtype=np.int64)
+        old_to_new[reuse[kept_rows]] = kept_rows
+        keys = np.repeat(np.arange(len(self.band_starts) - 1), np.diff(self.band_starts))
+        positions = old_to_new[self.postings]
+        keep = positions >= 0
+        keys, positions = keys[keep], positions[keep]
+        terms, fresh_positions, fresh_bands = index_rows(changed)
+
+        old_vocabulary = self.vocabulary.tolist()
+        used = np.zeros(len(old_vocabulary), dtype=bool)
+        used[keys // bands] = True
+        vocabulary = sorted({term for term, u in zip(old_vocabulary, used.tolist()) if u}.union(terms))
+        ids = {term: i for i, term in enumerate(vocabulary)}
+        trigrams = None
+        if vocabulary == old_vocabulary:
+            trigrams = (self.grams, self.gram_starts, self.gram_terms)
+        else:
+            remap = np.array([ids.get(term, -1) for term in old_vocabulary], dtype=np.int64)
+            keys = remap[keys // bands] * bands + keys % bands
+        return self.from_arrays(
+            vocabulary,
+            np.concatenate([keys // bands, np.array([ids[term] for term in terms], dtype=np.int64)]),
+            np.concatenate([positions, np.array(fresh_positions, dtype=np.int64)]),
+            np.concatenate([keys % bands, np.array(fresh_bands, dtype=np.int64)]),
+            names, trigrams)
+
+    @classmethod
+    def from_arrays(cls, vocabulary: List[str], term_ids: np.ndarray, positions: np.ndarray,
+                    bands: np.ndarray, names: List[str], trigrams: Optional[tuple] = None) -> 'SearchIndex':
+        """
+        Builds the index from one entry per (term, row) pair; `vocabulary` is sorted and indexed by term_ids.
+        `trigrams` reuses (grams, gram_starts, gram_terms) of an index with the same vocabulary.
+        """
+        groups = len(vocabulary) * len(BAND_WEIGHTS)
+        keys = term_ids * len(BAND_WEIGHTS) + bands
+        band_starts = np.zeros(groups + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=groups), out=band_starts[1:])
+        # One combined sort key; a stable sort is near linear when most entries arrive in order
+        order = np.argsort(keys * (len(names) + 1) + positions, kind='stable')
+        postings = positions[order].astype(np.int32)
+
+        if trigrams is None:
+            by_gram = defaultdict(list)
+            for term_id, term in enumerate(vocabulary):
+                for gram in _trigrams(term):
+                    by_gram[gram].append(term_id)
+            gram_list = sorted(by_gram)
+            gram_starts = np.zeros(len(gram_list) + 1, dtype=np.int64)
+            np.cumsum([len(by_gram[g]) for g in gram_list], out=gram_starts[1:])
+            gram_terms = np.fromiter((t for g in gram_list for t in by_gram[g]), dtype=np.int32, count=int(gram_starts[-1]))
+            trigrams = (StringTable.from_strings(gram_list), gram_starts, gram_terms)
+
+        name_order = np.array(sorted(range(len(names)), key=names.__getitem__), dtype=np.int32)
+        name_rank = np.empty(len(names), dtype=np.int32)
+        name_rank[name_order] = np.arange(len(names), dtype=np.int32)
+        return cls(StringTable.from_strings(vocabulary), band_starts, postings, *trigrams,
+                   StringTable.from_strings([names[i] for i in name_order]), name_order, name_rank)
+
+    def name_ranks(self) -> np.ndarray:
+        """
+        Dense rank of each row's folded name: equal names share a rank, so sorting by it is a name sort.
+        """
+        names = self.names.tolist()
+        first = np.fromiter((i == 0 or names[i] != names[i - 1] for i in range(len(names))), dtype=bool, count=len(names))
+        ranks = np.empty(len(names), dtype=np.int32)
+        ranks[self.name_order] = np.cumsum(first) - 1
+        return ranks
+
+    def _expand(self, token: str):
+        """
+        [(term id, match quality)] for one query token.
+        """
+        vocabulary = self.vocabulary
+        matches = []
+        start = bisect.bisect_left(vocabulary, token)
+        for term_id in range(start, min(start + MAX_EXPANSIONS, len(vocabulary))):
+            term = vocabulary[term_id]
+            if not term.startswith(token):
+                break
+            matches.append((term_id, EXACT if term == token else PREFIX))
+        if not matches and len(token) >= 3:
+            # Infix fallback, e.g. "kart" inside "gokartbahn"
+            lists = []
+            for gram in _trigrams(token):
+                if ' ' in gram:
+                    continue
+                i = bisect.bisect_left(self.grams, gram)
+                if i == len(self.grams) or self.grams[i] != gram:
+                    return []
+                lists.append(self.gram_terms[self.gram_starts[i]:self.gram_starts[i + 1]])
+            lists.sort(key=len)
+            candidates = lists[0]
+            for other in lists[1:]:
+                candidates = np.intersect1d(candidates, other, assume_unique=True)
+            hits = [t for t in candidates[:MAX_CANDIDATES].tolist() if token in vocabulary[t]]
+            hits.sort(key=lambda t: len(vocabulary[t]))
+            matches = [(t, INFIX) for t in hits[:MAX_EXPANSIONS]]
+        return matches
+
+    def _groups(self, token: str):
+        """
+        [(score, start, end)] posting groups for one query token, best score first.
+        """
+        bands = len(BAND_WEIGHTS)
+        groups = []
+        for term_id, quality in self._expand(token):
+            bounds = self.band_starts[term_id * bands:term_id * bands + bands + 1].tolist()
+            for band, weight in enumerate(BAND_WEIGHTS):
+                if bounds[band + 1] > bounds[band]:
+                    groups.append((weight * quality, bounds[band], bounds[band + 1]))
+        groups.sort(key=lambda group: -group[0])
+        return groups
+
+    def search(self, query: str, limit: int = 10):
+        """
+        Top-`limit` (position, score) pairs; every query token must match some field.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        per_token = [self._groups(token) for token in dict.fromkeys(tokens)]
+        if not all(per_token):
+            return []
+        # Rarest token first: it supplies the candidates
+        per_token.sort(key=lambda groups: sum(end - start for _, start, end in groups))
+
+        chunks, budget = [], MAX_CANDIDATES
+        for _, start, end in per_token[0]:
+            take = min(end - start, budget)
+            chunks.append(self.postings[start:start + take])
+            budget -= take
+            if budget == 0:
+                break
+        # Names starting with the whole query get a bonus, so they must be candidates too
+        phrase = ' '.join(tokens)
+        lo = bisect.bisect_left(self.names, phrase)
+        hi = bisect.bisect_left(self.names, phrase + '\U0010ffff')
+        chunks.append(self.name_order[lo:min(hi, lo + MAX_CANDIDATES)])
+        candidates = np.unique(np.concatenate(chunks))
+
+        totals = np.zeros(len(candidates))
+        for groups in per_token:
+            best = np.zeros(len(candidates))
+            for score, start, end in groups:
+                # Groups come best first, so a candidate's first hit is its score for this token
+                open_ = np.flatnonzero(best == 0)
+                if not len(open_):
+                    break
+                segment = self.postings[start:end]
+                at = np.minimum(np.searchsorted(segment, candidates[open_]), len(segment) - 1)
+                best[open_[segment[at] == candidates[open_]]] = score
+            matched = best > 0
+            candidates, totals = candidates[matched], totals[matched] + best[matched]
+            if not len(candidates):
+                return []
+
+        ranks = self.name_rank[candidates]
+        totals[(ranks >= lo) & (ranks < hi)] += SEARCH_FIELDS['Name']
+        top = np.lexsort((candidates, -totals))[:limit]
+        return [(int(candidates[i]), float(totals[i])) for i in top]
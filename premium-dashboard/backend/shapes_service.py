@@ -0,0 +1,483 @@
+import gzip
+import hashlib
+import json
+import shutil
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from .data_service import GEOJSON_PATH, file_signature
+import numpy as np
+
+from .geometry import (
+    LOD_LEVELS, simplify_geometries, array_rings, coordinate_lists, geometry_bbox, tile_bounds, clip_and_quantize, lod_level_for
+)
+from .payloads import EncodedPayload, parse_accept_encoding, brotli, dumps_json, GZIP_LEVEL, BROTLI_QUALITY
+from .monitoring import record_cache
+from .snapshot_cache import SnapshotCache
+from .shared_snapshot import private_dir
+
+_FEATURES_ARRAY = re.compile(rb'"features"\s*:\s*\[')
+_STRUCTURE = re.compile(rb'[{}"]')
+_STRING_TAIL = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_SEPARATORS = re.compile(rb'[\s,]*')
+SCAN_CHUNK_SIZE = 4 * 1024 * 1024
+SIMPLIFY_BATCH_SIZE = 512 # Features simplified per vectorized pass
+
+# Simplified LOD collections are written once per shapes generation and streamed from here.
+# Per user and created 0700 by private_dir(): another local user must not plant files we serve.
+SHAPES_CACHE_DIR = os.environ.get("MP_SHAPES_CACHE_DIR") or os.path.join(tempfile.gettempdir(), f"mp-shapes-{os.getuid()}")
+KEEP_GENERATIONS = 2
+COLLECTION_HEAD = b'{"type":"FeatureCollection","features":['
+COLLECTION_TAIL = b']}'
+
+def shapes_etag(signature) -> str:
+    return hashlib.sha1(repr(signature).encode()).hexdigest()[:20]
+
+class ShapeIndex:
+    """
+    Maps track_id -> location of its isochrone feature inside karting_shapes.geojson, and of its
+    simplified copies inside one FeatureCollection file per LOD level. Features are read back with
+    a single pread and collections are streamed from disk, so no geometry is held in memory.
+    """
+    def __init__(self, signature, track_ids: List[str], spans: np.ndarray,
+                 lod_files: list, lod_paths: List[str], lod_spans: np.ndarray, bboxes: np.ndarray, digests: bytes):
+        self.signature = signature
+        self.track_ids = track_ids
+        self.positions = {track_id: i for i, track_id in enumerate(track_ids)}
+        self.spans = spans # (features, 2): byte offset and length in the shapes file
+        # Kept open, so pruning or republishing the generation directory never pulls them away
+        self.lod_files = lod_files
+        self.lod_paths = lod_paths
+        self.lod_spans = lod_spans # (levels, features, 2): byte offset and length in each level's file
+        # Feature extents (NaN without geometry), so picking the features under a tile is one vectorized test
+        self.bbox_array = bboxes
+        self.digests = digests # SHA-1 of each feature's bytes, 20 per feature
+        self._feature_index = None
+        self.etag = shapes_etag(signature)
+        self.built_at = time.time()
+
+    def feature_index(self) -> dict:
+        """
+        Feature digest -> position, so the next generation can reuse unchanged features' LOD copies.
+        """
+        if self._feature_index is None:
+            digests = self.digests
+            self._feature_index = {digests[i:i + 20]: i // 20 for i in range(0, len(digests), 20)}
+        return self._feature_index
+
+    def lod_blobs(self, i: int) -> List[bytes]:
+        return [os.pread(f.fileno(), int(length), int(offset)) for f, (offset, length) in zip(self.lod_files, self.lod_spans[:, i])]
+
+    def lod_etag(self, level: int) -> str:
+        return hashlib.sha1(f"{self.etag}:{level}".encode()).hexdigest()[:20]
+
+    def __len__(self):
+        return len(self.track_ids)
+
+def _feature_track_id(feature: dict) -> Optional[str]:
+    # Same lookup the frontend used: properties.track_id, falling back to feature.id
+    fid = (feature.get('properties') or {}).get('track_id', feature.get('id'))
+    return None if fid is None else str(fid)
+
+def encode_feature(feature: dict) -> bytes:
+    return dumps_json(feature)
+
+def feature_collection(encoded_features) -> bytes:
+    return COLLECTION_HEAD + b','.join(encoded_features) + COLLECTION_TAIL
+
+def simplify_levels(features: List[dict]) -> List[List[bytes]]:
+    """
+    Encoded copies of each feature for every LOD level, each simplified from the next finer one.
+    Every level is one vectorized pass over all rings of the batch (see simplify_geometries).
+    A geometry that collapses at a coarse level keeps the finer shape instead of vanishing.
+    """
+    encoded = [[None] * len(LOD_LEVELS) for _ in features]
+    geometries = [feature.get('geometry') for feature in features]
+    for level in reversed(range(len(LOD_LEVELS))):
+        simplified = simplify_geometries(geometries, LOD_LEVELS[level][1])
+        geometries = [new or old for new, old in zip(simplified, geometries)]
+        for blobs, feature, geometry in zip(encoded, features, geometries):
+            blobs[level] = encode_feature({**feature, 'geometry': coordinate_lists(geometry)})
+    return encoded
+
+def _object_end(buf: bytes, start: int) -> int:
+    """
+    Offset just past the JSON object opening at buf[start], or -1 if buf ends inside it.
+    Only braces and strings matter, so the regexes skip over coordinate arrays in C.
+    """
+    depth, pos = 0, start
+    while True:
+        match = _STRUCTURE.search(buf, pos)
+        if match is None:
+            return -1
+        if match.group() == b'"':
+            tail = _STRING_TAIL.match(buf, match.end())
+            if tail is None:
+                return -1
+            pos = tail.end()
+            continue
+        depth += 1 if match.group() == b'{' else -1
+        pos = match.end()
+        if depth == 0:
+            return pos
+
+def iter_features(f, chunk_size: int = SCAN_CHUNK_SIZE):
+    """
+    Yields (byte offset, encoded feature) for each element of the top-level features array.
+    The file is read in chunks, so memory stays at about one chunk whatever the file size.
+    """
+    buf, base, pos = b'', 0, 0 # base: file offset of buf[0]
+
+    def more() -> bool:
+        nonlocal buf, base, pos
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return False
+        buf, base, pos = buf[pos:] + chunk, base + pos, 0
+        return True
+
+    while True:
+        match = _FEATURES_ARRAY.search(buf)
+        if match is not None:
+            pos = match.end()
+            break
+        if not more():
+            return
+    while True:
+        pos = _SEPARATORS.match(buf, pos).end()
+        if pos == len(buf):
+            if not more():
+                raise ValueError("GeoJSON ends inside the features array")
+            continue
+        if buf[pos:pos + 1] == b']':
+            return
+        if buf[pos:pos + 1] != b'{':
+            raise ValueError(f"Expected a feature object at byte {base + pos}")
+        end = _object_end(buf, pos)
+        if end < 0:
+            if not more():
+                raise ValueError("GeoJSON ends inside a feature")
+            continue
+        yield base + pos, buf[pos:end]
+        pos = end
+
+def _prune_generations(keep: str):
+    generations = []
+    for name in os.listdir(SHAPES_CACHE_DIR):
+        path = os.path.join(SHAPES_CACHE_DIR, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        generations.append((os.path.getmtime(path), path))
+    generations.sort(reverse=True)
+    for _, path in generations[KEEP_GENERATIONS:]:
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+def build_shape_index(path: str, signature, previous: Optional[ShapeIndex] = None) -> ShapeIndex:
+    """
+    Streams the features array one feature at a time, records where each one lives and appends
+    its simplified copies to the LOD level files of this generation. Features whose bytes are
+    unchanged since `previous` copy its LOD blobs; only new or edited ones are simplified.
+    """
+    final_dir = os.path.join(SHAPES_CACHE_DIR, shapes_etag(signature))
+    tmp_dir = os.path.join(SHAPES_CACHE_DIR, f".{os.path.basename(final_dir)}.{os.getpid()}.tmp")
+    private_dir(SHAPES_CACHE_DIR)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    names = [f"lod{level}.geojson" for level in range(len(LOD_LEVELS))]
+    lod_files = [open(os.path.join(tmp_dir, name), 'w+b') for name in names]
+    try:
+        track_ids, spans, bboxes, digests = [], [], [], []
+        lod_spans = [[] for _ in LOD_LEVELS]
+        written = [f.write(COLLECTION_HEAD) for f in lod_files]
+        seen = set()
+        reusable = previous.feature_index() if previous is not None else {}
+        batch = [] # [span, digest, track_id, feature or None, LOD blobs, bbox], in file order
+
+        def flush():
+            fresh = [entry for entry in batch if entry[4] is None]
+            for entry, blobs in zip(fresh, simplify_levels([entry[3] for entry in fresh])):
+                entry[4] = blobs
+            for span, digest, track_id, _, blobs, bbox in batch:
+                for level, blob in enumerate(blobs):
+                    if track_ids:
+                        written[level] += lod_files[level].write(b',')
+                    lod_spans[level].append((written[level], len(blob)))
+                    written[level] += lod_files[level].write(blob)
+                track_ids.append(track_id)
+                spans.append(span)
+                digests.append(digest)
+                bboxes.append(bbox)
+            batch.clear()
+
+        with open(path, 'rb') as f:
+            for offset, raw in iter_features(f):
+                digest = hashlib.sha1(raw).digest()
+                i = reusable.get(digest)
+                if i is not None:
+                    track_id, feature = previous.track_ids[i], None
+                else:
+                    feature = json.loads(raw)
+                    track_id = _feature_track_id(feature)
+                # First feature wins, as with the old client-side `features.find(...)`
+                if track_id is None or track_id in seen:
+                    continue
+                seen.add(track_id)
+                if i is not None:
+                    batch.append([(offset, len(raw)), digest, track_id, None, previous.lod_blobs(i), tuple(previous.bbox_array[i])])
+                else:
+                    feature['geometry'] = array_rings(feature.get('geometry'))
+                    bbox = geometry_bbox(feature['geometry']) or (np.nan,) * 4
+                    batch.append([(offset, len(raw)), digest, track_id, feature, None, bbox])
+                if len(batch) >= SIMPLIFY_BATCH_SIZE:
+                    flush()
+            flush()
+        for level_file in lod_files:
+            level_file.write(COLLECTION_TAIL)
+            level_file.flush()
+        # A rewrite during the scan leaves spans pointing into two different files
+        if file_signature(path) != signature:
+            raise ValueError(f"{path} changed while it was being indexed")
+    except BaseException:
+        for level_file in lod_files:
+            level_file.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, final_dir)
+    except OSError:
+        # Another worker published the same generation meanwhile; its files are identical
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    _prune_generations(keep=final_dir)
+    return ShapeIndex(
+        signature, track_ids,
+        np.array(spans, dtype=np.int64).reshape(-1, 2),
+        lod_files, [os.path.join(final_dir, name) for name in names],
+        np.array(lod_spans, dtype=np.int64).reshape(len(LOD_LEVELS), -1, 2),
+        np.array(bboxes, dtype=float).reshape(-1, 4),
+        b''.join(digests),
+    )
+
+def _build_shapes(signature, previous: Optional[ShapeIndex]) -> ShapeIndex:
+    start = time.perf_counter()
+    index = build_shape_index(GEOJSON_PATH, signature, previous)
+    print(f"SUCCESS: Indexed {len(index)} isochrone features in {time.perf_counter() - start:.2f}s")
+    return index
+
+# Indexing a large shapes file takes minutes; the previous index serves meanwhile. Optional: on a cold
+# start requests get None (and a 503) instead of each holding a thread until the first index is built.
+_shape_cache = SnapshotCache('shapes', 'shape_index', _build_shapes, required=False)
+
+def get_shape_index(wait: bool = False) -> Optional[ShapeIndex]:
+    """
+    Returns the feature index, rebuilding it (once, in the background) when the shapes file's
+    mtime or size changed. None while the first index is being built, unless `wait`.
+    """
+    if not os.path.exists(GEOJSON_PATH):
+        print(f"WARNING: GeoJSON not found at {GEOJSON_PATH}")
+        return None
+    try:
+        signature = file_signature(GEOJSON_PATH)
+    except OSError as e:
+        print(f"WARNING: Could not stat {GEOJSON_PATH}: {e}")
+        return _shape_cache.current
+    return _shape_cache.get(signature, wait=wait)
+
+def shape_index_building() -> bool:
+    """
+    True while an index is being built, e.g. get_shape_index() returned None on a cold start.
+    """
+    return _shape_cache.building
+
+def read_feature(index: ShapeIndex, track_id: str, level: Optional[int] = None) -> Optional[bytes]:
+    """
+    Returns one encoded GeoJSON feature, or None if the track has no isochrone.
+    `level` selects a simplified LOD copy; None reads the original geometry.
+    """
+    i = index.positions.get(track_id)
+    if i is None:
+        return None
+    if level is None:
+        offset, length = index.spans[i]
+        with open(GEOJSON_PATH, 'rb') as f:
+            blob = os.pread(f.fileno(), int(length), int(offset))
+        if file_signature(GEOJSON_PATH) == index.signature:
+            return blob
+        # The enrichment script rewrote the file, so these offsets are meaningless until the background
+        # re-index swaps in. Serve this generation's finest LOD copy (its own files) rather than nothing.
+        level = len(LOD_LEVELS) - 1
+    offset, length = index.lod_spans[level, i]
+    return os.pread(index.lod_files[level].fileno(), int(length), int(offset))
+
+# Pre-compressed siblings of the shapes file, in order of preference
+COMPRESSED_SIBLINGS = [('br', '.br'), ('gzip', '.gz')]
+COPY_CHUNK_SIZE = 1024 * 1024
+
+_compressing = set()
+_compressing_lock = threading.Lock()
+
+def sibling_is_fresh(path: str, sibling: str) -> bool:
+    # Siblings carry the source's mtime, so any rewrite of the source makes them stale
+    try:
+        return os.stat(sibling).st_mtime_ns == os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+def compress_file(path: str, encoding: str) -> str:
+    """
+    Streams `path` into its .gz/.br sibling in fixed-size chunks, then renames it into place.
+    """
+    suffix = dict(COMPRESSED_SIBLINGS)[encoding]
+    source_stat = os.stat(path)
+    target = path + suffix
+    tmp = f"{target}.{os.getpid()}.tmp"
+    start = time.perf_counter()
+    with open(path, 'rb') as src, open(tmp, 'wb') as dst:
+        if encoding == 'gzip':
+            with gzip.GzipFile(fileobj=dst, mode='wb', compresslevel=GZIP_LEVEL, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, COPY_CHUNK_SIZE)
+        else:
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            for chunk in iter(lambda: src.read(COPY_CHUNK_SIZE), b''):
+                dst.write(compressor.process(chunk))
+            dst.write(compressor.finish())
+    os.utime(tmp, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+    os.replace(tmp, target)
+    print(f"SUCCESS: Wrote {os.path.basename(target)} ({os.path.getsize(target)/1024/1024:.2f} MB) in {time.perf_counter() - start:.2f}s")
+    return target
+
+def _compress_in_background(path: str, encoding: str):
+    with _compressing_lock:
+        if (path, encoding) in _compressing:
+            return
+        _compressing.add((path, encoding))
+
+    def run():
+        try:
+            compress_file(path, encoding)
+        except Exception as e:
+            print(f"WARNING: Could not pre-compress {path} ({encoding}): {e}")
+        finally:
+            with _compressing_lock:
+                _compressing.discard((path, encoding))
+
+    threading.Thread(target=run, name=f"compress-{encoding}", daemon=True).start()
+
+def _resolve_variant(path: str, accepted: set):
+    """
+    (path, content-encoding or None): a fresh pre-compressed sibling the client accepts, else
+    `path` itself. Missing or stale siblings are rebuilt in the background meanwhile.
+    """
+    for encoding, suffix in COMPRESSED_SIBLINGS:
+        if encoding == 'br' and brotli is None:
+            continue
+        if sibling_is_fresh(path, path + suffix):
+            if encoding in accepted:
+                record_cache('shapes_compressed', hit=True)
+                return path + suffix, encoding
+        else:
+            _compress_in_background(path, encoding)
+    if accepted & {'br', 'gzip'}:
+        record_cache('shapes_compressed', hit=False)
+    return path, None
+
+def resolve_shapes_file(accept_encoding: Optional[str], level: Optional[int] = None):
+    """
+    Picks what to send for the full shapes collection, or its simplified copy at LOD `level`:
+    (file path, content-encoding or None, etag). Nothing is read into memory here.
+    """
+    accepted = parse_accept_encoding(accept_encoding)
+    if level is not None:
+        index = get_shape_index()
+        if index is not None and os.path.exists(index.lod_paths[level]):
+            return (*_resolve_variant(index.lod_paths[level], accepted), index.lod_etag(level))
+    if not os.path.exists(GEOJSON_PATH):
+        print(f"WARNING: GeoJSON not found at {GEOJSON_PATH}")
+        return None
+    return (*_resolve_variant(GEOJSON_PATH, accepted), shapes_etag(file_signature(GEOJSON_PATH)))
+
+TILE_CACHE_BYTES = int(os.environ.get("MP_TILE_CACHE_BYTES", 64 * 1024 * 1024))
+
+_tile_cache: "OrderedDict[tuple, EncodedPayload]" = OrderedDict()
+_tile_cache_bytes = 0
+_tile_renders: "dict[tuple, threading.Event]" = {} # Tiles being rendered, so concurrent misses wait for one render
+_tile_cache_lock = threading.Lock()
+
+def _payload_size(payload: EncodedPayload) -> int:
+    return len(payload.identity) + len(payload.gzip) + len(payload.br or b'')
+
+def render_tile(index: ShapeIndex, z: int, x: int, y: int) -> bytes:
+    """
+    FeatureCollection of every isochrone under an XYZ tile, clipped and grid-quantized.
+    Geometry comes from the LOD level matching the zoom, or the original file above it (see read_feature).
+    """
+    bounds = tile_bounds(z, x, y)
+    west, south, east, north = bounds
+    boxes = index.bbox_array
+    hits = np.flatnonzero(
+        (boxes[:, 0] <= east) & (boxes[:, 2] >= west) & (boxes[:, 1] <= north) & (boxes[:, 3] >= south)
+    )
+    level = lod_level_for(zoom=z)
+
+    features = []
+    for i in hits:
+        track_id = index.track_ids[i]
+        blob = read_feature(index, track_id, level)
+        if blob is None:
+            continue
+        feature = json.loads(blob)
+        geometry = clip_and_quantize(feature.get('geometry'), bounds)
+        if geometry is None:
+            continue
+        features.append(encode_feature({
+            'type': 'Feature',
+            'properties': {'track_id': (feature.get('properties') or {}).get('track_id', track_id)},
+            'geometry': geometry,
+        }))
+    return feature_collection(features)
+
+def get_tile_payload(index: ShapeIndex, z: int, x: int, y: int) -> EncodedPayload:
+    """
+    Cached tile for a shapes generation; least recently used tiles are evicted past TILE_CACHE_BYTES.
+    A miss renders once however many requests ask for the tile meanwhile, and is compressed with
+    gzip only: brotli at serving quality costs more than the render on the request path.
+    """
+    global _tile_cache_bytes
+    key = (index.etag, z, x, y)
+    while True:
+        with _tile_cache_lock:
+            payload = _tile_cache.get(key)
+            if payload is not None:
+                _tile_cache.move_to_end(key)
+                record_cache('tile', hit=True)
+                return payload
+            rendering = _tile_renders.get(key)
+            if rendering is None:
+                rendering = _tile_renders[key] = threading.Event()
+                break
+        # Another request is rendering this tile; take its result (or retry if it failed)
+        rendering.wait()
+    record_cache('tile', hit=False)
+
+    try:
+        payload = EncodedPayload(render_tile(index, z, x, y), br=False)
+        size = _payload_size(payload)
+        with _tile_cache_lock:
+            if size <= TILE_CACHE_BYTES:
+                _tile_cache[key] = payload
+                _tile_cache_bytes += size
+                while _tile_cache_bytes > TILE_CACHE_BYTES:
+                    _, evicted = _tile_cache.popitem(last=False)
+                    _tile_cache_bytes -= _payload_size(evicted)
+    finally:
+        with _tile_cache_lock:
+            del _tile_renders[key]
+        rendering.set()
+    return payload
@@ -0,0 +1,429 @@
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import stat
+import tempfile
+import time
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from .payloads import BROTLI_QUALITY, ChunkedPayload, EncodedPayload, brotli
+from .search_index import SearchIndex, StringTable
+from .spatial import TrackSpatialIndex
+
+def _default_shared_dir() -> str:
+    # /dev/shm is RAM-backed on Linux (and in Cloud Run), so "files" here are shared memory.
+    # It is world-writable: the directory is per user, and private_dir() checks who owns it.
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"mp-intelligence-{os.getuid()}")
+
+# uvicorn reads WEB_CONCURRENCY as its worker count; sharing only pays off with several workers
+WORKERS = int(os.environ.get("WEB_CONCURRENCY") or 1)
+SHARED_SNAPSHOT_DIR = os.environ.get("MP_SHARED_SNAPSHOT_DIR") or (_default_shared_dir() if WORKERS > 1 else None)
+KEEP_GENERATIONS = 2 # Older generations are deleted; mappings still held by slow workers stay valid
+COMPRESS_CHUNK_SIZE = 1 << 20
+# SearchIndex attributes, saved as .npy arrays and as StringTable blobs
+SEARCH_ARRAYS = ['band_starts', 'postings', 'gram_starts', 'gram_terms', 'name_order', 'name_rank']
+SEARCH_STRINGS = ['vocabulary', 'grams', 'names']
+
+def private_dir(path: str) -> str:
+    """
+    Creates `path` as a 0700 directory, or checks that an existing one is a real directory of
+    this user and closes it to others. Generations found in it are mapped without validation.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(f"{path} is not a directory owned by uid {os.getuid()}")
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+@contextmanager
+def _locked(path: str):
+    with open(path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _map_file(path: str):
+    """
+    Read-only memoryview over a whole file; pages are shared by every process mapping it.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+class MappedRows(Sequence):
+    """
+    Pre-encoded row JSON blobs stored back to back in one mapped file.
+    """
+    def __init__(self, buffer: memoryview, offsets: np.ndarray):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.buffer[int(self.offsets[i]):int(self.offsets[i + 1])].tobytes()
+
+class LazyRecords(Sequence):
+    """
+    Track records decoded on access, so attached workers never hold the full list of dicts.
+    """
+    def __init__(self, rows: Sequence):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [json.loads(row) for row in self.rows[i]]
+        return json.loads(self.rows[i])
+
+class TrackPositions(Mapping):
+    """
+    track_id -> row position, as two arrays sorted by id so they can be memory-mapped.
+    If an id occurs twice, the later row wins, as it would in a dict.
+    """
+    def __init__(self, ids: np.ndarray, positions: np.ndarray):
+        self.ids = ids
+        self.positions = positions
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> 'TrackPositions':
+        ids = frame['track_id'].to_numpy(dtype=float)
+        positions = np.flatnonzero(~np.isnan(ids))
+        ids = ids[positions].astype(np.int64)
+        order = np.lexsort((positions, ids))
+        ids, positions = ids[order], positions[order]
+        last = np.append(ids[1:] != ids[:-1], True)
+        return cls(ids[last], positions[last])
+
+    def lookup(self, track_ids) -> np.ndarray:
+        """
+        Row position of each id, or -1.
+        """
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        i = np.minimum(np.searchsorted(self.ids, track_ids), max(len(self.ids) - 1, 0))
+        found = (self.ids[i] == track_ids) if len(self.ids) else np.zeros(len(track_ids), dtype=bool)
+        return np.where(found, self.positions[i] if len(self.ids) else -1, -1)
+
+    def __getitem__(self, track_id):
+        pos = int(self.lookup([track_id])[0])
+        if pos < 0:
+            raise KeyError(track_id)
+        return pos
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __len__(self):
+        return len(self.ids)
+
+class SharedPayload(ChunkedPayload):
+    """
+    A payload published in a generation directory, mapped by every worker. Brotli is added
+    later: whichever worker calls compress_br() first writes the .br file, the others map it.
+    """
+    @classmethod
+    def attach(cls, gen_dir: str, name: str, meta: dict) -> 'SharedPayload':
+        path = os.path.join(gen_dir, name)
+        if os.path.exists(path + ".digests"): # Written for chunked payloads, whose pieces the next build reuses
+            digests, offsets = _map_file(path + ".digests"), np.load(path + ".offsets.npy", mmap_mode='r')
+        else:
+            digests, offsets = b'', np.zeros(0, dtype=np.int64)
+        payload = cls.from_parts(None, _map_file(path), _map_file(path + ".gz"), None, digests, offsets,
+                                 meta["etag"], meta["media_type"])
+        payload.path = path
+        return payload
+
+    @property
+    def br(self):
+        if self._br is None and os.path.exists(self.path + ".br"):
+            self._br = _map_file(self.path + ".br")
+        return self._br
+
+    @br.setter
+    def br(self, body):
+        self._br = body
+
+    def compress_br(self):
+        if brotli is None or self.br is not None:
+            return
+        try:
+            with _locked(self.path + ".br.lock"):
+                if not os.path.exists(self.path + ".br"): # Another worker may have written it meanwhile
+                    tmp_path = f"{self.path}.br.{os.getpid()}.tmp"
+                    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+                    with open(tmp_path, 'wb') as f:
+                        for start in range(0, len(self.identity), COMPRESS_CHUNK_SIZE):
+                            f.write(compressor.process(bytes(self.identity[start:start + COMPRESS_CHUNK_SIZE])))
+                        f.write(compressor.finish())
+                    os.rename(tmp_path, self.path + ".br")
+        except OSError as e: # E.g. the generation was pruned meanwhile
+            print(f"WARNING: Could not brotli-compress {self.path}: {e}")
+
+def generation_key(signature) -> str:
+    return hashlib.sha1(repr(tuple(signature)).encode()).hexdigest()[:16]
+
+def _save_payload(gen_dir: str, name: str, payload: EncodedPayload) -> dict:
+    path = os.path.join(gen_dir, name)
+    with open(path, 'wb') as f:
+        if isinstance(payload, ChunkedPayload):
+            for piece in payload.pieces(): # Never joins the whole body in memory
+                f.write(piece)
+        else:
+            f.write(payload.identity)
+    for suffix, body in ((".gz", payload.gzip), (".br", payload.br)):
+        if body is not None:
+            with open(path + suffix, 'wb') as f:
+                f.write(body)
+    if isinstance(payload, ChunkedPayload):
+        with open(path + ".digests", 'wb') as f:
+            f.write(payload.digests)
+        np.save(path + ".offsets.npy", payload.gzip_offsets)
+    return {"etag": payload.etag, "media_type": payload.media_type}
+
+def _save_strings(gen_dir: str, name: str, table: StringTable):
+    with open(os.path.join(gen_dir, f"{name}.bin"), 'wb') as f:
+        f.write(table.blob)
+    np.save(os.path.join(gen_dir, f"{name}.offsets.npy"), table.offsets)
+
+def _load_strings(gen_dir: str, name: str) -> StringTable:
+    return StringTable(_map_file(os.path.join(gen_dir, f"{name}.bin")),
+                       np.load(os.path.join(gen_dir, f"{name}.offsets.npy"), mmap_mode='r'))
+
+def _load_array(gen_dir: str, name: str) -> np.ndarray:
+    return np.load(os.path.join(gen_dir, f"{name}.npy"), mmap_mode='r')
+
+def publish(snapshot, root: str) -> str:
+    """
+    Writes a snapshot as flat arrays, string blobs and encoded payloads, and atomically renames
+    the directory into place. Nothing is pickled: every file is plain data that workers map.
+    """
+    key = generation_key(snapshot.signature)
+    final_dir = os.path.join(root, key)
+    tmp_dir = os.path.join(root, f".{key}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_dir, "frame"))
+
+    offsets = np.zeros(len(snapshot.row_json) + 1, dtype=np.int64)
+    with open(os.path.join(tmp_dir, "rows.bin"), 'wb') as f:
+        for i, row in enumerate(snapshot.row_json):
+            f.write(row)
+            offsets[i + 1] = offsets[i] + len(row)
+    np.save(os.path.join(tmp_dir, "row_offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "row_hashes.npy"), snapshot.row_hashes)
+
+    payloads = {"payload.json": _save_payload(tmp_dir, "payload.json", snapshot.payload),
+                "columns.bin": _save_payload(tmp_dir, "columns.bin", snapshot.columns_payload)}
+    for group, payload in snapshot.stats_payloads.items():
+        payloads[f"stats_{group}.json"] = _save_payload(tmp_dir, f"stats_{group}.json", payload)
+
+    # Numeric and flag columns are saved as-is, categorical ones as codes plus their categories
+    categories = {}
+    for column in snapshot.frame.columns:
+        values = snapshot.frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories[column] = values.cat.categories.tolist()
+            values = values.cat.codes
+        np.save(os.path.join(tmp_dir, "frame", f"{column}.npy"), values.to_numpy())
+    _save_strings(tmp_dir, "folded_names", snapshot.folded_names)
+    _save_strings(tmp_dir, "folded_cities", snapshot.folded_cities)
+    np.save(os.path.join(tmp_dir, "position_ids.npy"), snapshot.positions_by_id.ids)
+    np.save(os.path.join(tmp_dir, "position_rows.npy"), snapshot.positions_by_id.positions)
+
+    spatial = snapshot.spatial
+    np.save(os.path.join(tmp_dir, "spatial_positions.npy"), spatial.positions)
+    np.save(os.path.join(tmp_dir, "spatial_lats.npy"), spatial.lats)
+    np.save(os.path.join(tmp_dir, "spatial_lons.npy"), spatial.lons)
+
+    for name in SEARCH_ARRAYS:
+        np.save(os.path.join(tmp_dir, f"search_{name}.npy"), getattr(snapshot.search, name))
+    for name in SEARCH_STRINGS:
+        _save_strings(tmp_dir, f"search_{name}", getattr(snapshot.search, name))
+
+    meta = {
+        "signature": list(snapshot.signature),
+        "count": len(snapshot.row_json),
+        "columns": list(snapshot.frame.columns),
+        "categories": categories,
+        "payloads": payloads,
+        "csv_columns": snapshot.columns,
+        "built_at": snapshot.built_at,
+        "published_at": time.time(),
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), 'w') as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.rename(tmp_dir, final_dir)
+    return final_dir
+
+def attach(gen_dir: str) -> dict:
+    """
+    Maps a published generation. Returns the parts TrackSnapshot.assemble() expects; nothing
+    but small per-worker indexes is copied out of the mapped files.
+    """
+    with open(os.path.join(gen_dir, "meta.json")) as f:
+        meta = json.load(f)
+
+    rows = MappedRows(_map_file(os.path.join(gen_dir, "rows.bin")), _load_array(gen_dir, "row_offsets"))
+
+    columns = {}
+    for column in meta["columns"]:
+        values = np.load(os.path.join(gen_dir, "frame", f"{column}.npy"), mmap_mode='r')
+        if column in meta["categories"]:
+            values = pd.Categorical.from_codes(values, categories=meta["categories"][column])
+        columns[column] = values
+    # copy=False keeps every mapped column as its own block instead of consolidating into a private copy
+    frame = pd.DataFrame(columns, copy=False)
+
+    payloads = {name: SharedPayload.attach(gen_dir, name, payload_meta) for name, payload_meta in meta["payloads"].items()}
+    spatial = TrackSpatialIndex.from_sorted(
+        _load_array(gen_dir, "spatial_positions"), _load_array(gen_dir, "spatial_lats"), _load_array(gen_dir, "spatial_lons"),
+    )
+    search = SearchIndex(**{name: _load_array(gen_dir, f"search_{name}") for name in SEARCH_ARRAYS},
+                         **{name: _load_strings(gen_dir, f"search_{name}") for name in SEARCH_STRINGS})
+    return {
+        "signature": tuple(meta["signature"]),
+        "records": LazyRecords(rows),
+        "row_hashes": _load_array(gen_dir, "row_hashes"),
+        "row_json": rows,
+        "frame": frame,
+        "folded_names": _load_strings(gen_dir, "folded_names"),
+        "folded_cities": _load_strings(gen_dir, "folded_cities"),
+        "positions_by_id": TrackPositions(_load_array(gen_dir, "position_ids"), _load_array(gen_dir, "position_rows")),
+        "payload": payloads.pop("payload.json"),
+        "columns_payload": payloads.pop("columns.bin"),
+        "stats_payloads": {name[len("stats_"):-len(".json")]: payload for name, payload in payloads.items()},
+        "spatial": spatial,
+        "search": search,
+        "built_at": meta["built_at"],
+        "columns": meta["csv_columns"],
+    }
+
+def _prune(root: str, keep: str):
+    generations = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        generations.append((os.path.getmtime(path), path))
+    generations.sort(reverse=True)
+    for _, path in generations[KEEP_GENERATIONS:]:
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+def load_or_publish(signature, build: Callable[[], object], assemble: Callable[..., object], root: Optional[str] = None):
+    """
+    Attaches to the shared generation for `signature`, building and publishing it first
+    if no worker has yet. A file lock makes exactly one worker parse the CSV.
+    If the shared directory can't be trusted, the snapshot is built in-process instead.
+    """
+    root = root or SHARED_SNAPSHOT_DIR
+    try:
+        private_dir(root)
+    except OSError as e:
+        print(f"ERROR: Not sharing the track snapshot: {e}")
+        return build()
+    gen_dir = os.path.join(root, generation_key(signature))
+    meta_path = os.path.join(gen_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        with _locked(os.path.join(root, ".lock")):
+            # Another worker may have published while we waited for the lock
+            if not os.path.exists(meta_path):
+                start = time.perf_counter()
+                publish(build(), root)
+                _prune(root, keep=gen_dir)
+                print(f"SUCCESS: Published shared snapshot {os.path.basename(gen_dir)} in {time.perf_counter() - start:.2f}s (pid {os.getpid()})")
+    return assemble(**attach(gen_dir))
+
+CHANGES_DIR = ".changes" # Dot-prefixed so _prune never takes it for a generation
+
+def save_change(root: str, base: str, etag: str, upserts, removed, keep: int):
+    """
+    Adds the delta from generation `base` to `etag` to the change log shared by all workers,
+    so a client can resume its change stream on any of them. Workers that swap the same
+    generations write the same file; only the `keep` newest deltas are kept.
+    """
+    changes_dir = os.path.join(private_dir(root), CHANGES_DIR)
+    os.makedirs(changes_dir, mode=0o700, exist_ok=True)
+    path = os.path.join(changes_dir, f"{base}.{etag}.json")
+    fd, tmp_path = tempfile.mkstemp(dir=changes_dir, prefix=".tmp-")
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'upserts': list(upserts), 'removed': list(removed)}, f)
+    os.replace(tmp_path, path)
+
+    for _, name in _change_files(changes_dir)[:-keep]:
+        try:
+            os.unlink(os.path.join(changes_dir, name))
+        except FileNotFoundError: # Pruned by another worker
+            pass
+
+def _change_files(changes_dir: str) -> list:
+    """
+    (mtime, name) of every delta file, oldest first.
+    """
+    files = []
+    with os.scandir(changes_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.json') and not entry.name.startswith('.'):
+                try:
+                    files.append((entry.stat().st_mtime_ns, entry.name))
+                except FileNotFoundError:
+                    pass
+    files.sort()
+    return files
+
+def load_change_chain(root: str, base: str, etag: str) -> Optional[list]:
+    """
+    [(upserts, removed)] leading from generation `base` to `etag`, oldest first, or None if
+    the shared change log doesn't connect them. Only the deltas on the chain are read.
+    """
+    changes_dir = os.path.join(root, CHANGES_DIR)
+    if not os.path.isdir(changes_dir):
+        return None
+    names = [name for _, name in _change_files(changes_dir)]
+    chain = follow_changes([name[:-len('.json')].split('.', 1) for name in names], base, etag)
+    if chain is None:
+        return None
+    deltas = []
+    for i in chain:
+        try:
+            with open(os.path.join(changes_dir, names[i])) as f:
+                data = json.load(f)
+        except FileNotFoundError: # Pruned meanwhile
+            return None
+        deltas.append((data['upserts'], data['removed']))
+    return deltas
+
+def follow_changes(links: Sequence, base: str, etag: str) -> Optional[list]:
+    """
+    Positions of the (base, etag) links leading from `base` to `etag`, walking forward through
+    `links` in log order, or None if they never reach `etag`. Links off the path (e.g. from a
+    worker that skipped a generation) are passed over.
+    """
+    chain, current = [], base
+    for i, (link_base, link_etag) in enumerate(links):
+        if link_base == current:
+            chain.append(i)
+            current = link_etag
+            if current == etag:
+                return chain
+    return None
@@ -0,0 +1,93 @@
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+from .monitoring import record_cache, record_rebuild
+
+class SnapshotCache:
+    """
+    Holds the current build of a file-backed snapshot (anything with a `.signature`) and
+    rebuilds it at most once per file generation, with stale-while-revalidate semantics:
+
+    - signature unchanged: the current snapshot is returned.
+    - file changed: the current snapshot keeps being returned while a single background thread
+      builds the new one; the reference is then swapped, so readers see old or new, never a mix.
+    - nothing built yet (cold start), `required` cache: callers wait for the one build instead of
+      each starting their own. Each waiter holds a threadpool thread for the whole build, so only
+      caches no request can be answered without (and that readiness waits for) should be required.
+    - nothing built yet, optional cache: None is returned at once while the build runs in the
+      background, so the route can answer 503 instead of tying up a thread.
+
+    A generation whose build failed (e.g. a half-written CSV) is not retried until the file changes again.
+    """
+    def __init__(self, name: str, cache_metric: str, build: Callable, on_swap: Optional[Callable] = None,
+                 required: bool = True):
+        self.name = name
+        self.cache_metric = cache_metric
+        self.build = build # build(signature, previous) -> snapshot
+        self.on_swap = on_swap # on_swap(previous, new), after the new snapshot is visible
+        self.required = required
+        self.current = None
+        self._lock = threading.Lock() # Held for the whole rebuild: this is the single flight
+        self._failed_signature = None
+
+    def get(self, signature, wait: bool = False):
+        """
+        The snapshot to serve for a file currently at `signature`, or None if there is none yet.
+        wait=True blocks until that generation is built (or has failed) instead of serving stale,
+        also for optional caches.
+        """
+        current = self.current
+        if current is not None and current.signature == signature:
+            record_cache(self.cache_metric, hit=True)
+            return current
+        if signature == self._failed_signature:
+            return current
+        if (current is None and self.required) or wait:
+            record_cache(self.cache_metric, hit=False)
+            with self._lock:
+                # Whoever held the lock may have just built this generation
+                if self._needs_build(signature):
+                    self._rebuild(signature)
+            return self.current
+        record_cache(self.cache_metric, hit=False, stale=current is not None)
+        self._rebuild_in_background(signature)
+        return current
+
+    @property
+    def building(self) -> bool:
+        return self._lock.locked()
+
+    def _needs_build(self, signature) -> bool:
+        return signature != self._failed_signature and (self.current is None or self.current.signature != signature)
+
+    def _rebuild_in_background(self, signature):
+        if not self._lock.acquire(blocking=False):
+            return # A rebuild is running; requests after it finishes pick up any newer generation
+
+        def run():
+            try:
+                if self._needs_build(signature):
+                    self._rebuild(signature)
+            finally:
+                self._lock.release()
+
+        threading.Thread(target=run, name=f"rebuild-{self.name}", daemon=True).start()
+
+    def _rebuild(self, signature):
+        previous = self.current
+        start = time.perf_counter()
+        try:
+            snapshot = self.build(signature, previous)
+        except Exception as e:
+            record_rebuild(self.name, time.perf_counter() - start, ok=False)
+            self._failed_signature = signature
+            print(f"ERROR: Failed to rebuild {self.name} snapshot: {e}")
+            traceback.print_exc()
+            return
+        record_rebuild(self.name, time.perf_counter() - start)
+        self.current = snapshot
+        self._failed_signature = None
+        if previous is not None and self.on_swap is not None:
+            self.on_swap(previous, snapshot)
@@ -0,0 +1,84 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = np.pi * EARTH_RADIUS_KM / 180
+
+def haversine_km(lat, lon, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distance from one point to many, in kilometres.
+    """
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+class TrackSpatialIndex:
+    """
+    Latitude-sorted coordinate arrays: a binary search narrows any query to a band,
+    and the rest is a vectorized test over that band only.
+    Results are snapshot row positions.
+    """
+    def __init__(self, latitudes: np.ndarray, longitudes: np.ndarray):
+        lats = np.asarray(latitudes, dtype=float)
+        lons = np.asarray(longitudes, dtype=float)
+        valid = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons) & (np.abs(lats) <= 90) & (np.abs(lons) <= 180))
+        order = valid[np.argsort(lats[valid], kind='stable')]
+        self.positions = order
+        self.lats = lats[order]
+        self.lons = lons[order]
+
+    @classmethod
+    def from_sorted(cls, positions: np.ndarray, lats: np.ndarray, lons: np.ndarray):
+        """
+        Wraps arrays that are already latitude-sorted (e.g. mapped from a shared snapshot).
+        """
+        index = cls.__new__(cls)
+        index.positions, index.lats, index.lons = positions, lats, lons
+        return index
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _band(self, south: float, north: float) -> slice:
+        lo = np.searchsorted(self.lats, south, side='left')
+        hi = np.searchsorted(self.lats, north, side='right')
+        return slice(lo, hi)
+
+    def _bbox_mask(self, band: slice, west: float, east: float) -> np.ndarray:
+        lons = self.lons[band]
+        if west <= east:
+            return (lons >= west) & (lons <= east)
+        # Box crosses the antimeridian
+        return (lons >= west) | (lons <= east)
+
+    def bbox(self, west: float, south: float, east: float, north: float) -> np.ndarray:
+        """
+        Row positions inside the box; west > east means the box wraps the antimeridian.
+        """
+        band = self._band(south, north)
+        return self.positions[band][self._bbox_mask(band, west, east)]
+
+    def near(self, lat: float, lon: float, radius_km: float, limit: int):
+        """
+        (positions, distances_km) within radius_km, closest first, at most `limit`.
+        """
+        dlat = radius_km / KM_PER_DEGREE_LAT
+        band = self._band(lat - dlat, lat + dlat)
+        # Longitude window widens towards the poles; fall back to the full band when it wraps the globe
+        cos_lat = np.cos(np.radians(min(89.9, abs(lat) + dlat)))
+        dlon = dlat / cos_lat if cos_lat > 0 else 360.0
+        if dlon >= 180:
+            candidates = np.arange(band.start, band.stop)
+        else:
+            west = (lon - dlon + 180) % 360 - 180
+            east = (lon + dlon + 180) % 360 - 180
+            candidates = band.start + np.flatnonzero(self._bbox_mask(band, west, east))
+
+        distances = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+        inside = distances <= radius_km
+        candidates, distances = candidates[inside], distances[inside]
+        if len(candidates) > limit:
+            nearest = np.argpartition(distances, limit - 1)[:limit]
+            candidates, distances = candidates[nearest], distances[nearest]
+        order = np.argsort(distances, kind='stable')
+        return self.positions[candidates[order]], distances[order]
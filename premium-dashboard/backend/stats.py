@@ -0,0 +1,112 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from .payloads import EncodedPayload
+
+# Facility types, in the same precedence as the dashboard's marker colours
+FACILITY_TYPES = ['indoor_outdoor', 'track_sim', 'indoor', 'outdoor', 'sim', 'unclassified']
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+HISTOGRAM_BINS = 10
+# Public group name -> frame column
+STATS_GROUPS = {'country': 'Country', 'nuts': 'NUTS_ID', 'type': 'facility_type'}
+
+def facility_types(frame: pd.DataFrame) -> np.ndarray:
+    indoor, outdoor, sim = (frame[key].to_numpy(dtype=bool) for key in ('is_indoor', 'is_outdoor', 'is_sim'))
+    return np.select(
+        [indoor & outdoor, (indoor | outdoor) & sim, indoor, outdoor, sim],
+        FACILITY_TYPES[:-1],
+        FACILITY_TYPES[-1]
+    )
+
+def _round(value, digits=2):
+    return None if value is None or not np.isfinite(value) else round(float(value), digits)
+
+def distribution(values: np.ndarray, edges: np.ndarray) -> dict:
+    """
+    Summary of the known (> 0) values of one metric; 0 means "not enriched yet" in the CSV.
+    """
+    known = values[values > 0]
+    if len(known) == 0:
+        return {'count': 0, 'mean': None, 'min': None, 'max': None, 'quantiles': None, 'histogram': [0] * HISTOGRAM_BINS}
+    histogram, _ = np.histogram(np.clip(known, edges[0], edges[-1]), bins=edges)
+    return {
+        'count': int(len(known)),
+        'mean': _round(known.mean()),
+        'min': _round(known.min()),
+        'max': _round(known.max()),
+        'quantiles': {f"p{int(q * 100)}": _round(v) for q, v in zip(QUANTILES, np.quantile(known, QUANTILES))},
+        'histogram': histogram.tolist(),
+    }
+
+def summarize(frame: pd.DataFrame, positions: np.ndarray, edges: dict) -> dict:
+    pps = frame['disposable_income_pps'].to_numpy()[positions]
+    known_pps = pps[pps > 0]
+    return {
+        'count': int(len(positions)),
+        'pps': {
+            'count': int(len(known_pps)),
+            'mean': _round(known_pps.mean()) if len(known_pps) else None,
+            'median': _round(np.median(known_pps)) if len(known_pps) else None,
+        },
+        'mix': {key[3:]: int(frame[key].to_numpy(dtype=bool)[positions].sum()) for key in ('is_indoor', 'is_outdoor', 'is_sim')},
+        'length': distribution(frame['consolidated_track_length'].to_numpy()[positions], edges['length']),
+        'catchment': distribution(frame['catchment_area_size'].to_numpy()[positions], edges['catchment']),
+    }
+
+def _bin_edges(values: np.ndarray) -> np.ndarray:
+    # Shared edges, so histograms are comparable across groups
+    known = values[values > 0]
+    top = float(known.max()) if len(known) else 1.0
+    return np.linspace(0, top, HISTOGRAM_BINS + 1)
+
+def build_stats(frame: pd.DataFrame) -> dict:
+    """
+    Aggregate tables over the whole snapshot and per country, NUTS region and facility type.
+    """
+    edges = {
+        'length': _bin_edges(frame['consolidated_track_length'].to_numpy()),
+        'catchment': _bin_edges(frame['catchment_area_size'].to_numpy()),
+    }
+    keys = {
+        'Country': frame['Country'].to_numpy(),
+        'NUTS_ID': frame['NUTS_ID'].to_numpy(),
+        'facility_type': facility_types(frame),
+    }
+    nuts_names = frame['NUTS_NAME'].to_numpy()
+    countries = keys['Country']
+
+    tables = {}
+    for group, column in STATS_GROUPS.items():
+        rows = []
+        codes, uniques = pd.factorize(keys[column], sort=True)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        for i, key in enumerate(uniques):
+            positions = order[bounds[i]:bounds[i + 1]]
+            row = {'key': key}
+            if group == 'nuts':
+                row['name'] = nuts_names[positions[0]]
+                row['country'] = countries[positions[0]]
+            row.update(summarize(frame, positions, edges))
+            rows.append(row)
+        rows.sort(key=lambda row: -row['count'])
+        tables[group] = rows
+
+    return {
+        'bins': {name: [_round(edge) for edge in values] for name, values in edges.items()},
+        'overall': summarize(frame, np.arange(len(frame)), edges),
+        **{f"by_{group}": rows for group, rows in tables.items()},
+    }
+
+def build_stats_payloads(frame: pd.DataFrame) -> dict:
+    """
+    Encoded /api/stats bodies: 'all', plus one per group for clients that need a single table.
+    """
+    stats = build_stats(frame)
+    payloads = {'all': EncodedPayload(json.dumps(stats, separators=(',', ':')).encode('utf-8'))}
+    for group in STATS_GROUPS:
+        body = {'bins': stats['bins'], 'overall': stats['overall'], f"by_{group}": stats[f"by_{group}"]}
+        payloads[group] = EncodedPayload(json.dumps(body, separators=(',', ':')).encode('utf-8'))
+    return payloads
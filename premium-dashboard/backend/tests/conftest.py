@@ -0,0 +1,94 @@
+import os
+import tempfile
+
+# Module-level settings are read at import: point every on-disk store at a scratch directory
+# before any backend module is imported, so tests never touch the real databases or /dev/shm.
+_SCRATCH = tempfile.mkdtemp(prefix="mp-tests-")
+os.environ["MP_DB_PATH"] = os.path.join(_SCRATCH, "wishlist.db")
+os.environ["MP_LEDGER_PATH"] = os.path.join(_SCRATCH, "pipeline_runs.db")
+os.environ["MP_SHAPES_CACHE_DIR"] = os.path.join(_SCRATCH, "shapes")
+os.environ["MP_BROTLI_SETTLE_SECONDS"] = "3600"
+os.environ.pop("MP_SHARED_SNAPSHOT_DIR", None)
+os.environ.pop("WEB_CONCURRENCY", None)
+
+import json
+import math
+from collections import OrderedDict, deque
+
+import pytest
+
+def circle_feature(track_id, lon: float, lat: float, radius: float = 0.1, vertices: int = 200) -> dict:
+    """
+    An isochrone-like polygon feature: a closed ring of `vertices` points around (lon, lat).
+    """
+    ring = [[round(lon + radius * math.cos(2 * math.pi * i / vertices), 6),
+             round(lat + radius * math.sin(2 * math.pi * i / vertices), 6)] for i in range(vertices)]
+    return {"type": "Feature", "properties": {"track_id": track_id, "value": 1800.0},
+            "geometry": {"type": "Polygon", "coordinates": [ring + [ring[0]]]}}
+
+def write_geojson(path, features) -> str:
+    with open(path, 'w') as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    return str(path)
+
+@pytest.fixture
+def shapes_file(tmp_path, monkeypatch):
+    """
+    A small shapes file wired into shapes_service, with a fresh (cold) index cache.
+    """
+    from backend import shapes_service
+    from backend.snapshot_cache import SnapshotCache
+    features = [circle_feature(i, 4 + i * 0.5, 50 + i * 0.3) for i in range(1, 6)]
+    path = write_geojson(tmp_path / "karting_shapes.geojson", features)
+    monkeypatch.setattr(shapes_service, 'GEOJSON_PATH', path)
+    monkeypatch.setattr(shapes_service, 'SHAPES_CACHE_DIR', str(tmp_path / "shapes-cache"))
+    monkeypatch.setattr(shapes_service, '_shape_cache',
+                        SnapshotCache('shapes', 'shape_index', shapes_service._build_shapes, required=False))
+    monkeypatch.setattr(shapes_service, '_tile_cache', OrderedDict())
+    monkeypatch.setattr(shapes_service, '_tile_cache_bytes', 0)
+    return path
+
+SAMPLE_CSV = os.path.join(os.path.dirname(__file__), "..", "..", "..", "data", "karting_enriched.csv")
+
+@pytest.fixture
+def tracks_csv(tmp_path, monkeypatch):
+    """
+    The first 40 rows of the enriched CSV wired into data_service, with a fresh snapshot cache
+    and change log. Tests may rewrite the file to trigger a reload.
+    """
+    import pandas as pd
+    from backend import data_service
+    from backend.snapshot_cache import SnapshotCache
+    path = tmp_path / "karting_enriched.csv"
+    pd.read_csv(SAMPLE_CSV).head(40).to_csv(path, index=False)
+    monkeypatch.setattr(data_service, 'CSV_PATH', str(path))
+    monkeypatch.setattr(data_service, '_tracks_cache',
+                        SnapshotCache('tracks', 'tracks_snapshot', data_service._build_tracks, on_swap=data_service.record_change))
+    monkeypatch.setattr(data_service, '_change_log', deque(maxlen=data_service.CHANGE_LOG_SIZE))
+    return str(path)
+
+@pytest.fixture
+def wishlist_db(tmp_path, monkeypatch):
+    """
+    An empty wishlist database (and legacy wishlist.json path) per test.
+    """
+    import threading
+    from backend import wishlist_store
+    monkeypatch.setattr(wishlist_store, 'DB_PATH', str(tmp_path / "wishlist.db"))
+    monkeypatch.setattr(wishlist_store, 'WISHLIST_PATH', str(tmp_path / "wishlist.json"))
+    monkeypatch.setattr(wishlist_store, '_local', threading.local())
+    monkeypatch.setattr(wishlist_store, '_initialized', False)
+    return tmp_path / "wishlist.json"
+
+@pytest.fixture
+def client():
+    """
+    TestClient for the API with authentication stubbed out. The lifespan (warm-up) is not run.
+    """
+    from fastapi.testclient import TestClient
+    from backend.auth import get_current_user
+    from backend.main import app
+    from backend.schemas import User
+    app.dependency_overrides[get_current_user] = lambda: User(username="tester")
+    yield TestClient(app)
+    app.dependency_overrides.clear()
@@ -0,0 +1,44 @@
+import struct
+
+import numpy as np
+import pandas as pd
+
+from backend import data_service
+from backend.columnar import (
+    COLUMNS_MAGIC, COLUMNS_MEDIA_TYPE, DICTIONARY_COLUMNS, FLAG_BITS, FLOAT_COLUMNS,
+    build_columns_body, read_columns_body,
+)
+
+def test_columns_round_trip(tracks_csv):
+    frame = data_service.get_tracks_snapshot().frame
+    columns = read_columns_body(build_columns_body(frame))
+
+    assert list(columns['track_id']) == list(frame['track_id'])
+    for key, bit in FLAG_BITS.items():
+        assert list((columns['flags'] & bit) != 0) == list(frame[key].astype(bool))
+    for key in FLOAT_COLUMNS:
+        assert np.allclose(columns[key], frame[key].to_numpy(dtype=float), equal_nan=True, rtol=1e-6)
+    for key in DICTIONARY_COLUMNS:
+        assert list(columns[key]) == [str(v) for v in frame[key]]
+
+def test_columns_are_aligned_typed_arrays():
+    frame = pd.DataFrame({
+        'track_id': [3, 1, 2], 'is_indoor': [True, False, True], 'is_outdoor': [False, True, True],
+        'is_sim': [False, False, True], 'Country': ['France', 'Belgium', 'France'], 'NUTS_ID': ['FR1', 'BE2', 'FR1'],
+        **{key: [1.5, 2.5, np.nan] for key in FLOAT_COLUMNS},
+    })
+    body = build_columns_body(frame)
+    assert body[:4] == COLUMNS_MAGIC
+    (header_length,) = struct.unpack_from('<I', body, 4)
+    assert (8 + header_length) % 8 == 0
+    columns = read_columns_body(body)
+    assert columns['flags'].tolist() == [1, 2, 7]
+    assert columns['Country'].tolist() == ['France', 'Belgium', 'France']
+    assert np.isnan(columns['Latitude'][2])
+
+def test_columns_route(tracks_csv, client):
+    response = client.get("/api/tracks/columns")
+    assert response.headers['content-type'] == COLUMNS_MEDIA_TYPE
+    assert read_columns_body(response.content)['track_id'].tolist() == \
+        data_service.get_tracks_snapshot().frame['track_id'].tolist()
+    assert client.get("/api/tracks/columns", headers={'If-None-Match': response.headers['ETag']}).status_code == 304
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from backend.geometry import douglas_peucker, simplify_geometry, simplify_rings
+
+def reference_douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Textbook recursive Douglas-Peucker on one polyline.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    def split(first, last):
+        if last - first < 2:
+            return
+        (x0, y0), (x1, y1) = points[first], points[last]
+        dx, dy = x1 - x0, y1 - y0
+        norm = np.sqrt(dx * dx + dy * dy)
+        inner = points[first + 1:last]
+        if norm == 0:
+            dists = np.hypot(inner[:, 0] - x0, inner[:, 1] - y0)
+        else:
+            dists = np.abs(dx * (y0 - inner[:, 1]) - dy * (x0 - inner[:, 0])) / norm
+        i = int(np.argmax(dists))
+        if dists[i] > tolerance:
+            keep[first + 1 + i] = True
+            split(first, first + 1 + i)
+            split(first + 1 + i, last)
+
+    split(0, len(points) - 1)
+    return keep
+
+@pytest.mark.parametrize("tolerance", [0.001, 0.01, 0.1])
+def test_batched_douglas_peucker_matches_recursive(tolerance):
+    rng = np.random.default_rng(7)
+    lines = [np.cumsum(rng.normal(0, 0.01, (n, 2)), axis=0) for n in (2, 3, 5, 40, 300)]
+    lines.append(np.zeros((6, 2))) # Degenerate chord
+    points = np.concatenate(lines)
+    lengths = np.array([len(line) for line in lines])
+    starts = np.cumsum(lengths) - lengths
+    keep = douglas_peucker(points, starts, starts + lengths - 1, tolerance)
+    expected = np.concatenate([reference_douglas_peucker(line, tolerance) for line in lines])
+    assert np.array_equal(keep, expected)
+
+def square(x, y, size, vertices_per_side=10):
+    side = np.linspace(0, size, vertices_per_side, endpoint=False)
+    ring = ([[x + s, y] for s in side] + [[x + size, y + s] for s in side] +
+            [[x + size - s, y + size] for s in side] + [[x, y + size - s] for s in side])
+    return ring + [ring[0]]
+
+def test_simplify_keeps_corners_and_rounds():
+    simplified = simplify_geometry({'type': 'Polygon', 'coordinates': [square(4.123456, 50.123456, 1)]}, 0.02)
+    ring = simplified['coordinates'][0]
+    assert ring[0] == ring[-1]
+    assert sorted(map(tuple, ring[:-1])) == sorted([(4.123, 50.123), (5.123, 50.123), (5.123, 51.123), (4.123, 51.123)])
+
+def test_collapsed_holes_and_polygons_are_dropped():
+    polygon = [square(0, 0, 1), square(0.5, 0.5, 0.001)]
+    speck = [square(3, 3, 0.001)]
+    simplified = simplify_geometry({'type': 'MultiPolygon', 'coordinates': [polygon, speck]}, 0.02)
+    assert simplified['type'] == 'MultiPolygon'
+    assert len(simplified['coordinates']) == 1 and len(simplified['coordinates'][0]) == 1
+    assert simplify_geometry({'type': 'Polygon', 'coordinates': [square(3, 3, 0.001)]}, 0.02) is None
+
+def test_small_rings_and_other_geometries_pass_through():
+    triangle = np.array([[0, 0], [1, 0], [0, 1], [0, 0]], dtype=float)
+    assert simplify_rings([triangle], 0.5)[0] is triangle
+    point = {'type': 'Point', 'coordinates': [1, 2]}
+    assert simplify_geometry(point, 0.1) is point
+    assert simplify_geometry(None, 0.1) is None
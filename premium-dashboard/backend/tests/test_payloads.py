@@ -0,0 +1,59 @@
+import gzip
+import json
+
+import pytest
+
+from backend import data_service
+from backend.payloads import ChunkedPayload, EncodedPayload, brotli, etag_matches
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False), ('', False), ('"abc"', True), ('W/"abc"', True), ('"abc-gzip"', True), ('"abc-br"', True),
+    ('"other", "abc-gzip"', True), ('*', True), ('"abcd"', False), ('"ab"', False),
+])
+def test_etag_matches(header, matches):
+    assert etag_matches(header, "abc") is matches
+
+def test_chunked_gzip_is_one_valid_member_and_reuses_unchanged_pieces():
+    pieces = [json.dumps({'row': i}).encode() * 20 for i in range(50)]
+    first = ChunkedPayload(lambda: iter(pieces))
+    assert gzip.decompress(first.gzip) == b''.join(pieces) == first.identity
+
+    pieces[10] = b'changed' * 30
+    second = ChunkedPayload(lambda: iter(pieces), previous=first)
+    assert gzip.decompress(second.gzip) == b''.join(pieces)
+    assert second.etag != first.etag
+    # Every piece but the changed one is spliced from the previous generation
+    same = sum(second.gzip[second.gzip_offsets[i]:second.gzip_offsets[i + 1]] ==
+               first.gzip[first.gzip_offsets[i]:first.gzip_offsets[i + 1]] for i in range(50))
+    assert same == 49
+
+def test_tracks_revalidate_with_304(tracks_csv, client):
+    response = client.get("/api/tracks", headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200 and response.headers['Content-Encoding'] == 'gzip'
+    etag = response.headers['ETag']
+    assert etag.endswith('-gzip"') and 'Accept-Encoding' in response.headers['Vary']
+    assert len(response.json()) == 40
+
+    # Any encoding's tag revalidates: the suffix only keeps caches from mixing bodies
+    for tag in (etag, etag.replace('-gzip', ''), f'W/{etag}'):
+        again = client.get("/api/tracks", headers={'Accept-Encoding': 'identity', 'If-None-Match': tag})
+        assert again.status_code == 304 and again.content == b''
+    plain = client.get("/api/tracks", headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['ETag'] == etag.replace('-gzip', '')
+    assert plain.content == bytes(data_service.get_tracks_snapshot().payload.identity)
+    assert client.get("/api/tracks", headers={'If-None-Match': '"stale"'}).status_code == 200
+
+@pytest.mark.skipif(brotli is None, reason="brotli not installed")
+def test_brotli_is_served_once_compressed(tracks_csv, client):
+    snapshot = data_service.get_tracks_snapshot()
+    assert 'Content-Encoding' not in client.get("/api/tracks", headers={'Accept-Encoding': 'br'}).headers
+    snapshot.compress_br()
+    response = client.get("/api/tracks", headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br' and response.headers['ETag'].endswith('-br"')
+
+def test_encoded_payload_variants():
+    payload = EncodedPayload(b'{"a":1}' * 100, br=False)
+    assert payload.variant('gzip, deflate') == (payload.gzip, 'gzip')
+    assert payload.variant('br') == (payload.identity, None)
+    assert payload.variant(None) == (payload.identity, None)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from backend import search_index
+from backend.search_index import MAX_EXPANSIONS, SearchIndex, fold_text, tokenize
+
+@pytest.mark.parametrize("text, folded", [
+    ("Zürich", "zurich"), ("ZURICH", "zurich"), ("Straße", "strasse"), ("Øresund", "oresund"),
+    ("Łódź", "lodz"), ("Kart'Azur", "kart'azur"), (None, ""), (float('nan'), ""),
+])
+def test_fold_text(text, folded):
+    assert fold_text(text) == folded
+
+def test_tokenize_splits_on_punctuation():
+    assert tokenize("Kart'Azur — Côte-d'Or 2") == ['kart', 'azur', 'cote', 'd', 'or', '2']
+
+def records():
+    return [
+        {'Name': 'Kartbahn Zürich', 'City': 'Zürich'},
+        {'Name': 'Gokartbahn Nord', 'City': 'Hamburg'},
+        {'Name': 'Karting Genève', 'City': 'Genève', 'Top Reviews Snippet': 'great track in zurich? no'},
+        {'Name': 'Zurich Indoor Karting', 'City': 'Zürich'},
+        {'Name': 'Speedway', 'City': 'Lyon', 'NUTS_NAME': 'Auvergne-Rhône-Alpes'},
+    ]
+
+def names(index, query, limit=10):
+    rows = records()
+    return [rows[pos]['Name'] for pos, _ in index.search(query, limit)]
+
+def test_accents_and_case_are_ignored():
+    index = SearchIndex.build(records())
+    assert names(index, "zurich") == names(index, "ZÜRICH") == names(index, "Zürich")
+    assert names(index, "geneve") == ['Karting Genève']
+    assert names(index, "rhone") == ['Speedway']
+
+def test_ranking_and_matching():
+    index = SearchIndex.build(records())
+    # Name prefix beats a name word, which beats a city, which beats a review
+    assert names(index, "zurich") == ['Zurich Indoor Karting', 'Kartbahn Zürich', 'Karting Genève']
+    # Equal scores keep row order
+    assert names(index, "zurich kart") == ['Kartbahn Zürich', 'Zurich Indoor Karting', 'Karting Genève']
+    assert names(index, "hamburg nord") == ['Gokartbahn Nord']
+    assert names(index, "zurich hamburg") == []
+    # Infix fallback when no term starts with the token
+    assert names(index, "okartb") == ['Gokartbahn Nord']
+    assert names(index, "!!") == [] and names(index, "zz") == []
+
+def test_expansions_are_capped():
+    index = SearchIndex.build([{'Name': f'ab{i:04d} x{i:04d}yz'} for i in range(500)])
+    prefix = index._expand('ab')
+    assert len(prefix) == MAX_EXPANSIONS
+    infix = index._expand('yz')
+    assert len(infix) == 0 # Too short for trigrams, and no term starts with it
+    infix = index._expand('0yz')
+    assert 0 < len(infix) <= MAX_EXPANSIONS and all(q == search_index.INFIX for _, q in infix)
+
+def test_candidates_are_capped_but_name_prefixes_still_rank(monkeypatch):
+    monkeypatch.setattr(search_index, 'MAX_CANDIDATES', 50)
+    rows = [{'Name': f'Circuit {i} kart'} for i in range(499)] + [{'Name': 'Kart Palace'}]
+    index = SearchIndex.build(rows)
+    hits = index.search('kart', limit=5)
+    assert len(hits) == 5 and hits[0][0] == 499
+    assert all(pos < 50 for pos, _ in hits[1:])
+
+def test_patched_index_matches_a_rebuild():
+    rows = records()
+    index = SearchIndex.build(rows)
+    new_rows = [rows[3], {'Name': 'Kartodrom Łódź', 'City': 'Łódź'}, rows[0], rows[4]]
+    reuse = np.array([3, -1, 0, 4])
+    patched = index.patched(reuse, [(1, new_rows[1])], [fold_text(r['Name']) for r in new_rows])
+    rebuilt = SearchIndex.build(new_rows)
+    for query in ["zurich", "lodz", "kart", "speedway", "genève"]:
+        assert patched.search(query) == rebuilt.search(query)
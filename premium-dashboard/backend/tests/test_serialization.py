@@ -0,0 +1,48 @@
+import json
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend import data_service, payloads
+from backend.data_service import build_track_records, json_column
+from backend.schemas import TrackRecord
+
+def test_json_column_coerces_whole_columns():
+    assert json_column(pd.Series([1.0, np.nan, np.inf, 2.5]), float).tolist() == [1.0, None, None, 2.5]
+    assert json_column(pd.Series(['3', 'x', None]), int).tolist() == [3, None, None]
+    assert json_column(pd.Series([10.0, 2.5, np.nan]), str).tolist() == ['10', '2.5', None]
+    assert json_column(pd.Series(['True', 'no', 'maybe', np.nan], name='Management Issues'), bool).tolist() == \
+        [True, False, None, None]
+    # Filter flags are never null
+    assert json_column(pd.Series(['1.0', 'false', 'maybe', np.nan], name='is_sim'), bool).tolist() == \
+        [True, False, True, False]
+
+def test_records_validate_against_the_schema(tracks_csv):
+    records = build_track_records(pd.read_csv(tracks_csv))
+    assert len(records) == 40
+    for record in records:
+        TrackRecord.model_validate(record)
+        assert isinstance(record['track_id'], int) and isinstance(record['is_indoor'], bool)
+        assert not any(isinstance(v, float) and not math.isfinite(v) for v in record.values())
+
+def test_consolidated_length_prefers_the_website():
+    frame = pd.DataFrame({'track_id': [1, 2, 3, 4], 'website_track_length_m': [800, -1, np.nan, 0],
+                          'track_length_m': [500, 600, 700, np.nan]})
+    assert [r['consolidated_track_length'] for r in build_track_records(frame)] == [800, 600, 700, 0]
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dumps_json_matches_the_stdlib(monkeypatch, use_orjson):
+    if use_orjson and payloads.orjson is None:
+        pytest.skip("orjson not installed")
+    if not use_orjson:
+        monkeypatch.setattr(payloads, 'orjson', None)
+    value = {'Name': 'Zürich "Kart"', 'n': 1, 'x': 2.5, 'flag': True, 'none': None, 'list': [1, 'a']}
+    assert json.loads(payloads.dumps_json(value)) == value
+    assert payloads.dumps_json({'a': 1}) == b'{"a":1}'
+
+def test_served_rows_are_the_records(tracks_csv, client):
+    snapshot = data_service.get_tracks_snapshot()
+    assert json.loads(bytes(snapshot.payload.identity)) == list(snapshot.records)
+    assert [json.loads(row) for row in snapshot.row_json] == list(snapshot.records)
@@ -0,0 +1,51 @@
+import json
+
+from backend import shapes_service
+from backend.data_service import file_signature
+from backend.geometry import LOD_LEVELS
+from backend.tests.conftest import circle_feature, write_geojson
+
+def lod_features(index, level):
+    with open(index.lod_paths[level]) as f:
+        return json.load(f)['features']
+
+def test_lod_levels_get_coarser_and_tiny_shapes_fall_back(shapes_file, tmp_path):
+    features = [circle_feature(1, 4, 50, radius=0.2), circle_feature(2, 5, 50, radius=0.0005)]
+    path = write_geojson(tmp_path / "lod.geojson", features)
+    index = shapes_service.build_shape_index(path, file_signature(path))
+    vertices = [len(lod_features(index, level)[0]['geometry']['coordinates'][0]) for level in range(len(LOD_LEVELS))]
+    assert vertices == sorted(vertices) and vertices[-1] <= 201
+    # Collapses at every tolerance: each level keeps the finest shape that survived (here the original)
+    for level in range(len(LOD_LEVELS)):
+        assert lod_features(index, level)[1]['geometry'] == features[1]['geometry']
+
+def test_rebuild_only_simplifies_changed_features(shapes_file, tmp_path, monkeypatch):
+    features = [circle_feature(i, 4 + i, 50) for i in range(6)]
+    path = write_geojson(tmp_path / "shapes.geojson", features)
+    first = shapes_service.build_shape_index(path, file_signature(path))
+
+    features[2] = circle_feature(2, 4.5, 51)
+    features.append(circle_feature(0, 9, 9)) # Duplicate id: the first feature wins
+    write_geojson(path, features)
+    simplified = []
+    simplify_levels = shapes_service.simplify_levels
+    monkeypatch.setattr(shapes_service, 'simplify_levels', lambda batch: simplified.extend(batch) or simplify_levels(batch))
+    patched = shapes_service.build_shape_index(path, file_signature(path), first)
+    assert [f['properties']['track_id'] for f in simplified] == [2]
+
+    monkeypatch.setattr(shapes_service, 'SHAPES_CACHE_DIR', str(tmp_path / "cold"))
+    cold = shapes_service.build_shape_index(path, file_signature(path))
+    assert patched.track_ids == cold.track_ids == [str(i) for i in range(6)]
+    assert patched.digests == cold.digests
+    assert (patched.spans == cold.spans).all() and (patched.bbox_array == cold.bbox_array).all()
+    for level in range(len(LOD_LEVELS)):
+        with open(patched.lod_paths[level], 'rb') as a, open(cold.lod_paths[level], 'rb') as b:
+            assert a.read() == b.read()
+
+def test_cache_dir_is_private(shapes_file, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "open"
+    cache_dir.mkdir(mode=0o777)
+    cache_dir.chmod(0o777)
+    monkeypatch.setattr(shapes_service, 'SHAPES_CACHE_DIR', str(cache_dir))
+    shapes_service.build_shape_index(shapes_file, file_signature(shapes_file))
+    assert cache_dir.stat().st_mode & 0o777 == 0o700
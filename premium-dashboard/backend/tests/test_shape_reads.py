@@ -0,0 +1,53 @@
+import json
+import os
+
+import pytest
+
+from backend import shapes_service
+from backend.data_service import file_signature
+from backend.geometry import LOD_LEVELS, lod_level_for
+from backend.tests.conftest import circle_feature, write_geojson
+
+def awkward_features():
+    features = [circle_feature(i, 4 + i * 0.5, 50, vertices=20) for i in range(1, 5)]
+    # Braces, brackets and escaped quotes inside strings must not confuse the byte scanner
+    features[1]['properties']['note'] = 'say "}]{" \\ twice'
+    features[2]['properties']['track_id'] = "3"
+    features[3]['geometry'] = None
+    return features
+
+def test_features_are_read_back_byte_for_byte(shapes_file, tmp_path, monkeypatch):
+    features = awkward_features()
+    path = write_geojson(tmp_path / "awkward.geojson", features)
+    monkeypatch.setattr(shapes_service, 'GEOJSON_PATH', path)
+    index = shapes_service.build_shape_index(path, file_signature(path))
+    assert index.track_ids == ['1', '2', '3', '4']
+    for feature, track_id in zip(features, index.track_ids):
+        assert json.loads(shapes_service.read_feature(index, track_id)) == feature
+    assert shapes_service.read_feature(index, '99') is None
+
+def test_rewritten_file_falls_back_to_the_finest_lod_copy(shapes_file, monkeypatch):
+    index = shapes_service.build_shape_index(shapes_file, file_signature(shapes_file))
+    finest = shapes_service.read_feature(index, '2', len(LOD_LEVELS) - 1)
+    # The enrichment script rewrites the file; offsets are stale until the re-index swaps in
+    write_geojson(shapes_file, [circle_feature(9, 0, 0)] * 3)
+    os.utime(shapes_file, ns=(index.signature[0] + 10**9, index.signature[0] + 10**9))
+    assert shapes_service.read_feature(index, '2') == finest
+    assert json.loads(finest)['properties']['track_id'] == 2
+
+@pytest.mark.parametrize("zoom, tolerance, level", [
+    (3, None, 0), (5, None, 0), (6, None, 1), (11, None, 2), (12, None, None),
+    (None, 0.05, 0), (None, 0.005, 1), (None, 0.0001, None), (None, None, None),
+])
+def test_lod_level_for(zoom, tolerance, level):
+    assert lod_level_for(zoom=zoom, tolerance=tolerance) == level
+
+def test_shape_route_serves_levels(shapes_file, client):
+    shapes_service.get_shape_index(wait=True)
+    full = client.get("/api/tracks/1/shape")
+    assert full.status_code == 200
+    etag = full.headers['ETag']
+    coarse = client.get("/api/tracks/1/shape", params={"zoom": 4})
+    assert len(coarse.json()['geometry']['coordinates'][0]) < len(full.json()['geometry']['coordinates'][0])
+    assert client.get("/api/tracks/1/shape", headers={'If-None-Match': etag}).status_code == 304
+    assert client.get("/api/tracks/99/shape").status_code == 404
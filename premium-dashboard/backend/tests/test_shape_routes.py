@@ -0,0 +1,37 @@
+import threading
+
+from backend import shapes_service
+from backend.snapshot_cache import SnapshotCache
+
+COLD_ROUTES = [
+    '/api/tracks/shapes/index',
+    '/api/tracks/1/shape',
+    '/api/tracks/shapes?zoom=4',
+    '/api/tiles/isochrones/4/8/5',
+]
+
+def test_shape_routes_answer_503_while_the_first_index_builds(client, shapes_file, monkeypatch):
+    release = threading.Event()
+
+    def slow_build(signature, previous):
+        assert release.wait(10)
+        return shapes_service._build_shapes(signature, previous)
+
+    monkeypatch.setattr(shapes_service, '_shape_cache', SnapshotCache('shapes', 'shape_index', slow_build, required=False))
+    for url in COLD_ROUTES:
+        response = client.get(url)
+        assert response.status_code == 503, url
+        assert int(response.headers['retry-after']) > 0
+    # The original file needs no index
+    assert client.get('/api/tracks/shapes').status_code == 200
+
+    release.set()
+    assert shapes_service.get_shape_index(wait=True) is not None
+    for url in COLD_ROUTES:
+        assert client.get(url).status_code == 200, url
+
+def test_shape_routes_without_shapes_data(client, shapes_file, monkeypatch):
+    monkeypatch.setattr(shapes_service, 'GEOJSON_PATH', shapes_file + '.missing')
+    assert client.get('/api/tracks/shapes/index').json() == {"count": 0, "track_ids": []}
+    assert client.get('/api/tracks/1/shape').status_code == 404
+    assert client.get('/api/tiles/isochrones/4/8/5').status_code == 404
@@ -0,0 +1,79 @@
+import gzip
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend import data_service, shared_snapshot
+from backend.payloads import brotli
+
+def same_frame(a, b):
+    assert list(a.columns) == list(b.columns)
+    for column in a.columns:
+        assert a[column].dtype == b[column].dtype, column
+        x, y = np.asarray(a[column].to_numpy()), b[column].to_numpy()
+        assert np.array_equal(x, y, equal_nan=x.dtype.kind == 'f'), column
+
+@pytest.fixture
+def published(tracks_csv, tmp_path):
+    root = str(tmp_path / "shared")
+    local = data_service.build_tracks_snapshot((1,))
+    shared = shared_snapshot.load_or_publish((1,), lambda: local, data_service.TrackSnapshot.assemble, root)
+    return root, local, shared
+
+def test_attached_snapshot_serves_the_same_data(published):
+    root, local, shared = published
+    assert os.stat(root).st_mode & 0o777 == 0o700
+    assert shared.payload.etag == local.payload.etag
+    assert bytes(shared.payload.identity) == bytes(local.payload.identity)
+    assert gzip.decompress(bytes(shared.payload.gzip)) == bytes(local.payload.identity)
+    assert bytes(shared.columns_payload.identity) == bytes(local.columns_payload.identity)
+    assert all(bytes(shared.stats_payloads[k].identity) == bytes(local.stats_payloads[k].identity) for k in local.stats_payloads)
+    same_frame(shared.frame, local.frame)
+    assert list(shared.records) == list(local.records)
+    assert dict(shared.positions_by_id.items()) == dict(local.positions_by_id.items())
+    for search, sort in [('', None), ('kart', '-pps'), ('ü', 'name'), ('a', '-name')]:
+        a, b = data_service.query_tracks(shared, search=search, sort=sort), data_service.query_tracks(local, search=search, sort=sort)
+        assert a[0] == b[0] and np.array_equal(a[1], b[1])
+    for query in ['k', 'kart', 'racing park']:
+        assert data_service.search_tracks(shared, query) == data_service.search_tracks(local, query)
+    assert np.array_equal(shared.spatial.bbox(-10, 35, 20, 60), local.spatial.bbox(-10, 35, 20, 60))
+
+def test_second_worker_attaches_without_building(published):
+    root, local, shared = published
+    again = shared_snapshot.load_or_publish((1,), lambda: pytest.fail("built twice"), data_service.TrackSnapshot.assemble, root)
+    assert again.payload.etag == local.payload.etag
+    if brotli is not None:
+        # Brotli compressed by one worker is picked up by the others
+        assert again.payload.br is None
+        shared.compress_br()
+        assert brotli.decompress(bytes(again.payload.br)) == bytes(local.payload.identity)
+
+def test_reload_from_an_attached_snapshot(published, tracks_csv):
+    root, local, shared = published
+    frame = pd.read_csv(tracks_csv)
+    frame.loc[[2, 9], 'Name'] = ['Renamed A', 'Renamed B']
+    frame.to_csv(tracks_csv, index=False)
+    patched = shared_snapshot.load_or_publish(
+        (2,), lambda: data_service.build_tracks_snapshot((2,), shared), data_service.TrackSnapshot.assemble, root)
+    cold = data_service.build_tracks_snapshot((3,))
+    assert bytes(patched.payload.identity) == bytes(cold.payload.identity)
+    same_frame(patched.frame, cold.frame)
+    assert data_service.diff_snapshots(shared, patched) == (frame.loc[[2, 9], 'track_id'].tolist(), [])
+    assert len([name for name in os.listdir(root) if not name.startswith('.')]) == 2
+
+def test_untrusted_directories_fall_back_to_a_private_build(published, tmp_path):
+    root, local, _ = published
+    os.chmod(root, 0o777)
+    shared_snapshot.private_dir(root)
+    assert os.stat(root).st_mode & 0o777 == 0o700
+    # A symlink (or a directory owned by someone else) is refused
+    link = str(tmp_path / "link")
+    os.symlink(root, link)
+    with pytest.raises(PermissionError):
+        shared_snapshot.private_dir(link)
+    assert shared_snapshot.load_or_publish((1,), lambda: "private", data_service.TrackSnapshot.assemble, link) == "private"
+    not_a_dir = tmp_path / "file"
+    not_a_dir.write_text("")
+    assert shared_snapshot.load_or_publish((1,), lambda: "private", data_service.TrackSnapshot.assemble, str(not_a_dir)) == "private"
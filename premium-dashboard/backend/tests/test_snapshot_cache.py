@@ -0,0 +1,76 @@
+import threading
+import time
+
+from backend.snapshot_cache import SnapshotCache
+
+class Built:
+    def __init__(self, signature, previous):
+        self.signature = signature
+        self.previous = previous
+
+class SlowBuild:
+    """
+    Counts builds and holds each one until `release` is set.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, signature, previous):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        if signature == 'broken':
+            raise ValueError("half-written file")
+        return Built(signature, previous)
+
+def test_cold_required_cache_builds_once_for_concurrent_callers():
+    build = SlowBuild()
+    cache = SnapshotCache('test', 'test', build)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(1))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    assert build.started.wait(5)
+    build.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert build.calls == 1
+    assert len(results) == 8 and all(r is results[0] and r.signature == 1 for r in results)
+
+def test_cold_optional_cache_returns_none_without_waiting():
+    build = SlowBuild()
+    cache = SnapshotCache('test', 'test', build, required=False)
+    start = time.perf_counter()
+    assert cache.get(1) is None
+    assert build.started.wait(5)
+    # Further callers neither wait nor start a second build
+    assert cache.get(1) is None and cache.building
+    assert time.perf_counter() - start < 1
+    build.release.set()
+    assert cache.get(1, wait=True).signature == 1
+    assert build.calls == 1 and not cache.building
+
+def test_changed_file_serves_stale_while_one_rebuild_runs():
+    build = SlowBuild()
+    build.release.set()
+    cache = SnapshotCache('test', 'test', build)
+    first = cache.get(1)
+    build.release.clear()
+    assert cache.get(2) is first
+    assert cache.get(2) is first
+    build.release.set()
+    second = cache.get(2, wait=True)
+    assert second.signature == 2 and second.previous is first
+    assert build.calls == 2
+
+def test_failed_generation_is_not_retried_until_the_file_changes():
+    build = SlowBuild()
+    build.release.set()
+    cache = SnapshotCache('test', 'test', build)
+    first = cache.get(1)
+    assert cache.get('broken', wait=True) is first
+    assert cache.get('broken', wait=True) is first
+    assert build.calls == 2
+    assert cache.get(3, wait=True).signature == 3
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from backend.spatial import TrackSpatialIndex, haversine_km
+
+def random_points(n=2000, seed=3):
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(-89, 89, n)
+    lons = rng.uniform(-180, 180, n)
+    lats[:5] = np.nan # Tracks without coordinates are never returned
+    lons[5] = 200
+    return lats, lons
+
+def test_near_matches_brute_force():
+    lats, lons = random_points()
+    index = TrackSpatialIndex(lats, lons)
+    for lat, lon, radius in [(52, 5, 800), (0, 179.5, 600), (-88, 10, 900), (30, -170, 3000), (10, 10, 20000)]:
+        distances = haversine_km(lat, lon, lats, lons)
+        distances[np.abs(lons) > 180] = np.inf
+        expected = np.flatnonzero(distances <= radius)
+        expected = expected[np.argsort(distances[expected], kind='stable')]
+        positions, found = index.near(lat, lon, radius, limit=len(lats))
+        assert set(positions) == set(expected)
+        assert np.all(np.diff(found) >= 0) and np.allclose(found, distances[positions])
+        limited, _ = index.near(lat, lon, radius, limit=10)
+        assert list(limited) == list(positions[:10])
+
+def test_bbox_matches_brute_force_and_wraps_the_antimeridian():
+    lats, lons = random_points()
+    index = TrackSpatialIndex(lats, lons)
+    for west, south, east, north in [(0, 40, 10, 50), (170, -20, -170, 20), (-180, -90, 180, 90)]:
+        inside = (lats >= south) & (lats <= north)
+        inside &= ((lons >= west) & (lons <= east)) if west <= east else ((lons >= west) | (lons <= east))
+        inside &= np.abs(lons) <= 180
+        assert set(index.bbox(west, south, east, north)) == set(np.flatnonzero(inside))
+
+def test_near_and_bbox_routes(tracks_csv, client):
+    frame = pd.read_csv(tracks_csv)
+    lat, lon = frame.loc[0, 'Latitude'], frame.loc[0, 'Longitude']
+    near = client.get("/api/tracks/near", params={"lat": lat, "lon": lon, "radius_km": 500, "limit": 5}).json()
+    assert near['items'][0]['track_id'] == frame.loc[0, 'track_id'] and near['items'][0]['distance_km'] == 0
+    assert near['count'] == len(near['items']) <= 5
+    assert [item['distance_km'] for item in near['items']] == sorted(item['distance_km'] for item in near['items'])
+
+    box = client.get("/api/tracks/bbox", params={"west": lon - 1, "south": lat - 1, "east": lon + 1, "north": lat + 1}).json()
+    assert frame.loc[0, 'track_id'] in [item['track_id'] for item in box['items']]
+    assert client.get("/api/tracks/bbox", params={"west": 0, "south": 10, "east": 1, "north": 5}).status_code == 400
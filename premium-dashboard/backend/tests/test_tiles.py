@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+
+import numpy as np
+
+from backend import shapes_service
+from backend.geometry import TILE_BUFFER, TILE_EXTENT, clip_and_quantize, mercator_lat, mercator_y, tile_bounds
+
+def lon_lat_to_tile(lon, lat, z):
+    n = 2 ** z
+    return int((lon + 180) / 360 * n), int((1 - mercator_y(lat) / np.pi) / 2 * n)
+
+def test_clip_and_quantize_snaps_to_the_mercator_grid():
+    bounds = tile_bounds(10, *lon_lat_to_tile(4.5, 52.1, 10))
+    west, south, east, north = bounds
+    square = [[west - 1, south - 1], [east + 1, south - 1], [east + 1, north + 1], [west - 1, north + 1], [west - 1, south - 1]]
+    ring = np.array(clip_and_quantize({'type': 'Polygon', 'coordinates': [square]}, bounds)['coordinates'][0])
+    assert (ring[0] == ring[-1]).all()
+
+    top, bottom = mercator_y(north), mercator_y(south)
+    gx = (ring[:, 0] - west) / (east - west) * TILE_EXTENT
+    gy = (mercator_y(ring[:, 1]) - bottom) / (top - bottom) * TILE_EXTENT
+    # Corners of the buffered tile, on whole grid cells of the projected tile
+    assert sorted(set(np.round(gx).astype(int))) == [-TILE_BUFFER, TILE_EXTENT + TILE_BUFFER]
+    assert sorted(set(np.round(gy).astype(int))) == [-TILE_BUFFER, TILE_EXTENT + TILE_BUFFER]
+    assert np.abs(gx - np.round(gx)).max() < 0.05 and np.abs(gy - np.round(gy)).max() < 0.05
+
+def test_clip_drops_outside_shapes_and_collapsed_holes():
+    bounds = tile_bounds(12, *lon_lat_to_tile(4.5, 52.1, 12))
+    west, south, east, north = bounds
+    far = [[w + 10, s] for w, s in [[west, south], [east, south], [east, north], [west, north], [west, south]]]
+    assert clip_and_quantize({'type': 'Polygon', 'coordinates': [far]}, bounds) is None
+    outer = [[west, south], [east, south], [east, north], [west, north], [west, south]]
+    x, y = (west + east) / 2, (south + north) / 2
+    hole = [[x, y], [x + 1e-7, y], [x + 1e-7, y + 1e-7], [x, y]]
+    clipped = clip_and_quantize({'type': 'MultiPolygon', 'coordinates': [[outer, hole], [far]]}, bounds)
+    assert clipped['type'] == 'Polygon' and len(clipped['coordinates']) == 1
+
+def test_mercator_round_trip():
+    lats = np.array([-85, -45.5, 0, 12.3456789, 52.1, 85])
+    assert np.allclose(mercator_lat(mercator_y(lats)), lats)
+
+def test_tiles_hold_the_shapes_under_them(shapes_file):
+    index = shapes_service.build_shape_index(shapes_file, shapes_service.file_signature(shapes_file))
+    # Track 1 is centred on (4.5, 50.3)
+    body = shapes_service.get_tile_payload(index, 11, *lon_lat_to_tile(4.5, 50.3, 11)).identity
+    assert [f['properties']['track_id'] for f in json.loads(body)['features']] == [1]
+    empty = shapes_service.get_tile_payload(index, 9, *lon_lat_to_tile(-60, -30, 9))
+    assert json.loads(empty.identity)['features'] == []
+    assert empty.br is None # gzip only on the request path
+
+def test_concurrent_misses_render_once(shapes_file, monkeypatch):
+    index = shapes_service.build_shape_index(shapes_file, shapes_service.file_signature(shapes_file))
+    renders = []
+
+    def slow_render(*args):
+        renders.append(args)
+        time.sleep(0.2)
+        return b'{"type":"FeatureCollection","features":[]}'
+
+    monkeypatch.setattr(shapes_service, 'render_tile', slow_render)
+    payloads = []
+    threads = [threading.Thread(target=lambda: payloads.append(shapes_service.get_tile_payload(index, 3, 4, 2)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(renders) == 1 and len(payloads) == 5
+    assert all(payload is payloads[0] for payload in payloads)
+
+def test_tile_cache_is_bounded_by_bytes(shapes_file, monkeypatch):
+    index = shapes_service.build_shape_index(shapes_file, shapes_service.file_signature(shapes_file))
+    monkeypatch.setattr(shapes_service, 'render_tile', lambda index, z, x, y: bytes(1000))
+    tile_size = lambda x: shapes_service._payload_size(shapes_service.get_tile_payload(index, 5, x, 0))
+    budget = tile_size(0) + tile_size(1) + tile_size(2)
+    monkeypatch.setattr(shapes_service, 'TILE_CACHE_BYTES', budget)
+    tile_size(0) # Most recently used again: tile 1 is evicted first
+    tile_size(3)
+    assert [key[2] for key in shapes_service._tile_cache] == [2, 0, 3]
+    assert shapes_service._tile_cache_bytes <= budget
+    assert shapes_service._tile_cache_bytes == sum(map(shapes_service._payload_size, shapes_service._tile_cache.values()))
@@ -0,0 +1,89 @@
+import json
+import os
+
+import pandas as pd
+
+from backend import data_service, shared_snapshot
+from backend.shared_snapshot import follow_changes
+from backend.snapshot_cache import SnapshotCache
+
+def rewrite(path, frame):
+    """
+    Rewrites the CSV the way the enrichment scripts do and makes sure the signature moves.
+    """
+    before = os.stat(path).st_mtime_ns
+    frame.to_csv(path, index=False)
+    os.utime(path, ns=(before + 10**9, before + 10**9))
+    return data_service.get_tracks_snapshot(wait=True)
+
+def parse_event(event: bytes):
+    lines = dict(line.split(': ', 1) for line in event.decode('utf-8').strip().split('\n'))
+    return lines['event'], lines['id'], json.loads(lines['data'])
+
+def edit(frame):
+    frame = frame.copy()
+    frame.loc[3, 'Name'] = 'Renamed Kart Center'
+    removed = int(frame.loc[7, 'track_id'])
+    return frame.drop(index=7), int(frame.loc[3, 'track_id']), removed
+
+def test_reload_patches_the_snapshot_and_streams_a_delta(tracks_csv):
+    first = data_service.get_tracks_snapshot()
+    frame, renamed, removed = edit(pd.read_csv(tracks_csv))
+    patched = rewrite(tracks_csv, frame)
+    assert patched is not first
+
+    # Patched in place of the unchanged rows, but identical to a cold build
+    cold = data_service.build_tracks_snapshot(data_service.file_signature(tracks_csv))
+    assert patched.payload.etag == cold.payload.etag
+    assert bytes(patched.payload.identity) == bytes(cold.payload.identity)
+    assert bytes(patched.columns_payload.identity) == bytes(cold.columns_payload.identity)
+    assert list(patched.records) == list(cold.records)
+
+    event, event_id, data = parse_event(data_service.build_change_event(patched, first.payload.etag))
+    assert event == 'delta' and event_id == data['etag'] == patched.payload.etag
+    assert [t['track_id'] for t in data['upserts']] == [renamed]
+    assert data['upserts'][0]['Name'] == 'Renamed Kart Center'
+    assert data['removed'] == [removed] and data['total'] == len(frame)
+
+def test_deltas_compose_and_unknown_generations_reset(tracks_csv):
+    first = data_service.get_tracks_snapshot()
+    original = pd.read_csv(tracks_csv)
+    frame, renamed, removed = edit(original)
+    second = rewrite(tracks_csv, frame)
+    frame.loc[0, 'City'] = 'Elsewhere'
+    rewrite(tracks_csv, frame)
+    restored = rewrite(tracks_csv, original)
+    assert restored.payload.etag == first.payload.etag
+
+    assert data_service.changes_since(restored, restored.payload.etag) == (set(), set())
+    # The removed track came back: an upsert, not a removal
+    moved = int(original.loc[0, 'track_id'])
+    assert data_service.changes_since(restored, second.payload.etag) == ({renamed, removed, moved}, set())
+    event, _, data = parse_event(data_service.build_change_event(restored, 'f' * 20))
+    assert event == 'reset' and data == {'etag': restored.payload.etag}
+
+def test_other_workers_resume_from_the_shared_change_log(tracks_csv, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_service, 'SHARED_SNAPSHOT_DIR', str(tmp_path / "shared"))
+    monkeypatch.setattr(shared_snapshot, 'SHARED_SNAPSHOT_DIR', str(tmp_path / "shared"))
+    first = data_service.get_tracks_snapshot()
+    frame, renamed, removed = edit(pd.read_csv(tracks_csv))
+    second = rewrite(tracks_csv, frame)
+    frame.loc[0, 'City'] = 'Elsewhere'
+    third = rewrite(tracks_csv, frame)
+    assert os.listdir(tmp_path / "shared" / ".changes")
+
+    # A worker that started after these reloads has none of them in its own log
+    monkeypatch.setattr(data_service, '_change_log', data_service.deque(maxlen=data_service.CHANGE_LOG_SIZE))
+    monkeypatch.setattr(data_service, '_tracks_cache',
+                        SnapshotCache('tracks', 'tracks_snapshot', data_service._build_tracks, on_swap=data_service.record_change))
+    worker = data_service.get_tracks_snapshot()
+    assert worker.payload.etag == third.payload.etag
+    upserts, gone = data_service.changes_since(worker, first.payload.etag)
+    assert upserts == {renamed, int(frame.loc[0, 'track_id'])} and gone == {removed}
+    assert data_service.changes_since(worker, second.payload.etag) == ({int(frame.loc[0, 'track_id'])}, set())
+
+def test_follow_changes_skips_links_off_the_path():
+    links = [('a', 'b'), ('a', 'c'), ('b', 'd'), ('c', 'e'), ('d', 'e')]
+    assert follow_changes(links, 'a', 'e') == [0, 2, 4]
+    assert follow_changes(links, 'c', 'e') == [3]
+    assert follow_changes(links, 'e', 'a') is None
@@ -0,0 +1,54 @@
+import base64
+import os
+
+import pandas as pd
+import pytest
+
+from backend import data_service
+
+def test_cursor_round_trip(tracks_csv):
+    snapshot = data_service.get_tracks_snapshot()
+    for offset in (0, 1, 500, 10**11):
+        cursor = data_service.encode_cursor(snapshot, offset)
+        assert '=' not in cursor
+        assert data_service.decode_cursor(snapshot, cursor) == offset
+
+@pytest.mark.parametrize("cursor", ["%%%", "abc", "ééé", "", base64.urlsafe_b64encode(b"\xff\xfe:1").decode(),
+                                    base64.urlsafe_b64encode(b"abc:-1").decode(), base64.urlsafe_b64encode(b"ABC:1").decode()])
+def test_malformed_cursors(tracks_csv, client, cursor):
+    snapshot = data_service.get_tracks_snapshot()
+    with pytest.raises(ValueError):
+        data_service.decode_cursor(snapshot, cursor)
+    if cursor:
+        response = client.get("/api/tracks/query", params={"cursor": cursor})
+        assert response.status_code == 400 and response.json() == {"detail": "Invalid cursor"}
+
+def test_pages_cover_every_match_once(tracks_csv, client):
+    everything = client.get("/api/tracks/query", params={"ids_only": True, "limit": 5000}).json()
+    assert everything['next_cursor'] is None and everything['total'] == len(everything['ids']) > 7
+
+    ids, params = [], {"limit": 7, "sort": "-pps"}
+    while True:
+        page = client.get("/api/tracks/query", params=params).json()
+        assert page['total'] == everything['total'] and page['count'] == len(page['items'])
+        ids += [item['track_id'] for item in page['items']]
+        if not page['next_cursor']:
+            break
+        params['cursor'] = page['next_cursor']
+    assert sorted(ids) == sorted(everything['ids'])
+    pps = pd.read_csv(tracks_csv).set_index('track_id')['disposable_income_pps'].fillna(0)
+    assert list(pps[ids]) == sorted(pps[ids], reverse=True)
+
+def test_cursor_from_an_older_generation_conflicts(tracks_csv, client):
+    page = client.get("/api/tracks/query", params={"limit": 5}).json()
+    frame = pd.read_csv(tracks_csv)
+    frame.loc[0, 'Name'] = 'Changed'
+    before = os.stat(tracks_csv).st_mtime_ns
+    frame.to_csv(tracks_csv, index=False)
+    os.utime(tracks_csv, ns=(before + 10**9, before + 10**9))
+    data_service.get_tracks_snapshot(wait=True)
+    response = client.get("/api/tracks/query", params={"limit": 5, "cursor": page['next_cursor']})
+    assert response.status_code == 409
+
+def test_unknown_sort_key(tracks_csv, client):
+    assert client.get("/api/tracks/query", params={"sort": "-nope"}).status_code == 400
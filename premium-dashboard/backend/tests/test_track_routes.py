@@ -0,0 +1,18 @@
+import pandas as pd
+
+def test_columns_name_the_tracks_etag_and_records_load_on_demand(tracks_csv, client):
+    columns = client.get("/api/tracks/columns")
+    assert columns.status_code == 200
+    tracks = client.get("/api/tracks")
+    assert columns.headers["X-Tracks-ETag"] == tracks.headers["ETag"].strip('"').split('-')[0]
+
+    ids = pd.read_csv(tracks_csv)['track_id'].tolist()
+    records = client.get("/api/tracks/records", params={"ids": [ids[5], 999999999, ids[2]]})
+    assert records.status_code == 200
+    by_id = {record['track_id']: record for record in tracks.json()}
+    assert records.json() == [by_id[ids[5]], by_id[ids[2]]]
+
+def test_records_validate_ids(tracks_csv, client):
+    assert client.get("/api/tracks/records").status_code == 422
+    assert client.get("/api/tracks/records", params={"ids": "x"}).status_code == 422
+    assert client.get("/api/tracks/records", params={"ids": list(range(1001))}).status_code == 400
@@ -0,0 +1,74 @@
+import json
+import sqlite3
+import threading
+
+import pandas as pd
+
+from backend import wishlist_store
+
+def test_legacy_json_is_migrated_once_in_order(wishlist_db):
+    wishlist_db.write_text(json.dumps({"alice": [30, 10, 20], "bob": [5]}))
+    assert wishlist_store.load_wishlist("alice") == [30, 10, 20]
+    assert wishlist_store.load_wishlist("bob") == [5]
+
+    # A second worker (fresh connection, fresh process state) must not import it again
+    wishlist_db.write_text(json.dumps({"alice": [99]}))
+    wishlist_store._initialized = False
+    wishlist_store._local = threading.local()
+    assert wishlist_store.load_wishlist("alice") == [30, 10, 20]
+
+def test_add_and_remove_are_idempotent_and_per_user(wishlist_db):
+    assert wishlist_store.update_wishlist("alice", 1, "add") == [1]
+    assert wishlist_store.update_wishlist("alice", 2, "add") == [1, 2]
+    assert wishlist_store.update_wishlist("alice", 1, "add") == [1, 2]
+    assert wishlist_store.update_wishlist("bob", 2, "add") == [2]
+    assert wishlist_store.update_wishlist("alice", 1, "remove") == [2]
+    assert wishlist_store.update_wishlist("alice", 1, "remove") == [2]
+    assert wishlist_store.update_wishlist("alice", 3, "toggle") == [2]
+
+def test_concurrent_writers_lose_nothing(wishlist_db):
+    def add(start):
+        for track_id in range(start, start + 25):
+            wishlist_store.update_wishlist("alice", track_id, "add")
+
+    threads = [threading.Thread(target=add, args=(i * 25,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(wishlist_store.load_wishlist("alice")) == list(range(100))
+    conn = sqlite3.connect(wishlist_store.DB_PATH)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_wishlist_routes(wishlist_db, client):
+    assert client.get("/api/wishlist").json() == []
+    assert client.post("/api/wishlist", json={"track_id": 7, "action": "add"}).json() == [7]
+    assert client.get("/api/wishlist").json() == [7]
+
+def test_bulk_update_orders_adds_and_lets_removes_win(wishlist_db):
+    wishlist_store.update_wishlist("alice", 1, "add")
+    assert wishlist_store.bulk_update_wishlist("alice", add=[5, 3, 5, 4, 1], remove=[4, 8]) == [1, 5, 3]
+    assert wishlist_store.bulk_update_wishlist("alice", add=[], remove=[1, 3]) == [5]
+
+def test_bulk_update_is_all_or_nothing(wishlist_db):
+    wishlist_store.update_wishlist("alice", 1, "add")
+    # The adds succeed, then binding an unsupported id fails the removes: nothing may stick
+    try:
+        wishlist_store.bulk_update_wishlist("alice", add=[2, 3], remove=[1, object()])
+    except sqlite3.Error:
+        pass
+    else:
+        raise AssertionError("bulk update should have failed")
+    assert wishlist_store.load_wishlist("alice") == [1]
+    # The connection is usable again afterwards
+    assert wishlist_store.bulk_update_wishlist("alice", add=[2], remove=[]) == [1, 2]
+
+def test_bulk_and_expanded_routes(wishlist_db, tracks_csv, client):
+    ids = pd.read_csv(tracks_csv)['track_id'].head(3).tolist()
+    response = client.post("/api/wishlist/bulk", json={"add": [ids[2], ids[0], 999999999], "remove": []})
+    assert response.json() == [ids[2], ids[0], 999999999]
+    expanded = client.get("/api/wishlist", params={"expand": True}).json()
+    # Unknown ids are skipped; records come in wishlist order
+    assert [track['track_id'] for track in expanded] == [ids[2], ids[0]]
+    assert client.post("/api/wishlist/bulk", json={"add": list(range(600)), "remove": list(range(401))}).status_code == 400
+    assert client.get("/api/wishlist").json() == [ids[2], ids[0], 999999999]
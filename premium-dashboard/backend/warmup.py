@@ -0,0 +1,130 @@
+import asyncio
+import time
+from typing import Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from .auth import load_users
+from .data_service import get_tracks_snapshot
+from .geometry import LOD_LEVELS
+from .monitoring import Gauge, registry
+from .shapes_service import get_shape_index, resolve_shapes_file
+from .wishlist_store import get_connection
+
+def _warm_tracks() -> dict:
+    snapshot = get_tracks_snapshot(wait=True)
+    if snapshot is None:
+        raise RuntimeError("Track data not available")
+    return {"rows": len(snapshot.row_json), "etag": snapshot.payload.etag}
+
+def _warm_shapes() -> dict:
+    index = get_shape_index(wait=True)
+    if index is None:
+        return {"features": 0}
+    # Starts rebuilding stale .br/.gz siblings in the background; not waited for
+    for level in [None] + list(range(len(LOD_LEVELS))):
+        resolve_shapes_file("br, gzip", level)
+    return {"features": len(index), "etag": index.etag}
+
+def _warm_users() -> dict:
+    return {"users": len(load_users())}
+
+def _warm_wishlist() -> dict:
+    get_connection()
+    return {}
+
+# (name, build, required): readiness waits for every required stage.
+# Shapes are optional: the map works without isochrones, so a broken GeoJSON must not keep
+# the instance out of rotation. Until the index is built, shape and tile routes answer 503 with
+# Retry-After (see require_shape_index in main.py) rather than waiting for it.
+WARMUP_STAGES = [
+    ("tracks", _warm_tracks, True),
+    ("users", _warm_users, True),
+    ("wishlist", _warm_wishlist, True),
+    ("shapes", _warm_shapes, False),
+]
+
+class WarmupState:
+    """
+    Progress of the startup warm-up, served by /api/ready.
+    """
+    def __init__(self, stages=WARMUP_STAGES):
+        self.stages = stages
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.results = {name: {"status": "pending", "required": required} for name, _, required in stages}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return all(r["status"] == "ready" for r in self.results.values() if r["required"])
+
+    async def _run_stage(self, name: str, build: Callable[[], dict]):
+        result = self.results[name]
+        result["status"] = "running"
+        start = time.perf_counter()
+        try:
+            # Stages parse files and hash passwords; keep the event loop free for probes
+            result.update(await run_in_threadpool(build))
+            result["status"] = "ready"
+            result.pop("error", None)
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
+            print(f"ERROR: Warm-up stage '{name}' failed: {e}")
+        result["seconds"] = round(time.perf_counter() - start, 3)
+
+    async def run(self):
+        self.started_at = time.time()
+        for name, build, _ in self.stages:
+            await self._run_stage(name, build)
+        self.finished_at = time.time()
+        state = "ready" if self.ready else "NOT ready"
+        print(f"SUCCESS: Warm-up finished in {self.finished_at - self.started_at:.2f}s, instance {state}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def retry_failed(self):
+        """
+        Re-runs required stages that failed (e.g. the CSV was missing at boot), at most one at a time.
+        """
+        if self._task is not None and not self._task.done():
+            return
+        failed = [(n, b, r) for n, b, r in self.stages if r and self.results[n]["status"] == "failed"]
+        if failed:
+            async def rerun():
+                for name, build, _ in failed:
+                    await self._run_stage(name, build)
+            self._task = asyncio.get_running_loop().create_task(rerun())
+
+    def describe(self) -> dict:
+        if self.ready:
+            status = "ready" # Optional stages may still be running; see "stages"
+        elif self.finished_at is None:
+            status = "warming_up" if self.started_at is not None else "starting"
+        else:
+            status = "failed"
+        end = self.finished_at or time.time()
+        return {
+            "ready": self.ready,
+            "status": status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "seconds": round(end - self.started_at, 3) if self.started_at else None,
+            "stages": self.results,
+        }
+
+warmup = WarmupState()
+registry.register(Gauge('mp_ready', '1 once every required warm-up stage has finished.',
+                        source=lambda: int(warmup.ready)))
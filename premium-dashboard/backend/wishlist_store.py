@@ -0,0 +1,129 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List
+
+from .data_service import ROOT_DIR, WISHLIST_PATH
+
+DB_PATH = os.environ.get("MP_DB_PATH", os.path.join(ROOT_DIR, "mp_intelligence.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wishlist (
+    username TEXT NOT NULL,
+    track_id INTEGER NOT NULL,
+    added_at REAL NOT NULL,
+    PRIMARY KEY (username, track_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS wishlist_user_added ON wishlist (username, added_at);
+CREATE TABLE IF NOT EXISTS schema_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+def get_connection() -> sqlite3.Connection:
+    """
+    One connection per thread (sqlite3 connections are not shareable across threads).
+    WAL lets readers proceed while another worker or process writes.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(DB_PATH, timeout=5.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    _local.conn = conn
+    _ensure_schema(conn)
+    return conn
+
+def _ensure_schema(conn: sqlite3.Connection):
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        conn.executescript(SCHEMA)
+        migrate_wishlist_json(conn)
+        _initialized = True
+
+def migrate_wishlist_json(conn: sqlite3.Connection):
+    """
+    One-time import of the legacy wishlist.json. Runs in a single write transaction,
+    so concurrent workers starting together import it exactly once.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        done = conn.execute("SELECT value FROM schema_meta WHERE key = 'wishlist_json_migrated'").fetchone()
+        if done is None:
+            data = {}
+            if os.path.exists(WISHLIST_PATH):
+                try:
+                    with open(WISHLIST_PATH, 'r') as f:
+                        data = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"WARNING: Could not read {WISHLIST_PATH} for migration: {e}")
+            # Spread timestamps so the original list order survives
+            base = time.time()
+            rows = [
+                (username, int(track_id), base + i * 1e-6)
+                for username, track_ids in data.items()
+                for i, track_id in enumerate(track_ids)
+            ]
+            conn.executemany("INSERT OR IGNORE INTO wishlist (username, track_id, added_at) VALUES (?, ?, ?)", rows)
+            conn.execute(
+                "INSERT INTO schema_meta (key, value) VALUES ('wishlist_json_migrated', ?)",
+                (f"{len(rows)} rows at {time.strftime('%Y-%m-%dT%H:%M:%S')}",)
+            )
+            print(f"SUCCESS: Migrated {len(rows)} wishlist entries from {WISHLIST_PATH}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def load_wishlist(username: str) -> List[int]:
+    rows = get_connection().execute(
+        "SELECT track_id FROM wishlist WHERE username = ? ORDER BY added_at, track_id", (username,)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+def update_wishlist(username: str, track_id: int, action: str) -> List[int]:
+    conn = get_connection()
+    if action == "add":
+        conn.execute(
+            "INSERT INTO wishlist (username, track_id, added_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (username, track_id) DO NOTHING",
+            (username, track_id, time.time())
+        )
+    elif action == "remove":
+        conn.execute("DELETE FROM wishlist WHERE username = ? AND track_id = ?", (username, track_id))
+    return load_wishlist(username)
+
+def bulk_update_wishlist(username: str, add: List[int], remove: List[int]) -> List[int]:
+    """
+    Applies many adds and removes in one transaction. Removes win over adds of the same id.
+    """
+    conn = get_connection()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT INTO wishlist (username, track_id, added_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (username, track_id) DO NOTHING",
+            # Keep the caller's order among the newly added ids
+            [(username, track_id, now + i * 1e-6) for i, track_id in enumerate(dict.fromkeys(add))]
+        )
+        conn.executemany(
+            "DELETE FROM wishlist WHERE username = ? AND track_id = ?",
+            [(username, track_id) for track_id in set(remove)]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return load_wishlist(username)
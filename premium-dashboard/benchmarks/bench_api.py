@@ -0,0 +1,272 @@
+"""
+HTTP load test of the dashboard API, scripted like the real client: log in, then load
+/api/tracks, /api/wishlist and /api/tracks/shapes and toggle a wishlist entry, per virtual user.
+
+    MP_DB_PATH=/tmp/bench.db python -m benchmarks.bench_api --concurrency 1,8,32 --iterations 20
+    python -m benchmarks.bench_api --url http://localhost:8000 --concurrency 16 --compare benchmarks/api_baseline.json
+
+Run from premium-dashboard/. Without --url the app runs in-process over httpx's ASGI transport
+(lifespan included, so the warm-up finishes before timing starts); point MP_DB_PATH at a scratch
+database there, the toggles write to it. Toggled ids are ones the user had not saved, and are
+removed again, so the wishlist ends where it started.
+
+Results go to --output as JSON (per concurrency level and step: throughput, latency percentiles,
+bytes, status codes); --compare prints the change against an earlier run.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+STEPS = ['tracks', 'wishlist', 'shapes', 'toggle']
+PERCENTILES = [50, 90, 95, 99]
+ACCEPT_ENCODING = 'br, gzip'
+READY_TIMEOUT_SECONDS = 300
+
+def percentile(samples: list, p: float) -> float:
+    # Nearest rank on sorted samples
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, math.ceil(p / 100 * len(samples)) - 1))
+    return samples[rank]
+
+class StepStats:
+    def __init__(self):
+        self.latencies = []
+        self.bytes = 0
+        self.statuses = {}
+        self.errors = 0
+
+    def record(self, seconds: float, status: int, size: int):
+        self.latencies.append(seconds)
+        self.bytes += size
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if status >= 400:
+            self.errors += 1
+
+    def summary(self, wall_seconds: float) -> dict:
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        return {
+            'requests': count,
+            'errors': self.errors,
+            'statuses': self.statuses,
+            'rps': round(count / wall_seconds, 2) if wall_seconds else None,
+            'mean_ms': round(sum(latencies) / count * 1000, 2) if count else None,
+            **{f"p{p}_ms": round(percentile(latencies, p) * 1000, 2) for p in PERCENTILES},
+            'max_ms': round(latencies[-1] * 1000, 2) if count else None,
+            'bytes_per_request': round(self.bytes / count) if count else None,
+        }
+
+class VirtualUser:
+    """
+    One dashboard session. Bodies are read raw (still compressed) so the client side
+    costs no decompression and bytes are what went over the wire.
+    """
+    def __init__(self, client: httpx.AsyncClient, stats: dict, revalidate: bool):
+        self.client = client
+        self.stats = stats
+        self.revalidate = revalidate
+        self.etags = {}
+        self.headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        self.toggle_ids = []
+
+    async def request(self, step: str, method: str, path: str, record: bool = True, headers=None, **kwargs):
+        headers = {**self.headers, **(headers or {})}
+        if self.revalidate and (step, path) in self.etags:
+            headers['If-None-Match'] = self.etags[(step, path)]
+        start = time.perf_counter()
+        try:
+            async with self.client.stream(method, path, headers=headers, **kwargs) as response:
+                body = b''.join([chunk async for chunk in response.aiter_raw()])
+            status = response.status_code
+        except httpx.HTTPError as e:
+            print(f"WARNING: {step} {path} failed: {e}")
+            body, status, response = b'', 599, None
+        if record:
+            self.stats[step].record(time.perf_counter() - start, status, len(body))
+        if response is not None and response.headers.get('etag'):
+            self.etags[(step, path)] = response.headers['etag']
+        return status, body, response
+
+    async def login(self, username: str, password: str):
+        status, body, _ = await self.request('login', 'POST', '/api/auth/login',
+                                             data={'username': username, 'password': password})
+        if status != 200:
+            raise SystemExit(f"ERROR: Login as {username} failed ({status})")
+        self.headers['Authorization'] = f"Bearer {json.loads(body)['access_token']}"
+
+    async def pick_toggle_ids(self, rng: random.Random):
+        _, body, response = await self.request('tracks', 'GET', '/api/tracks', record=False,
+                                               headers={'Accept-Encoding': 'identity'})
+        _, saved, _ = await self.request('wishlist', 'GET', '/api/wishlist', record=False)
+        saved = set(json.loads(saved))
+        ids = [t['track_id'] for t in json.loads(body) if t['track_id'] not in saved]
+        self.toggle_ids = rng.sample(ids, min(len(ids), 50))
+        self.etags.clear()
+
+    async def iteration(self, i: int, steps: list, record: bool = True):
+        if 'tracks' in steps:
+            await self.request('tracks', 'GET', '/api/tracks', record)
+        if 'wishlist' in steps:
+            await self.request('wishlist', 'GET', '/api/wishlist', record)
+        if 'shapes' in steps:
+            await self.request('shapes', 'GET', '/api/tracks/shapes', record)
+        if 'toggle' in steps and self.toggle_ids:
+            track_id = self.toggle_ids[i % len(self.toggle_ids)]
+            for action in ('add', 'remove'):
+                await self.request('toggle', 'POST', '/api/wishlist', record, json={'track_id': track_id, 'action': action})
+
+@asynccontextmanager
+async def open_client(url: str):
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+            yield client
+        return
+    from backend.main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=120) as client:
+            yield client
+
+async def wait_until_ready(client: httpx.AsyncClient):
+    deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get('/api/ready')
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code == 404:
+                return None # Older server without a readiness endpoint
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.25)
+    raise SystemExit("ERROR: Server did not become ready")
+
+async def run_level(client, concurrency: int, args, rng: random.Random) -> dict:
+    stats = {step: StepStats() for step in ['login'] + STEPS}
+    users = [VirtualUser(client, stats, args.revalidate) for _ in range(concurrency)]
+    # Logins are measured (bcrypt dominates them) but kept out of the steady-state window
+    await asyncio.gather(*(user.login(args.username, args.password) for user in users))
+    for user in users:
+        await user.pick_toggle_ids(rng)
+        for i in range(args.warmup):
+            await user.iteration(i, args.steps, record=False)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _run_user(user, args.iterations, args.steps) for user in users
+    ))
+    wall = time.perf_counter() - start
+
+    steps = {step: stats[step].summary(wall) for step in STEPS if step in args.steps}
+    total = sum(s['requests'] for s in steps.values())
+    return {
+        'concurrency': concurrency,
+        'wall_seconds': round(wall, 3),
+        'rps': round(total / wall, 2) if wall else None,
+        'iterations_per_second': round(concurrency * args.iterations / wall, 2) if wall else None,
+        'login': stats['login'].summary(wall),
+        'steps': steps,
+    }
+
+async def _run_user(user: VirtualUser, iterations: int, steps: list):
+    for i in range(iterations):
+        await user.iteration(i, steps)
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_level(level: dict):
+    print(f"\nconcurrency {level['concurrency']}: {level['rps']} req/s, "
+          f"{level['iterations_per_second']} sessions/s over {level['wall_seconds']}s")
+    print(f"  {'step':<10}{'req':>7}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'KiB/req':>9}")
+    for name, s in [('login', level['login'])] + list(level['steps'].items()):
+        print(f"  {name:<10}{s['requests']:>7}{s['errors']:>6}{s['rps'] or 0:>9.1f}{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}"
+              f"{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms'] or 0:>9.1f}{(s['bytes_per_request'] or 0) / 1024:>9.1f}")
+
+def print_comparison(result: dict, baseline: dict):
+    print(f"\nAgainst {baseline.get('revision')} ({baseline.get('created_at')}):")
+    previous = {str(level['concurrency']): level for level in baseline.get('levels', [])}
+    for level in result['levels']:
+        old = previous.get(str(level['concurrency']))
+        if old is None:
+            continue
+        for step, s in level['steps'].items():
+            o = old['steps'].get(step)
+            if not o or not o['p95_ms'] or not o['rps']:
+                continue
+            print(f"  c={level['concurrency']:<4}{step:<10} p95 {o['p95_ms']:>8.1f} -> {s['p95_ms']:>8.1f} ms "
+                  f"({(s['p95_ms'] / o['p95_ms'] - 1) * 100:+.0f}%)   req/s {o['rps']:>8.1f} -> {s['rps']:>8.1f} "
+                  f"({(s['rps'] / o['rps'] - 1) * 100:+.0f}%)")
+
+async def main_async(args):
+    rng = random.Random(args.seed)
+    async with open_client(args.url) as client:
+        ready = await wait_until_ready(client)
+        rows = ready.get('snapshot', {}).get('rows') if ready else None
+        print(f"Target {args.url or 'in-process (ASGI)'}, {rows} tracks, steps {','.join(args.steps)}")
+        levels = []
+        for concurrency in args.concurrency:
+            level = await run_level(client, concurrency, args, rng)
+            print_level(level)
+            levels.append(level)
+
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(),
+        'target': args.url or 'asgi',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'tracks': rows,
+        'iterations': args.iterations,
+        'revalidate': args.revalidate,
+        'levels': levels,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the dashboard API with the real client flow.')
+    parser.add_argument('--url', default='', help='Base URL of a running server; in-process when omitted')
+    parser.add_argument('--concurrency', type=lambda v: [int(c) for c in v.split(',')], default=[1, 8],
+                        help='Comma-separated virtual-user counts, run one after another')
+    parser.add_argument('--iterations', type=int, default=20, help='Timed sessions per virtual user')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed sessions per virtual user')
+    parser.add_argument('--steps', type=lambda v: v.split(','), default=STEPS, help=f"Subset of {','.join(STEPS)}")
+    parser.add_argument('--revalidate', action='store_true', help='Send If-None-Match like a browser cache')
+    parser.add_argument('--username', default=os.environ.get('MP_BENCH_USER', 'jaap'))
+    parser.add_argument('--password', default=os.environ.get('MP_BENCH_PASSWORD', 'admin123'))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='benchmarks/api_baseline.json', help="Where to write the JSON results ('' to skip)")
+    parser.add_argument('--compare', default='', help='Earlier results to compare against')
+    args = parser.parse_args()
+    unknown = set(args.steps) - set(STEPS)
+    if unknown:
+        parser.error(f"Unknown steps: {', '.join(sorted(unknown))}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f) # Read first: --output may overwrite the same file
+
+    result = asyncio.run(main_async(args))
+    if baseline is not None:
+        print_comparison(result, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSUCCESS: Wrote {args.output}")
+
+if __name__ == '__main__':
+    sys.exit(main())
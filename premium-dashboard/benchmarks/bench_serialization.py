@@ -0,0 +1,102 @@
+"""
+Serialization cost of the /api/tracks body: the old per-cell path against the typed one.
+
+    python -m benchmarks.bench_serialization --rows 100000 --repeat 3
+
+Run from premium-dashboard/. --rows replicates the enriched CSV up to that many rows.
+"""
+import argparse
+import json
+import math
+import statistics
+import time
+
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from backend import payloads
+from backend.data_service import (
+    CSV_PATH, TRACK_KEY_MAP, BOOL_FLAG_KEYS, build_track_records, join_json_array, serialize_record
+)
+
+# The pre-typed path, kept here as the baseline: sanitize() per cell, then FastAPI's
+# jsonable_encoder + json.dumps, as when /api/tracks returned the list of dicts.
+def legacy_sanitize(v, key=None):
+    if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
+        return None
+    if key in BOOL_FLAG_KEYS:
+        if str(v).lower() in ['true', '1', '1.0', 'yes']: return True
+        if str(v).lower() in ['false', '0', '0.0', 'no', 'nan', 'none']: return False
+        return bool(v)
+    return v
+
+def legacy_build_track_record(record: dict) -> dict:
+    web_len = legacy_sanitize(record.get('website_track_length_m'))
+    osm_len = legacy_sanitize(record.get('track_length_m'))
+    best_len = 0
+    if isinstance(web_len, (int, float)) and web_len > 0:
+        best_len = web_len
+    elif isinstance(osm_len, (int, float)) and osm_len > 0:
+        best_len = osm_len
+    record['consolidated_track_length'] = best_len
+    return {TRACK_KEY_MAP.get(k, k): legacy_sanitize(v, TRACK_KEY_MAP.get(k, k)) for k, v in record.items()}
+
+def legacy_path(df: pd.DataFrame) -> bytes:
+    records = [legacy_build_track_record(record) for record in df.to_dict(orient='records')]
+    return json.dumps(jsonable_encoder(records), ensure_ascii=False, allow_nan=False,
+                      separators=(',', ':')).encode('utf-8')
+
+def typed_path(df: pd.DataFrame) -> bytes:
+    return join_json_array(serialize_record(record) for record in build_track_records(df))
+
+def stdlib_typed_path(df: pd.DataFrame) -> bytes:
+    saved, payloads.orjson = payloads.orjson, None
+    try:
+        return typed_path(df)
+    finally:
+        payloads.orjson = saved
+
+def load_frame(rows: int) -> pd.DataFrame:
+    df = pd.read_csv(CSV_PATH)
+    if rows and rows > len(df):
+        copies = -(-rows // len(df))
+        df = pd.concat([df] * copies, ignore_index=True).head(rows)
+        df['track_id'] = range(len(df))
+    return df
+
+def timed(fn, df, repeat):
+    samples, body = [], b''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(df)
+        samples.append(time.perf_counter() - start)
+    return samples, body
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /api/tracks serialization paths.')
+    parser.add_argument('--rows', type=int, default=0, help='Replicate the CSV up to this many rows')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = load_frame(args.rows)
+    print(f"{len(df)} rows x {len(df.columns)} columns, orjson {'available' if payloads.orjson else 'missing'}")
+
+    paths = [('legacy (sanitize + jsonable_encoder)', legacy_path), ('typed + stdlib json', stdlib_typed_path)]
+    if payloads.orjson is not None:
+        paths.append(('typed + orjson', typed_path))
+
+    baseline = None
+    reference = None
+    for name, fn in paths:
+        samples, body = timed(fn, df, args.repeat)
+        median = statistics.median(samples)
+        baseline = baseline or median
+        if reference is None:
+            reference = json.loads(body)
+        elif json.loads(body) != reference:
+            print(f"WARNING: {name} produced different JSON than the baseline")
+        print(f"{name:<40} median {median * 1000:9.1f} ms  best {min(samples) * 1000:9.1f} ms  "
+              f"{len(body) / 1024:9.0f} KiB  x{baseline / median:5.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Time and memory of the serving pipeline at synthetic scale: every stage of the track snapshot
+build, a full and an incremental reload, and the isochrone index and pre-compression.
+
+    python -m benchmarks.profile_scale --sizes 10000,100000,1000000
+    python -m benchmarks.profile_scale --sizes 100000 --tracemalloc --output /tmp/scale.json
+
+Run from premium-dashboard/. Datasets come from scripts/generate_synthetic_data.py and are cached
+in --data-dir. Each size is profiled in a fresh process, so RSS and peaks are not shared between sizes.
+Peak RSS is the process high-water mark after each stage; with --tracemalloc each stage also
+reports its own peak of Python/numpy allocations (slower, but attributable per stage).
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DASHBOARD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GENERATOR = os.path.join(DASHBOARD_DIR, '..', 'scripts', 'generate_synthetic_data.py')
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'mp-synthetic')
+CHANGED_FRACTION = 0.01 # Share of rows rewritten for the incremental reload
+
+def rss_mb() -> float:
+    from backend.monitoring import process_rss_bytes
+    return (process_rss_bytes() or 0) / 1024 / 1024
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+class StageTimer:
+    def __init__(self, trace: bool):
+        self.trace = trace
+        self.stages = []
+
+    def run(self, name: str, fn, *args):
+        if self.trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds = time.perf_counter() - start
+        stage = {'stage': name, 'seconds': round(seconds, 3), 'rss_mb': round(rss_mb(), 1), 'peak_rss_mb': round(peak_rss_mb(), 1)}
+        if self.trace:
+            stage['alloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+            tracemalloc.stop()
+        self.stages.append(stage)
+        print(f"  {name:<34}{seconds:>9.2f}s  rss {stage['rss_mb']:>8.0f} MB  peak {stage['peak_rss_mb']:>8.0f} MB"
+              + (f"  alloc {stage['alloc_peak_mb']:>8.0f} MB" if self.trace else ''), flush=True)
+        return result
+
+def profile(csv_path: str, geojson_path: str, trace: bool, compress: bool) -> dict:
+    """
+    Runs in the child process. Stages mirror build_tracks_snapshot() and TrackSnapshot.__init__.
+    """
+    timer = StageTimer(trace)
+    start_rss = rss_mb()
+    import numpy as np
+    import pandas as pd
+    timer.run('import backend', __import__, 'backend.main')
+    from backend import data_service, shapes_service
+    from backend.data_service import (
+        build_track_records, serialize_record, build_rows_payload, build_filter_frame, get_tracks_snapshot
+    )
+    from backend.spatial import TrackSpatialIndex
+    from backend.search_index import SearchIndex
+    from backend.stats import build_stats_payloads
+    from backend.hexgrid import build_hex_layers
+    from backend.columnar import build_columns_payload
+
+    data_service.CSV_PATH = csv_path
+    shapes_service.GEOJSON_PATH = geojson_path
+
+    df = timer.run('read_csv', pd.read_csv, csv_path)
+    row_hashes = timer.run('hash rows', lambda: pd.util.hash_pandas_object(df, index=False).to_numpy())
+    records = timer.run('build_track_records', build_track_records, df)
+    row_json = timer.run('serialize rows', lambda: [serialize_record(r) for r in records])
+    frame = timer.run('filter frame', build_filter_frame, records)
+    timer.run('spatial index', lambda: TrackSpatialIndex(frame['Latitude'].to_numpy(), frame['Longitude'].to_numpy()))
+    timer.run('search index', SearchIndex.build, records)
+    payload = timer.run('payload (json+gzip)', build_rows_payload, row_json, row_hashes)
+    timer.run('payload br (deferred)', payload.compress_br)
+    timer.run('stats', build_stats_payloads, frame)
+    timer.run('hex layers', build_hex_layers, frame)
+    timer.run('columns payload', build_columns_payload, frame)
+    del df, records, row_json, frame, payload
+
+    # wait=True: time the rebuild itself rather than the stale snapshot served meanwhile
+    snapshot = timer.run('get_tracks_snapshot (cold)', get_tracks_snapshot, True)
+    rows = len(snapshot.row_json)
+
+    # Rewrite the CSV with a slice of rows changed, like an enrichment script's periodic save
+    changed = pd.read_csv(csv_path)
+    picks = np.random.default_rng(0).choice(len(changed), max(1, int(len(changed) * CHANGED_FRACTION)), replace=False)
+    changed.loc[picks, 'data_quality_score'] = pd.to_numeric(changed.loc[picks, 'data_quality_score'], errors='coerce').fillna(0) + 1
+    incremental_csv = csv_path + '.incremental.csv'
+    changed.to_csv(incremental_csv, index=False)
+    del changed
+    data_service.CSV_PATH = incremental_csv
+    timer.run(f'get_tracks_snapshot ({CHANGED_FRACTION:.0%} changed)', get_tracks_snapshot, True)
+    os.remove(incremental_csv)
+
+    shapes = {}
+    if geojson_path and os.path.exists(geojson_path):
+        index = timer.run('get_shape_index', shapes_service.get_shape_index, True)
+        shapes = {'features': len(index) if index else 0, 'geojson_mb': round(os.path.getsize(geojson_path) / 1024 / 1024, 1)}
+        if compress:
+            for encoding, suffix in shapes_service.COMPRESSED_SIBLINGS:
+                if encoding == 'br' and shapes_service.brotli is None:
+                    continue
+                timer.run(f'compress shapes ({encoding})', shapes_service.compress_file, geojson_path, encoding)
+                shapes[f'{encoding}_mb'] = round(os.path.getsize(geojson_path + suffix) / 1024 / 1024, 1)
+                os.remove(geojson_path + suffix)
+
+    return {
+        'rows': rows,
+        'csv_mb': round(os.path.getsize(csv_path) / 1024 / 1024, 1),
+        'shapes': shapes,
+        'start_rss_mb': round(start_rss, 1),
+        'final_rss_mb': round(rss_mb(), 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'stages': timer.stages,
+    }
+
+def ensure_dataset(rows: int, data_dir: str, vertices: int, shapes: bool):
+    out = os.path.join(data_dir, str(rows))
+    csv_path = os.path.join(out, 'karting_enriched.csv')
+    geojson_path = os.path.join(out, 'karting_shapes.geojson')
+    if not os.path.exists(csv_path) or (shapes and not os.path.exists(geojson_path)):
+        command = [sys.executable, GENERATOR, '--rows', str(rows), '--output-dir', out, '--vertices', str(vertices)]
+        if not shapes:
+            command.append('--no-shapes')
+        start = time.perf_counter()
+        subprocess.run(command, check=True)
+        print(f"Generated {rows} rows in {time.perf_counter() - start:.1f}s")
+    return csv_path, geojson_path if shapes else ''
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile the serving pipeline on synthetic data.')
+    parser.add_argument('--sizes', type=lambda v: [int(s) for s in v.split(',')], default=[10000, 100000, 1000000])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='Where generated datasets are cached')
+    parser.add_argument('--vertices', type=int, default=300, help='Median vertices per synthetic isochrone')
+    parser.add_argument('--no-shapes', action='store_true', help='Skip the GeoJSON (1M tracks x 300 vertices is ~7 GB)')
+    parser.add_argument('--no-compress', action='store_true', help='Skip pre-compressing the shapes file')
+    parser.add_argument('--tracemalloc', action='store_true', help='Per-stage allocation peaks (slower)')
+    parser.add_argument('--output', default='', help='Write the results as JSON')
+    parser.add_argument('--child', nargs=2, metavar=('CSV', 'GEOJSON'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = profile(args.child[0], args.child[1], args.tracemalloc, not args.no_compress)
+        print('RESULT ' + json.dumps(result))
+        return
+
+    # Profile the in-process snapshot path, not the shared-memory one
+    env = {k: v for k, v in os.environ.items() if k not in ('MP_SHARED_SNAPSHOT_DIR', 'WEB_CONCURRENCY')}
+    env['MP_BROTLI_SETTLE_SECONDS'] = '3600' # Keep the deferred brotli pass out of the reload timings
+    results = []
+    for rows in args.sizes:
+        csv_path, geojson_path = ensure_dataset(rows, args.data_dir, args.vertices, not args.no_shapes)
+        print(f"\n{rows} tracks:")
+        command = [sys.executable, '-m', 'benchmarks.profile_scale', '--child', csv_path, geojson_path]
+        if args.tracemalloc:
+            command.append('--tracemalloc')
+        if args.no_compress:
+            command.append('--no-compress')
+        result = None
+        # Stage lines are echoed as they finish; the backend's own logging is dropped
+        with subprocess.Popen(command, cwd=DASHBOARD_DIR, env=env, stdout=subprocess.PIPE, text=True) as child:
+            for line in child.stdout:
+                if line.startswith('RESULT '):
+                    result = json.loads(line[7:])
+                elif line.startswith('  '):
+                    print(line, end='', flush=True)
+        if child.returncode != 0 or result is None:
+            print(f"ERROR: Profiling {rows} tracks failed (exit {child.returncode})")
+            results.append({'rows': rows, 'error': child.returncode})
+            continue
+        print(f"  peak RSS {result['peak_rss_mb']:.0f} MB, CSV {result['csv_mb']} MB, shapes {result['shapes']}")
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'results': results}, f, indent=2)
+        print(f"\nSUCCESS: Wrote {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import React, { useState, useEffect, useRef } from 'react';
+import { fetchTrackColumns } from './trackColumns';
 
 const MP_ORANGE = '#FF6600';
 
@@ -8,8 +9,8 @@ function App() {
    const [credentials, setCredentials] = useState({ username: '', password: '' });
    const [loginError, setLoginError] = useState('');
 
-   const [tracks, setTracks] = useState([]);
-   const [shapes, setShapes] = useState(null);
+   const [trackLayer, setTrackLayer] = useState(null);
+   const [shapeIndex, setShapeIndex] = useState(null);
    const [selectedTrack, setSelectedTrack] = useState(null);
    const [wishlist, setWishlist] = useState([]);
    const [activeFilters, setActiveFilters] = useState({ indoor: true, outdoor: true, sim: true });
@@ -18,6 +19,7 @@ function App() {
    const [maxLength, setMaxLength] = useState(0);
    const [maxReach, setMaxReach] = useState(0);
    const [showWishlist, setShowWishlist] = useState(false);
+   const [pinnedTracks, setPinnedTracks] = useState([]);
    const [filters, setFilters] = useState({
       search: '',
       minPPS: 0,
@@ -29,7 +31,10 @@ function App() {
    const mapContainer = useRef(null);
    const map = useRef(null);
    const isochroneLayer = useRef(null);
-   const markers = useRef([]);
+   const markers = useRef(new Map());
+   const shownMarkers = useRef(new Set());
+   const tracksEtag = useRef(null);
+   const selectedTrackId = useRef(null);
 
    useEffect(() => {
       if (token) {
@@ -92,25 +97,70 @@ function App() {
       window.location.reload(); // Simplest way to clear map/state
    };
 
-   const fetchData = async () => {
-      setIsLoading(true);
+   // Marker layer as typed arrays; remembers the snapshot's ETag so the change stream can send only deltas
+   const loadTrackLayer = async (headers, signal) => {
       try {
-         const headers = { 'Authorization': `Bearer ${token}` };
+         const layer = await fetchTrackColumns(headers, signal);
+         tracksEtag.current = layer.tracksEtag || null;
+         console.log(`FETCH: Loaded ${layer.count} tracks.`);
+         return layer;
+      } catch (e) {
+         if (e.status === 401) handleLogout();
+         else if (e.name !== 'AbortError') console.error("Error fetching tracks:", e);
+         return null;
+      }
+   };
 
-         // 1. Fetch Tracks (Critical)
-         let tracksData = [];
+   // Full records are only fetched for the tracks the user opens
+   const fetchTrackRecords = async (ids, signal) => {
+      const params = new URLSearchParams();
+      ids.forEach(id => params.append('ids', id));
+      const res = await fetch(`/api/tracks/records?${params}`, {
+         headers: { 'Authorization': `Bearer ${token}` },
+         signal
+      });
+      if (res.status === 401) { handleLogout(); return []; }
+      if (!res.ok) throw new Error(`Track records failed: ${res.status}`);
+      return res.json();
+   };
+
+   const openTrack = async (id) => {
+      try {
+         const [track] = await fetchTrackRecords([id]);
+         if (track) setSelectedTrack(track);
+      } catch (err) {
+         console.error("Could not load track:", id, err);
+      }
+   };
+
+   // The isochrone index may still be building on a fresh instance (503 + Retry-After): keep polling
+   const fetchShapeIndex = async (headers) => {
+      for (let attempt = 0; attempt < 30; attempt++) {
          try {
-            const tracksRes = await fetch('/api/tracks', { headers });
-            if (tracksRes.status === 401) { handleLogout(); return; }
-            if (tracksRes.ok) {
-               tracksData = await tracksRes.json();
-               console.log(`FETCH: Loaded ${tracksData.length} tracks.`);
-            } else {
-               console.error("Failed to load tracks:", tracksRes.status);
+            const shapesRes = await fetch('/api/tracks/shapes/index', { headers });
+            if (shapesRes.ok) {
+               const data = await shapesRes.json();
+               setShapeIndex({ count: data.count, ids: new Set(data.track_ids) });
+               return;
             }
+            if (shapesRes.status !== 503) break;
+            const retryAfter = parseInt(shapesRes.headers.get('Retry-After'), 10) || 10;
+            await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
          } catch (e) {
-            console.error("Error fetching tracks:", e);
+            console.warn("Could not load shape index:", e);
+            break;
          }
+      }
+      setShapeIndex({ count: 0, ids: new Set() });
+   };
+
+   const fetchData = async () => {
+      setIsLoading(true);
+      try {
+         const headers = { 'Authorization': `Bearer ${token}` };
+
+         // 1. Fetch the marker layer (Critical) - full records are loaded per opened track
+         const layer = await loadTrackLayer(headers);
 
          // 2. Fetch Wishlist (Non-critical)
          let wishData = [];
@@ -121,42 +171,28 @@ function App() {
             console.warn("Could not load wishlist:", e);
          }
 
-         // 3. Fetch Shapes (Non-critical)
-         let shapesData = { type: "FeatureCollection", features: [] };
+         // 3. Fetch Shape Index (Non-critical) - isochrones are loaded per selection
+         fetchShapeIndex(headers);
+
+         // 4. Fetch Aggregates (Non-critical) - slider bounds come from precomputed stats
+         let statsData = null;
          try {
-            const shapesRes = await fetch('/api/tracks/shapes', { headers });
-            if (shapesRes.ok) shapesData = await shapesRes.json();
+            const statsRes = await fetch('/api/stats?group=type', { headers });
+            if (statsRes.ok) statsData = await statsRes.json();
          } catch (e) {
-            console.warn("Could not load shapes:", e);
+            console.warn("Could not load stats:", e);
          }
 
-         if (!Array.isArray(tracksData) || tracksData.length === 0) {
+         if (!layer || layer.count === 0) {
             console.warn("No tracks available to show.");
-            setTracks([]);
+            setTrackLayer(null);
          } else {
-            setTracks(tracksData);
+            setTrackLayer(layer);
             setWishlist(Array.isArray(wishData) ? wishData : []);
-            setShapes(shapesData);
-
-            setMaxLength(Math.max(...tracksData.map(t => t.consolidated_track_length || 0), 1000));
-            setMaxReach(Math.max(...tracksData.map(t => t.catchment_area_size || 0), 500));
-
-            const filtered = tracksData.filter(t => {
-               const matchesType = (activeFilters.indoor && t.is_indoor) ||
-                  (activeFilters.outdoor && t.is_outdoor) ||
-                  (activeFilters.sim && t.is_sim);
-               const searchLower = filters.search.toLowerCase();
-               const matchesSearch = !filters.search ||
-                  t.Name?.toLowerCase().includes(searchLower) ||
-                  t.City?.toLowerCase().includes(searchLower);
-               const matchesMetrics = (t.disposable_income_pps >= filters.minPPS) &&
-                  (t.consolidated_track_length >= filters.minLength) &&
-                  (t.catchment_area_size >= filters.minReach);
-               return matchesType && matchesSearch && matchesMetrics;
-            });
 
-            console.log(`FETCH: ${filtered.length} tracks matched filters. Adding markers...`);
-            addMarkers(filtered);
+            setMaxLength(Math.max((statsData && statsData.overall.length.max) || 0, 1000));
+            setMaxReach(Math.max((statsData && statsData.overall.catchment.max) || 0, 500));
+            // Markers are built once the layer is set, and shown by the filter effect
          }
       } catch (err) {
          console.error("fetchData overall error:", err);
@@ -165,50 +201,165 @@ function App() {
       }
    };
 
+   // Live updates while the enrichment scripts rewrite the CSV: apply per-track deltas instead of refetching
    useEffect(() => {
-      if (tracks.length > 0) {
-         const filtered = tracks.filter(t => {
-            const matchesType = (activeFilters.indoor && t.is_indoor) ||
-               (activeFilters.outdoor && t.is_outdoor) ||
-               (activeFilters.sim && t.is_sim);
-            const searchLower = filters.search.toLowerCase();
-            const matchesSearch = !filters.search ||
-               (t.Name && t.Name.toLowerCase().includes(searchLower)) ||
-               (t.City && t.City.toLowerCase().includes(searchLower));
-            const matchesMetrics = (t.disposable_income_pps >= filters.minPPS) &&
-               (t.consolidated_track_length >= filters.minLength) &&
-               (t.catchment_area_size >= filters.minReach);
-            return matchesType && matchesSearch && matchesMetrics;
+      if (!token) return;
+      const controller = new AbortController();
+      const headers = { 'Authorization': `Bearer ${token}` };
+
+      const applyChange = async (event, data) => {
+         if (event !== 'delta' && event !== 'reset') return;
+         // Markers come from the columnar layer, which the server re-encodes once per snapshot
+         const layer = await loadTrackLayer(headers, controller.signal);
+         if (layer) setTrackLayer(layer);
+         if (event === 'reset') {
+            // Too far behind for a delta; reload the open record once
+            if (selectedTrackId.current !== null) {
+               const [track] = await fetchTrackRecords([selectedTrackId.current], controller.signal);
+               setSelectedTrack(track || null);
+            }
+            return;
+         }
+         const upserts = new Map(data.upserts.map(t => [t.track_id, t]));
+         const removed = new Set(data.removed);
+         setSelectedTrack(prev => {
+            if (!prev) return prev;
+            if (removed.has(prev.track_id)) return null;
+            return upserts.get(prev.track_id) || prev;
          });
-         console.log(`FILTER EFFECT: ${filtered.length} tracks matched. Refreshing markers...`);
-         addMarkers(filtered);
-      }
-   }, [activeFilters, filters, tracks]);
+         console.log(`LIVE: ${data.upserts.length} tracks updated, ${data.removed.length} removed.`);
+      };
 
-   const addMarkers = (data) => {
-      if (!map.current) {
-         console.warn("addMarkers called but map.current is null");
-         return;
+      const listen = async () => {
+         while (!controller.signal.aborted) {
+            try {
+               if (tracksEtag.current) {
+                  const res = await fetch(`/api/tracks/changes?since=${encodeURIComponent(tracksEtag.current)}`, {
+                     headers, signal: controller.signal
+                  });
+                  if (res.status === 401) { handleLogout(); return; }
+                  if (res.ok) {
+                     const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+                     let buffer = '';
+                     while (true) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        buffer += value;
+                        let end;
+                        while ((end = buffer.indexOf('\n\n')) >= 0) {
+                           const block = buffer.slice(0, end);
+                           buffer = buffer.slice(end + 2);
+                           let event = 'message';
+                           let data = '';
+                           block.split('\n').forEach(line => {
+                              if (line.startsWith('event:')) event = line.slice(6).trim();
+                              else if (line.startsWith('data:')) data += line.slice(5).trim();
+                           });
+                           if (data) await applyChange(event, JSON.parse(data));
+                        }
+                     }
+                  }
+               }
+            } catch (err) {
+               if (err.name === 'AbortError') return;
+               console.warn("Change stream interrupted:", err);
+            }
+            // Reconnect after a pause; the ETag lets the server replay what was missed
+            await new Promise(resolve => setTimeout(resolve, 5000));
+         }
+      };
+      listen();
+      return () => controller.abort();
+   }, [token]);
+
+   // Filtering runs server-side; follow cursors until every matching id is in
+   const queryTrackIds = async (signal) => {
+      const headers = { 'Authorization': `Bearer ${token}` };
+      const params = new URLSearchParams({
+         indoor: activeFilters.indoor,
+         outdoor: activeFilters.outdoor,
+         sim: activeFilters.sim,
+         search: filters.search,
+         min_pps: filters.minPPS,
+         min_length: filters.minLength,
+         min_reach: filters.minReach,
+         limit: 5000,
+         ids_only: true
+      });
+
+      let ids = [];
+      while (true) {
+         const res = await fetch(`/api/tracks/query?${params}`, { headers, signal });
+         if (res.status === 401) { handleLogout(); return null; }
+         if (res.status === 409) {
+            // Data was refreshed mid-pagination: start over on the new snapshot
+            ids = [];
+            params.delete('cursor');
+            continue;
+         }
+         if (!res.ok) throw new Error(`Track query failed: ${res.status}`);
+         const page = await res.json();
+         ids = ids.concat(page.ids);
+         if (!page.next_cursor) return ids;
+         params.set('cursor', page.next_cursor);
       }
+   };
 
+   // One marker per track, built once per snapshot from the columnar arrays; filters only show or hide them
+   useEffect(() => {
+      if (!map.current || !trackLayer) return;
       markers.current.forEach(m => m.remove());
-      markers.current = [];
+      markers.current = buildMarkers(trackLayer);
+      shownMarkers.current = new Set();
+   }, [trackLayer]);
 
-      let addedCount = 0;
-      data.forEach(track => {
-         if (!track.Latitude || !track.Longitude) return;
+   useEffect(() => {
+      if (!trackLayer) return;
 
-         const isMultiTrack = track.is_indoor && track.is_outdoor;
-         const isTrackSim = (track.is_indoor || track.is_outdoor) && track.is_sim;
+      const controller = new AbortController();
+      // Debounce keystrokes and slider drags into a single query
+      const timer = setTimeout(async () => {
+         try {
+            const ids = await queryTrackIds(controller.signal);
+            if (!ids) return;
+            console.log(`FILTER EFFECT: ${ids.length} tracks matched. Refreshing markers...`);
+            showMarkers(ids);
+         } catch (err) {
+            if (err.status === 401) handleLogout();
+            else if (err.name !== 'AbortError') console.error("Track query error:", err);
+         }
+      }, 250);
+
+      return () => {
+         clearTimeout(timer);
+         controller.abort();
+      };
+   }, [activeFilters, filters, trackLayer]);
+
+   const buildMarkers = (layer) => {
+      const { columns, flags, count } = layer;
+      const byId = new Map();
+
+      for (let row = 0; row < count; row++) {
+         const id = columns.track_id[row];
+         const lat = columns.Latitude[row];
+         const lng = columns.Longitude[row];
+         if (!lat || !lng) continue;
+
+         const isIndoor = (columns.flags[row] & flags.is_indoor) !== 0;
+         const isOutdoor = (columns.flags[row] & flags.is_outdoor) !== 0;
+         const isSim = (columns.flags[row] & flags.is_sim) !== 0;
+         const isMultiTrack = isIndoor && isOutdoor;
+         const isTrackSim = (isIndoor || isOutdoor) && isSim;
 
          let color = '#A78BFA';
          if (isMultiTrack) color = '#FF6600';
          else if (isTrackSim) color = '#EC4899';
-         else if (track.is_indoor) color = '#00A3FF';
-         else if (track.is_outdoor) color = '#4ADE80';
+         else if (isIndoor) color = '#00A3FF';
+         else if (isOutdoor) color = '#4ADE80';
 
          try {
-            const marker = L.circleMarker([track.Latitude, track.Longitude], {
+            const marker = L.circleMarker([lat, lng], {
                radius: 6,
                fillColor: color,
                color: '#fff',
@@ -216,22 +367,44 @@ function App() {
                opacity: 1,
                fillOpacity: 0.8
             })
-               .addTo(map.current)
                .on('click', (e) => {
-                  setSelectedTrack(track);
-                  map.current.flyTo([track.Latitude, track.Longitude], 13, { duration: 1.5 });
+                  openTrack(id);
+                  map.current.flyTo([lat, lng], 13, { duration: 1.5 });
                   L.DomEvent.stopPropagation(e);
                });
-
-            markers.current.push(marker);
-            addedCount++;
+            byId.set(id, marker);
          } catch (e) {
-            console.error("Error creating marker for track:", track.Name, e);
+            console.error("Error creating marker for track:", id, e);
          }
+      }
+      console.log(`buildMarkers: Built ${byId.size} markers for this snapshot.`);
+      return byId;
+   };
+
+   // Adds and removes only the markers whose visibility changed
+   const showMarkers = (ids) => {
+      if (!map.current) {
+         console.warn("showMarkers called but map.current is null");
+         return;
+      }
+      const next = new Set();
+      ids.forEach(id => {
+         const marker = markers.current.get(id);
+         if (!marker) return;
+         next.add(id);
+         if (!shownMarkers.current.has(id)) marker.addTo(map.current);
+      });
+      shownMarkers.current.forEach(id => {
+         if (!next.has(id)) markers.current.get(id).remove();
       });
-      console.log(`addMarkers: Successfully placed ${addedCount} markers.`);
+      shownMarkers.current = next;
+      console.log(`showMarkers: ${next.size} markers visible.`);
    };
 
+   useEffect(() => {
+      selectedTrackId.current = selectedTrack ? selectedTrack.track_id : null;
+   }, [selectedTrack]);
+
    // Update Isochrone Layer on Selection
    useEffect(() => {
       if (!map.current || !selectedTrack) return;
@@ -243,13 +416,26 @@ function App() {
          isochroneLayer.current = null;
       }
 
-      if (shapes) {
-         const feature = shapes.features.find(f => {
-            const fid = f.properties?.track_id ?? f.id;
-            return String(fid) === String(selectedTrack.track_id);
-         });
+      if (!shapeIndex) {
+         console.warn("Selected track set, but shape index still loading or null.");
+         return;
+      }
+      if (!shapeIndex.ids.has(String(selectedTrack.track_id))) {
+         console.warn("No isochrone feature found in GeoJSON matching ID:", selectedTrack.track_id);
+         return;
+      }
 
-         if (feature) {
+      const controller = new AbortController();
+      fetch(`/api/tracks/${selectedTrack.track_id}/shape`, {
+         headers: { 'Authorization': `Bearer ${token}` },
+         signal: controller.signal
+      })
+         .then(res => (res.ok ? res.json() : null))
+         .then(feature => {
+            if (!feature) {
+               console.warn("No isochrone feature found in GeoJSON matching ID:", selectedTrack.track_id);
+               return;
+            }
             console.log("Found matching isochrone for:", selectedTrack.Name);
             isochroneLayer.current = L.geoJSON(feature, {
                className: 'leaflet-isochrone-pulse',
@@ -263,7 +449,7 @@ function App() {
             }).addTo(map.current);
 
             // Critical: Ensure markers stay visible
-            markers.current.forEach(m => m.bringToFront());
+            shownMarkers.current.forEach(id => markers.current.get(id).bringToFront());
 
             // Fit map to catchment area
             try {
@@ -277,13 +463,13 @@ function App() {
             } catch (err) {
                console.error("Leaflet fitBounds error:", err);
             }
-         } else {
-            console.warn("No isochrone feature found in GeoJSON matching ID:", selectedTrack.track_id);
-         }
-      } else {
-         console.warn("Selected track set, but shapes data still loading or null.");
-      }
-   }, [selectedTrack, shapes]);
+         })
+         .catch(err => {
+            if (err.name !== 'AbortError') console.error("Isochrone fetch failed:", err);
+         });
+
+      return () => controller.abort();
+   }, [selectedTrack, shapeIndex]);
 
    const METRIC_INFO = {
       wealth: {
@@ -383,8 +569,25 @@ function App() {
       }
    };
 
+   // Pinned track records come from the server in wishlist order - no scan over every track
+   useEffect(() => {
+      if (!showWishlist || !token) return;
+
+      const controller = new AbortController();
+      fetch('/api/wishlist?expand=true', {
+         headers: { 'Authorization': `Bearer ${token}` },
+         signal: controller.signal
+      })
+         .then(res => (res.ok ? res.json() : []))
+         .then(data => setPinnedTracks(Array.isArray(data) ? data : []))
+         .catch(err => {
+            if (err.name !== 'AbortError') console.warn("Could not load wishlist tracks:", err);
+         });
+
+      return () => controller.abort();
+   }, [showWishlist, wishlist, token]);
+
    const copyListAsMarkdown = () => {
-      const pinnedTracks = tracks.filter(t => wishlist.includes(t.track_id));
       if (pinnedTracks.length === 0) return;
 
       let markdown = "# My Karting Wishlist\n\n";
@@ -688,13 +891,13 @@ function App() {
                   <div className="flex items-center justify-between mb-2">
                      <span className="text-xs">Catchment Coverage</span>
                      <span className="text-xs text-mp-orange font-bold">
-                        {shapes ? `${Math.round((shapes.features.length / Math.max(1, tracks.length)) * 100)}%` : 'Loading...'}
+                        {shapeIndex ? `${Math.round((shapeIndex.count / Math.max(1, trackLayer ? trackLayer.count : 0)) * 100)}%` : 'Loading...'}
                      </span>
                   </div>
                   <div className="w-full bg-white/10 h-1 rounded-full overflow-hidden">
                      <div
                         className="bg-mp-orange h-full transition-all duration-1000"
-                        style={{ width: shapes ? `${Math.min(100, Math.round((shapes.features.length / Math.max(1, tracks.length)) * 100))}%` : '0%' }}
+                        style={{ width: shapeIndex ? `${Math.min(100, Math.round((shapeIndex.count / Math.max(1, trackLayer ? trackLayer.count : 0)) * 100))}%` : '0%' }}
                      />
                   </div>
                   <p className="text-[9px] text-slate-500 mt-2 uppercase tracking-tight">Geo-Spatial Analysis complete for enriched sites</p>
@@ -840,7 +1043,7 @@ function App() {
                         <p className="text-xs font-medium uppercase tracking-widest">Your wishlist is empty</p>
                      </div>
                   ) : (
-                     tracks.filter(t => wishlist.includes(t.track_id)).map(track => (
+                     pinnedTracks.map(track => (
                         <div
                            key={track.track_id}
                            onClick={() => selectTrackFromWishlist(track)}
@@ -0,0 +1,49 @@
+// Decoder for /api/tracks/columns (layout documented in backend/columnar.py)
+const MAGIC = 'MPC1';
+
+const ARRAY_TYPES = {
+   int32: Int32Array,
+   uint8: Uint8Array,
+   uint16: Uint16Array,
+   uint32: Uint32Array,
+   float32: Float32Array,
+   float64: Float64Array
+};
+
+// Typed-array views over the response buffer (no per-row objects), plus id -> row lookup
+export const decodeTrackColumns = (buffer) => {
+   const bytes = new Uint8Array(buffer);
+   if (String.fromCharCode(bytes[0], bytes[1], bytes[2], bytes[3]) !== MAGIC) {
+      throw new Error('Not a track columns payload');
+   }
+   const headerLength = new DataView(buffer).getUint32(4, true);
+   const header = JSON.parse(new TextDecoder().decode(bytes.subarray(8, 8 + headerLength)));
+   const base = 8 + headerLength;
+
+   const columns = {};
+   const dictionaries = {};
+   header.columns.forEach(column => {
+      const ArrayType = ARRAY_TYPES[column.type];
+      if (!ArrayType) throw new Error(`Unsupported column type: ${column.type}`);
+      columns[column.name] = new ArrayType(buffer, base + column.offset, column.length);
+      if (column.dictionary) dictionaries[column.name] = column.dictionary;
+   });
+
+   const rowById = new Map();
+   columns.track_id.forEach((id, row) => rowById.set(id, row));
+
+   return { count: header.count, flags: header.flags, columns, dictionaries, rowById };
+};
+
+export const fetchTrackColumns = async (headers, signal) => {
+   const res = await fetch('/api/tracks/columns', { headers, signal });
+   if (!res.ok) {
+      const err = new Error(`Track columns failed: ${res.status}`);
+      err.status = res.status;
+      throw err;
+   }
+   const layer = decodeTrackColumns(await res.arrayBuffer());
+   // ETag of the /api/tracks snapshot these columns were built from; the change stream resumes from it
+   layer.tracksEtag = res.headers.get('X-Tracks-ETag');
+   return layer;
+};
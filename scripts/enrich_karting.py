@@ -12,6 +12,7 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 if SCRIPT_DIR not in sys.path:
     sys.path.append(SCRIPT_DIR)
 from validate_karting import is_valid_karting
+from run_ledger import RunLedger
 
 # Settings
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -229,26 +230,32 @@ async def main():
         to_process = df[df['priority'] < 3].sort_values('priority').head(args.batch)
         
         print(f"Processing {len(to_process)} priority locations (Target: {args.batch})...")
+        ledger = RunLedger("enrich_karting", total=len(to_process), stage="google_maps")
 
         processed_count = 0
-        for index, row in to_process.iterrows():
+        for attempted, (index, row) in enumerate(to_process.iterrows(), start=1):
             res = await get_google_maps_data(page, row['Name'], row['City'], row['Country'], row['Latitude'], row['Longitude'])
             if res:
                 for k, v in res.items():
                     df.at[index, k] = v
                 processed_count += 1
+                ledger.progress(attempted, message=str(res.get('Name', row['Name'])))
                 if processed_count % 5 == 0:
                     safe_save(df.drop(columns=['priority']), OUTPUT_FILE)
             else:
                 df.at[index, 'Review Velocity (12m)'] = "FAILED"
+                ledger.progress(attempted)
+                ledger.error(f"No Maps result for {row['Name']}")
                 safe_save(df.drop(columns=['priority']), OUTPUT_FILE)
             
             await asyncio.sleep(2)
             
         await browser.close()
     
+    ledger.progress(stage="saving")
     safe_save(df.drop(columns=['priority']), OUTPUT_FILE)
     print(f"Enrichment complete. Results saved to {OUTPUT_FILE}")
+    ledger.finish("completed", message=f"{processed_count} locations enriched")
 
 if __name__ == "__main__":
     asyncio.run(main())
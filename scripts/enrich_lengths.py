@@ -8,6 +8,7 @@ import os
 import argparse
 import time
 import sys
+from run_ledger import RunLedger
 
 # Settings
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -102,11 +103,12 @@ async def main():
         to_process = df[mask].head(args.batch)
 
     print(f"Processing {len(to_process)} locations...")
+    ledger = RunLedger("enrich_lengths", total=len(to_process), stage="track_lengths")
 
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
         
-        for index, row in to_process.iterrows():
+        for attempted, (index, row) in enumerate(to_process.iterrows(), start=1):
             print(f"Processing: {row['Name']}")
             
             # 1. OSM
@@ -128,7 +130,9 @@ async def main():
                         df.at[index, 'website_track_length_m'] = web_len
                     else:
                         df.at[index, 'website_track_length_m'] = -1
+                        ledger.error(f"No length found on {url}"[:200])
             
+            ledger.progress(attempted, message=str(row['Name']))
             if (index + 1) % 5 == 0:
                 safe_save(df, OUTPUT_FILE)
             
@@ -136,8 +140,10 @@ async def main():
 
         await browser.close()
 
+    ledger.progress(stage="saving")
     safe_save(df, OUTPUT_FILE)
     print("Done.")
+    ledger.finish("completed")
 
 if __name__ == "__main__":
     ox.settings.use_cache = True
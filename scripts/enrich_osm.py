@@ -5,6 +5,7 @@ import time
 import os
 
 import geopandas as gpd
+from run_ledger import RunLedger
 
 # Settings
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -109,11 +110,13 @@ def main():
         to_process = to_process.head(TEST_LIMIT)
         
     print(f"Processing {len(to_process)} locations...")
+    ledger = RunLedger("enrich_osm", total=len(to_process), stage="osm_footprints")
 
     processed_count = 0
     for index, row in to_process.iterrows():
         lat, lon = row['Latitude'], row['Longitude']
         if pd.isna(lat) or pd.isna(lon):
+            ledger.error(f"No coordinates for {row['Name']}")
             continue
             
         print(f"[{processed_count + 1}/{len(to_process)}] Processing: {row['Name']}...")
@@ -123,6 +126,7 @@ def main():
         df.at[index, 'b2b_density'] = osm_res['b2b_density']
         
         processed_count += 1
+        ledger.progress(processed_count + ledger.errors, message=str(row['Name']))
         
         if processed_count % 10 == 0:
             df.to_csv(OUTPUT_FILE, index=False)
@@ -131,6 +135,7 @@ def main():
 
     df.to_csv(OUTPUT_FILE, index=False)
     print(f"\nFinished batch of {processed_count}. Results saved to {OUTPUT_FILE}")
+    ledger.finish("completed", message=f"{processed_count} locations processed")
 
 if __name__ == "__main__":
     # Configure osmnx to use cache to speed up repeated queries
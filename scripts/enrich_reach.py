@@ -7,6 +7,7 @@ import os
 import json
 import time
 import asyncio
+from run_ledger import RunLedger
 
 # Settings
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
@@ -34,6 +35,9 @@ def get_isochrone(client, lat, lon, range_min=30):
         )
         return iso
     except Exception as e:
+        # Quota errors must reach the caller so the run pauses instead of burning through the list
+        if "OverQueryLimit" in str(e) or "429" in str(e):
+            raise
         print(f"Error fetching isochrone for {lat}, {lon}: {e}")
         return None
 
@@ -119,8 +123,12 @@ async def main():
     # Filter for rows that need processing
     to_process = df[(df['catchment_area_size'] == "N/A") | (df['catchment_area_size'].isna()) | (df['catchment_area_size'] == 0)]
     print(f"Total locations needing enrichment: {len(to_process)}")
+    pending = int((~to_process['track_id'].astype(int).isin(processed_ids)).sum())
+    ledger = RunLedger("enrich_reach", total=pending, stage="isochrones")
+    ledger.progress(quota_state="ok")
 
     success_count = 0
+    attempted = 0
     batch_results = {} # track_id -> area
     quota_reached = False
     
@@ -131,6 +139,7 @@ async def main():
             
         lat, lon = row['Latitude'], row['Longitude']
         print(f"[{success_count+1}] Fetching isochrone for: {row['Name']} (ID: {track_id})...")
+        attempted += 1
         
         try:
             iso_res = get_isochrone(client, lat, lon)
@@ -144,6 +153,7 @@ async def main():
                 area = calculate_area_km2(iso_res)
                 batch_results[track_id] = area
                 success_count += 1
+                ledger.progress(attempted, message=f"{row['Name']}: {area} km2")
                 
                 # Save progress every 10
                 if success_count % 10 == 0:
@@ -154,21 +164,29 @@ async def main():
                 time.sleep(4) 
             else:
                 print(f"Failed to fetch isochrone for ID: {track_id}")
+                ledger.progress(attempted)
+                ledger.error(f"No isochrone for ID {track_id}")
         except Exception as e:
             if "OverQueryLimit" in str(e) or "429" in str(e):
                 print("\n!!! DAILY QUOTA REACHED !!!")
                 quota_reached = True
+                ledger.progress(attempted, quota_state="exhausted", message=str(e)[:200])
                 break
             else:
                 print(f"Unexpected error at ID {track_id}: {e}")
+                ledger.progress(attempted)
+                ledger.error(f"ID {track_id}: {e}"[:200])
 
     # Final Save
+    ledger.progress(stage="saving")
     safe_save(batch_results, OUTPUT_FILE, all_features, GEOJSON_FILE)
         
     if quota_reached:
         print("\nProcess paused. You can resume tomorrow.")
+        ledger.finish("paused", message="ORS daily quota reached")
     else:
         print(f"\nFinished batch. Total processed: {success_count}")
+        ledger.finish("completed", message=f"{success_count} isochrones added")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+# Settings
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+SOURCE_FILE = os.path.join(DATA_DIR, "karting_enriched.csv")
+OUTPUT_DIR = os.path.join(DATA_DIR, "synthetic")
+
+CHUNK_ROWS = 50000
+COORD_JITTER_DEG = 0.25 # ~25 km: new tracks stay in the same region as the row they were drawn from
+METRIC_NOISE = 0.15 # Log-normal sigma applied to enrichment metrics
+FLOAT_METRICS = ['catchment_area_size', 'disposable_income_pps', 'building_sqm', 'b2b_density']
+INT_METRICS = ['track_length_m', 'website_track_length_m']
+ISOCHRONE_SECONDS = 1800.0 # enrich_reach.py fetches 30-minute drive-time isochrones
+
+def slug(text: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+def perturb_metric(values: pd.Series, rng, integer: bool) -> pd.Series:
+    """
+    Multiplies parseable, non-zero values by log-normal noise. Empty cells, "N/A", "FAILED" and
+    zeros ("not enriched yet") are kept verbatim, so the source's missing-data patterns survive.
+    """
+    numbers = pd.to_numeric(values, errors='coerce')
+    scale = np.exp(rng.normal(0, METRIC_NOISE, len(values)))
+    noisy = numbers * scale
+    mask = numbers.notna() & (numbers != 0)
+    formatted = noisy.round(0).astype('Int64').astype(str) if integer else noisy.round(2).astype(str)
+    return values.where(~mask, formatted)
+
+class NameMaker:
+    """
+    Names in the source's style: "<leading word> <city> <trailing words>", with both word pools
+    taken from the real track names.
+    """
+    def __init__(self, names: pd.Series):
+        words = [name.split() for name in names if isinstance(name, str) and len(name.split()) >= 2]
+        self.heads = np.array(sorted({w[0] for w in words}))
+        self.tails = np.array(sorted({' '.join(w[-2:]) if len(w) > 2 else w[-1] for w in words}))
+
+    def make(self, cities: np.ndarray, rng) -> list:
+        heads = self.heads[rng.integers(0, len(self.heads), len(cities))]
+        tails = self.tails[rng.integers(0, len(self.tails), len(cities))]
+        with_city = rng.random(len(cities)) < 0.5
+        return [f"{h} {c} {t}" if w else f"{h} {t}" for h, c, t, w in zip(heads, cities, tails, with_city)]
+
+def synthesize_chunk(source: pd.DataFrame, names: NameMaker, start_id: int, rows: int, rng) -> pd.DataFrame:
+    """
+    Bootstrap-resamples source rows (keeping each row's correlated location, flags, text and
+    gaps together), then gives every row a new identity, position and perturbed metrics.
+    """
+    chunk = source.iloc[rng.integers(0, len(source), rows)].reset_index(drop=True)
+    chunk['track_id'] = np.arange(start_id, start_id + rows).astype(str)
+
+    lats = pd.to_numeric(chunk['Latitude'], errors='coerce').to_numpy()
+    lons = pd.to_numeric(chunk['Longitude'], errors='coerce').to_numpy()
+    lats = np.clip(lats + rng.normal(0, COORD_JITTER_DEG, rows), -85, 85)
+    lons = (lons + rng.normal(0, COORD_JITTER_DEG, rows) / np.cos(np.radians(lats)) + 180) % 360 - 180
+    chunk['Latitude'] = np.round(lats, 7).astype(str)
+    chunk['Longitude'] = np.round(lons, 7).astype(str)
+
+    chunk['Name'] = names.make(chunk['City'].to_numpy(), rng)
+    slugs = [slug(name) for name in chunk['Name']]
+    for column in ('Website', 'Official Website'):
+        present = chunk[column] != ''
+        chunk[column] = np.where(present, [f"https://www.{s}.example/" for s in slugs], '')
+    present = chunk['Maps URL'] != ''
+    chunk['Maps URL'] = np.where(present, [
+        f"https://www.google.com/maps/place/{name.replace(' ', '+')}/@{lat},{lon},17z"
+        for name, lat, lon in zip(chunk['Name'], chunk['Latitude'], chunk['Longitude'])
+    ], '')
+
+    for column in FLOAT_METRICS + INT_METRICS:
+        if column in chunk.columns:
+            chunk[column] = perturb_metric(chunk[column], rng, integer=column in INT_METRICS)
+    return chunk
+
+def ring_coordinates(lat: float, lon: float, radius_km: float, vertices: int, rng) -> np.ndarray:
+    """
+    A closed, star-shaped ring around the track: drive-time isochrones are lobed along roads,
+    so the radius wobbles with a few random harmonics plus per-vertex noise.
+    """
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    radius = np.ones(vertices)
+    for harmonic in rng.integers(2, 9, 3):
+        radius += rng.uniform(0.05, 0.25) * np.sin(harmonic * angles + rng.uniform(0, 2 * np.pi))
+    radius *= np.exp(rng.normal(0, 0.04, vertices))
+    radius = np.clip(radius, 0.2, None) * radius_km
+    dlat = radius / 110.574 * np.sin(angles)
+    dlon = radius / (111.320 * max(np.cos(np.radians(lat)), 0.05)) * np.cos(angles)
+    ring = np.column_stack([lon + dlon, lat + dlat])
+    return np.vstack([ring, ring[:1]])
+
+def write_feature(f, track_id: int, lat: float, lon: float, area_km2: float, vertices: int, rng, first: bool):
+    # Equal-area circle radius, so the polygon roughly matches the row's catchment_area_size
+    radius_km = max(np.sqrt(area_km2 / np.pi), 1.0)
+    ring = ring_coordinates(lat, lon, radius_km, vertices, rng)
+    coordinates = ','.join(f"[{x:.6f},{y:.6f}]" for x, y in ring)
+    properties = json.dumps({"group_index": 0, "value": ISOCHRONE_SECONDS, "center": [lon, lat], "track_id": track_id})
+    f.write(('' if first else ',\n') + '{"type":"Feature","properties":' + properties +
+            ',"geometry":{"type":"Polygon","coordinates":[[' + coordinates + ']]}}')
+
+def generate(rows: int, output_dir: str, vertices: int, shapes: bool, seed: int, source_file: str = SOURCE_FILE):
+    rng = np.random.default_rng(seed)
+    # Everything as text: empty cells, "N/A" and "FAILED" are written back exactly as read
+    source = pd.read_csv(source_file, dtype=str, keep_default_na=False)
+    names = NameMaker(source['Name'])
+    os.makedirs(output_dir, exist_ok=True)
+    csv_path = os.path.join(output_dir, "karting_enriched.csv")
+    geojson_path = os.path.join(output_dir, "karting_shapes.geojson")
+
+    start = time.perf_counter()
+    features = 0
+    geojson = open(geojson_path, 'w') if shapes else None
+    try:
+        if geojson is not None:
+            geojson.write('{"type":"FeatureCollection","features":[\n')
+        for offset in range(0, rows, CHUNK_ROWS):
+            chunk = synthesize_chunk(source, names, offset, min(CHUNK_ROWS, rows - offset), rng)
+            chunk.to_csv(csv_path, index=False, header=offset == 0, mode='w' if offset == 0 else 'a')
+            if geojson is None:
+                continue
+            # Only tracks enrich_reach.py managed to reach have a catchment (and a polygon)
+            areas = pd.to_numeric(chunk['catchment_area_size'], errors='coerce').fillna(0).to_numpy()
+            counts = np.clip(rng.lognormal(np.log(vertices), 0.5, len(chunk)), 16, vertices * 8).astype(int)
+            for track_id, lat, lon, area, count in zip(chunk['track_id'].astype(int), chunk['Latitude'].astype(float),
+                                                        chunk['Longitude'].astype(float), areas, counts):
+                if area > 0:
+                    write_feature(geojson, int(track_id), lat, lon, area, int(count), rng, first=features == 0)
+                    features += 1
+            print(f"Generated {offset + len(chunk)}/{rows} rows, {features} isochrones...")
+        if geojson is not None:
+            geojson.write('\n]}\n')
+    finally:
+        if geojson is not None:
+            geojson.close()
+
+    print(f"SUCCESS: Wrote {rows} rows to {csv_path} ({os.path.getsize(csv_path) / 1024 / 1024:.1f} MB)"
+          + (f" and {features} isochrones to {geojson_path} ({os.path.getsize(geojson_path) / 1024 / 1024:.1f} MB)" if shapes else "")
+          + f" in {time.perf_counter() - start:.1f}s")
+    return csv_path, geojson_path if shapes else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic karting_enriched.csv / karting_shapes.geojson at any size.")
+    parser.add_argument("--rows", type=int, required=True)
+    parser.add_argument("--output-dir", default=None, help=f"Default: {OUTPUT_DIR}/<rows>")
+    parser.add_argument("--vertices", type=int, default=300, help="Median vertices per isochrone ring")
+    parser.add_argument("--no-shapes", action="store_true", help="Only write the CSV")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--source", default=SOURCE_FILE, help="Enriched CSV to resample")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or os.path.join(OUTPUT_DIR, str(args.rows))
+    if os.path.abspath(output_dir) == os.path.abspath(DATA_DIR):
+        parser.error("Refusing to overwrite the real data files; pick another --output-dir")
+    generate(args.rows, output_dir, args.vertices, not args.no_shapes, args.seed, args.source)
+
+if __name__ == "__main__":
+    main()
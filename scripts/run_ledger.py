@@ -0,0 +1,140 @@
+import atexit
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+# Settings
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+DATA_DIR = os.path.join(PROJECT_ROOT, "data")
+LEDGER_PATH = os.environ.get("MP_LEDGER_PATH", os.path.join(DATA_DIR, "pipeline_runs.db"))
+
+# Read by premium-dashboard/backend/pipeline_status.py; keep the two in sync.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    script TEXT NOT NULL,
+    host TEXT,
+    pid INTEGER,
+    stage TEXT,
+    status TEXT NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    errors INTEGER NOT NULL DEFAULT 0,
+    quota_state TEXT,
+    message TEXT,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS runs_updated ON runs (updated_at);
+CREATE TABLE IF NOT EXISTS progress (
+    run_id TEXT NOT NULL,
+    at REAL NOT NULL,
+    stage TEXT,
+    processed INTEGER NOT NULL,
+    total INTEGER,
+    errors INTEGER NOT NULL,
+    quota_state TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS progress_run_at ON progress (run_id, at);
+"""
+
+class RunLedger:
+    """
+    Structured progress for one pipeline script run, written to a shared SQLite ledger
+    that the dashboard serves at /api/pipeline/status.
+
+        ledger = RunLedger("enrich_reach", total=len(to_process))
+        ledger.progress(processed, message=f"Fetched {name}")
+        ledger.error(f"ORS failed for {track_id}")
+        ledger.finish("completed")
+
+    Ledger failures are printed and ignored; they must never stop an enrichment run.
+    """
+    def __init__(self, script: str, total=None, stage: str = "starting", path: str = LEDGER_PATH):
+        self.script = script
+        self.path = path
+        self.run_id = f"{script}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.stage = stage
+        self.total = total
+        self.processed = 0
+        self.errors = 0
+        self.quota_state = None
+        self.conn = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Rollback journal, not WAL: the file is shared through the Docker bind mount,
+            # where WAL's shared-memory index is not reliable across the VM boundary.
+            self.conn = sqlite3.connect(path, timeout=10.0, isolation_level=None)
+            self.conn.execute("PRAGMA busy_timeout=10000")
+            self.conn.executescript(SCHEMA)
+            now = time.time()
+            self.conn.execute(
+                "INSERT INTO runs (run_id, script, host, pid, stage, status, total, started_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'running', ?, ?, ?)",
+                (self.run_id, script, socket.gethostname(), os.getpid(), stage, total, now, now)
+            )
+            self._record(None)
+        except sqlite3.Error as e:
+            print(f"Run ledger unavailable ({path}): {e}")
+            self.conn = None
+        # Crashes and Ctrl+C still close the run; a killed process shows up as stale instead
+        atexit.register(self._finish_on_exit)
+
+    def _finish_on_exit(self):
+        if self.conn is not None:
+            self.finish("failed", message="Exited before the run finished")
+
+    def _record(self, message, status="running", finished=False):
+        if self.conn is None:
+            return
+        now = time.time()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(
+                "UPDATE runs SET stage = ?, status = ?, processed = ?, total = ?, errors = ?, quota_state = ?, "
+                "message = COALESCE(?, message), updated_at = ?, finished_at = ? WHERE run_id = ?",
+                (self.stage, status, self.processed, self.total, self.errors, self.quota_state,
+                 message, now, now if finished else None, self.run_id)
+            )
+            self.conn.execute(
+                "INSERT INTO progress (run_id, at, stage, processed, total, errors, quota_state, message) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.run_id, now, self.stage, self.processed, self.total, self.errors, self.quota_state, message)
+            )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            try:
+                self.conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            print(f"Run ledger write failed: {e}")
+
+    def progress(self, processed=None, total=None, stage=None, quota_state=None, message=None):
+        if processed is not None:
+            self.processed = processed
+        if total is not None:
+            self.total = total
+        if stage is not None:
+            self.stage = stage
+        if quota_state is not None:
+            self.quota_state = quota_state
+        self._record(message)
+
+    def error(self, message=None):
+        self.errors += 1
+        self._record(message)
+
+    def finish(self, status="completed", message=None):
+        """
+        status: 'completed', 'paused' (e.g. quota reached, resumable) or 'failed'.
+        """
+        self.stage = "done" if status == "completed" else self.stage
+        self._record(message, status=status, finished=True)
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None